@@ -0,0 +1,371 @@
+# batch.py
+
+# Processamento em lote de perguntas, sem a interface do Streamlit.
+# Recebe um dataset e um arquivo JSONL de perguntas (ex: o questionário padrão
+# aplicado a cada nova extração) e responde às perguntas em paralelo. O dataset,
+# o perfil e a amostra são carregados uma vez e compartilhados; cada pergunta tem
+# o seu próprio `ContextoExecucao` (variáveis, versões do `df` e gráficos
+# isolados). As chamadas ao LLM respeitam o limite de chamadas simultâneas de cada
+# provedor (llm_limits.py), e as demais perguntas executam código enquanto
+# esperam, então a vazão acompanha o número de chamadas permitidas ao LLM.
+#
+# Uso:
+#   python batch.py dados.csv perguntas.jsonl --saida resultados.jsonl
+#   python batch.py dados.csv perguntas.jsonl --provedor Groq --modelo llama3-70b-8192 --limite Groq=4
+#
+# Cada linha do JSONL de perguntas é um objeto com "pergunta" e, opcionalmente,
+# "id", "provedor" e "modelo" (para comparar modelos no mesmo lote). Cada linha do
+# JSONL de resultados traz a resposta, os passos, os gráficos gravados e os tempos.
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+PROVEDOR_PADRAO = "LLM de Teste (Gemini)"
+# Limite de chamadas simultâneas para provedores sem limite definido (EDA_LLM_LIMITES ou --limite)
+LIMITE_PADRAO = int(os.getenv("EDA_LOTE_LIMITE_PADRAO", "4"))
+# Perguntas em andamento por chamada simultânea permitida ao LLM: as excedentes executam código
+# (ou esperam a vaga) enquanto as outras aguardam o provedor
+PERGUNTAS_POR_VAGA = 2
+_LIMITE_ITERACOES = "Agent stopped due to iteration limit"
+
+
+def prefixo_arquivo(pergunta_id) -> str:
+    """Prefixo seguro dos arquivos de gráficos de uma pergunta (o id vem do JSONL do usuário)."""
+    return re.sub(r"[^\w.-]", "_", str(pergunta_id))
+
+
+def validar_ids(perguntas: list):
+    """
+    Garante que os "id" das perguntas são únicos: eles identificam os resultados e
+    prefixam os arquivos dos gráficos (ver `prefixo_arquivo`), então dois ids que
+    geram o mesmo prefixo (ex: "a/b" e "a_b") também são rejeitados.
+
+    Raises:
+        ValueError: Se algum id (ou o prefixo de arquivo dele) se repete.
+    """
+    vistos, prefixos, repetidos = set(), {}, []
+    for pergunta in perguntas:
+        pergunta_id = pergunta["id"]
+        if pergunta_id in vistos:
+            if pergunta_id not in repetidos:
+                repetidos.append(pergunta_id)
+            continue
+        vistos.add(pergunta_id)
+        prefixo = prefixo_arquivo(pergunta_id)
+        if prefixo in prefixos:
+            raise ValueError(f"Os ids \"{prefixos[prefixo]}\" e \"{pergunta_id}\" gravariam os gráficos com o "
+                             f"mesmo nome de arquivo (\"{prefixo}\").")
+        prefixos[prefixo] = pergunta_id
+    if repetidos:
+        raise ValueError(f"Perguntas com \"id\" repetido: {', '.join(repetidos)}.")
+
+
+def ler_perguntas(caminho: str) -> list:
+    """
+    Lê o JSONL de perguntas; cada item recebe um "id" (o número da linha, se omitido).
+
+    Raises:
+        ValueError: Se falta a pergunta em alguma linha ou algum id se repete.
+    """
+    perguntas = []
+    with open(caminho, encoding="utf-8") as f:
+        for numero, linha in enumerate(f, start=1):
+            if not linha.strip():
+                continue
+            item = json.loads(linha)
+            if isinstance(item, str):
+                item = {"pergunta": item}
+            texto = item.get("pergunta") or item.get("question")
+            if not texto:
+                raise ValueError(f"Linha {numero} de {caminho}: falta o campo \"pergunta\".")
+            perguntas.append({**item, "pergunta": texto, "id": str(item.get("id", numero))})
+    validar_ids(perguntas)
+    return perguntas
+
+
+def carregar_dataset(caminho: str):
+    """
+    Carrega o dataset uma vez para todo o lote.
+
+    Arquivos CSV/Excel passam pelo cache de datasets; diretórios e arquivos Parquet são
+    lidos pelo DuckDB (como as fontes do servidor na interface).
+
+    Returns:
+        Uma tupla (DataFrame, hash do dataset, RelatorioIngestao, fonte_servidor, total_linhas_fonte).
+    """
+    from dataset_cache import obter_cache_datasets
+    from ingestion import EXTENSOES_SUPORTADAS
+    from tools.sql_engine import carregar_fonte_servidor
+
+    if os.path.isfile(caminho) and os.path.splitext(caminho)[1].lower() in EXTENSOES_SUPORTADAS:
+        df, dataset_hash, relatorio = obter_cache_datasets().carregar(caminho)
+        return df, dataset_hash, relatorio, None, None
+    df, dataset_hash, relatorio, total = carregar_fonte_servidor(caminho)
+    return df, dataset_hash, relatorio, os.path.abspath(caminho), total
+
+
+class ProcessadorLote:
+    """
+    Responde a uma lista de perguntas sobre um dataset, em paralelo.
+
+    Args:
+        df: O dataset (compartilhado, somente leitura, entre as perguntas).
+        dataset_hash: Hash do dataset (perfil, amostra e caches são reaproveitados por ele).
+        provedor: Provedor padrão do LLM (cada pergunta pode indicar outro).
+        modelo: Modelo padrão.
+        chave: Chave de API do provedor padrão. Se omitida, vem da variável de ambiente do provedor.
+        paralelo: Número máximo de perguntas em andamento. Se omitido, é `PERGUNTAS_POR_VAGA`
+            vezes a soma dos limites dos provedores usados.
+        dir_graficos: Onde gravar os gráficos (PNG) de cada pergunta; sem ele, não são gravados.
+        fonte_servidor: Fonte Parquet/CSV lida pelo DuckDB, quando o `df` vem de uma.
+        total_linhas_fonte: Total de linhas da fonte, quando o `df` é uma amostra.
+    """
+
+    def __init__(self, df, dataset_hash: str, provedor: str = PROVEDOR_PADRAO, modelo: str = "", chave: str = None,
+                 paralelo: int = None, dir_graficos: str = None, fonte_servidor: str = None,
+                 total_linhas_fonte: int = None):
+        self.df = df
+        self.dataset_hash = dataset_hash
+        self.provedor = provedor
+        self.modelo = modelo
+        self.chave = chave
+        self.paralelo = paralelo
+        self.dir_graficos = dir_graficos
+        self.fonte_servidor = fonte_servidor
+        self.total_linhas_fonte = total_linhas_fonte
+
+    def _chave_de(self, provedor: str) -> str:
+        if provedor == self.provedor and self.chave:
+            return self.chave
+        from llm_gateway import chave_ambiente
+
+        return chave_ambiente(provedor)
+
+    def _modelo_de(self, pergunta: dict) -> tuple:
+        provedor = pergunta.get("provedor") or self.provedor
+        modelo = pergunta.get("modelo") or (self.modelo if provedor == self.provedor else "")
+        if provedor == PROVEDOR_PADRAO:
+            modelo = modelo or os.getenv("TEST_GEMINI_MODEL_NAME", "")
+        return provedor, modelo
+
+    def _gravar_graficos(self, pergunta_id: str, contexto) -> list:
+        if not self.dir_graficos:
+            return []
+        os.makedirs(self.dir_graficos, exist_ok=True)
+        caminhos = []
+        for nome in contexto.graficos.nomes():
+            caminho = os.path.join(self.dir_graficos, f"{prefixo_arquivo(pergunta_id)}_{nome}")
+            with open(caminho, "wb") as f:
+                f.write(contexto.graficos.obter(nome))
+            caminhos.append(caminho)
+        return caminhos
+
+    def responder(self, pergunta: dict) -> dict:
+        """Responde a uma pergunta em um contexto de execução próprio e retorna o resultado."""
+        from telemetry import TelemetriaTurno
+        from tools.execution_context import ContextoExecucao
+        from workflow import criar_fluxo_agente
+
+        provedor, modelo = self._modelo_de(pergunta)
+        resultado = {"id": pergunta["id"], "pergunta": pergunta["pergunta"], "provedor": provedor, "modelo": modelo}
+        contexto = ContextoExecucao(self.df, dataset_hash=self.dataset_hash, fonte_servidor=self.fonte_servidor,
+                                    total_linhas_fonte=self.total_linhas_fonte)
+        telemetria = TelemetriaTurno(contexto, provedor, modelo, pergunta["pergunta"]).iniciar()
+        status = "ok"
+        try:
+            agente = criar_fluxo_agente(self.df, provedor, self._chave_de(provedor), modelo, self.dataset_hash, contexto)
+            if isinstance(agente, str):
+                raise RuntimeError(agente)
+            # A saída detalhada do agente se misturaria entre as perguntas
+            agente.verbose = False
+            saida = agente.invoke(
+                {"input": pergunta["pergunta"], "chat_history": "", "modo_analise": ""},
+                config={"callbacks": [telemetria]},
+            )
+            resposta = saida.get("output", "")
+            if _LIMITE_ITERACOES in resposta:
+                status = "limite_iteracoes"
+            resultado["resposta"] = resposta
+            resultado["passos"] = [
+                {"ferramenta": acao.tool, "entrada": acao.tool_input, "observacao": str(observacao)}
+                for acao, observacao in saida.get("intermediate_steps", [])
+            ]
+            resultado["graficos"] = self._gravar_graficos(pergunta["id"], contexto)
+        except Exception as e:
+            status = "erro"
+            resultado["erro"] = f"{type(e).__name__}: {e}"
+        finally:
+            registro = telemetria.finalizar(status)
+            if contexto.sandbox is not None:
+                contexto.sandbox.descartar(contexto.id)
+        resultado["status"] = status
+        resultado["tempos"] = {"total_s": registro["duracao_s"], **registro["totais"]}
+        resultado["trace_id"] = registro["trace_id"]
+        return resultado
+
+    def executar(self, perguntas: list, ao_concluir=None) -> list:
+        """
+        Responde a todas as perguntas em paralelo.
+
+        Args:
+            perguntas: Itens com "id" e "pergunta" (ver `ler_perguntas`).
+            ao_concluir: Função chamada com cada resultado assim que ele fica pronto
+                (na ordem em que terminam), ex: para gravá-lo.
+
+        Returns:
+            Os resultados, na ordem das perguntas.
+
+        Raises:
+            ValueError: Se algum id se repete (ver `validar_ids`).
+        """
+        from llm_limits import definir_limite, limite_provedor
+
+        validar_ids(perguntas)
+        provedores = {self._modelo_de(pergunta)[0] for pergunta in perguntas}
+        for provedor in provedores:
+            if limite_provedor(provedor) is None:
+                definir_limite(provedor, LIMITE_PADRAO)
+        paralelo = self.paralelo or PERGUNTAS_POR_VAGA * sum(limite_provedor(p) for p in provedores)
+        inicio = time.perf_counter()
+        resultados = [None] * len(perguntas)
+        with ThreadPoolExecutor(max_workers=max(1, min(paralelo, len(perguntas) or 1)),
+                                thread_name_prefix="lote") as executor:
+            futuros = {executor.submit(self._responder_medindo_fila, pergunta, inicio): posicao
+                       for posicao, pergunta in enumerate(perguntas)}
+            for futuro in as_completed(futuros):
+                resultado = futuro.result()
+                resultados[futuros[futuro]] = resultado
+                if ao_concluir is not None:
+                    ao_concluir(resultado)
+        return resultados
+
+    def _responder_medindo_fila(self, pergunta: dict, inicio_lote: float) -> dict:
+        espera_fila = time.perf_counter() - inicio_lote
+        resultado = self.responder(pergunta)
+        resultado["tempos"]["espera_fila_s"] = espera_fila
+        return resultado
+
+
+def resumir(resultados: list, duracao_s: float) -> dict:
+    """Vazão, latência e contagens do lote."""
+    latencias = sorted(r["tempos"]["total_s"] for r in resultados)
+    status = {}
+    for resultado in resultados:
+        status[resultado["status"]] = status.get(resultado["status"], 0) + 1
+    return {
+        "perguntas": len(resultados),
+        "duracao_s": duracao_s,
+        "perguntas_por_minuto": 60 * len(resultados) / duracao_s if duracao_s > 0 else None,
+        "status": status,
+        "latencia_mediana_s": statistics.median(latencias) if latencias else None,
+        "latencia_p95_s": latencias[min(len(latencias) - 1, int(round(0.95 * (len(latencias) - 1))))] if latencias else None,
+        "chamadas_llm": sum(r["tempos"]["chamadas_llm"] for r in resultados),
+        "espera_limite_s": sum(r["tempos"]["espera_limite_s"] for r in resultados),
+        "tokens": sum(r["tempos"]["tokens_prompt"] + r["tempos"]["tokens_resposta"] for r in resultados),
+    }
+
+
+def executar_lote(caminho_dataset: str, perguntas, caminho_saida: str, provedor: str = PROVEDOR_PADRAO,
+                  modelo: str = "", chave: str = None, limites: dict = None, paralelo: int = None,
+                  dir_graficos: str = None) -> dict:
+    """
+    Responde às perguntas sobre o dataset e grava um resultado por linha em `caminho_saida` (JSONL).
+
+    Args:
+        caminho_dataset: Arquivo CSV/Excel, ou arquivo/diretório Parquet/CSV lido pelo DuckDB.
+        perguntas: Caminho do JSONL de perguntas ou a lista de itens (ver `ler_perguntas`).
+        caminho_saida: JSONL de resultados; cada linha é gravada assim que a pergunta termina.
+        limites: Chamadas simultâneas por provedor, ex: {"Groq": 2}. Provedores sem limite
+            (aqui ou em EDA_LLM_LIMITES) recebem `LIMITE_PADRAO`.
+        dir_graficos: Onde gravar os gráficos. Padrão: "<caminho_saida sem extensão>_graficos".
+
+    Returns:
+        O resumo do lote (ver `resumir`).
+    """
+    from llm_limits import definir_limite
+
+    if isinstance(perguntas, str):
+        perguntas = ler_perguntas(perguntas)
+    # Antes de carregar o dataset, para não falhar só depois da ingestão
+    validar_ids(perguntas)
+    for nome, maximo in (limites or {}).items():
+        definir_limite(nome, maximo)
+    if dir_graficos is None:
+        dir_graficos = os.path.splitext(caminho_saida)[0] + "_graficos"
+
+    inicio = time.perf_counter()
+    df, dataset_hash, relatorio, fonte_servidor, total_linhas = carregar_dataset(caminho_dataset)
+    print(relatorio.resumo(), file=sys.stderr)
+    processador = ProcessadorLote(df, dataset_hash, provedor, modelo, chave, paralelo, dir_graficos,
+                                  fonte_servidor, total_linhas)
+
+    diretorio_saida = os.path.dirname(caminho_saida)
+    if diretorio_saida:
+        os.makedirs(diretorio_saida, exist_ok=True)
+    lock_saida = threading.Lock()
+    concluidas = [0]
+    with open(caminho_saida, "w", encoding="utf-8") as saida:
+        def gravar(resultado):
+            with lock_saida:
+                saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                saida.flush()
+                concluidas[0] += 1
+                print(f"[{concluidas[0]}/{len(perguntas)}] {resultado['id']}: {resultado['status']} "
+                      f"({resultado['tempos']['total_s']:.1f}s)", file=sys.stderr)
+
+        resultados = processador.executar(perguntas, ao_concluir=gravar)
+    return resumir(resultados, time.perf_counter() - inicio)
+
+
+def _ler_limites(itens: list) -> dict:
+    limites = {}
+    for item in itens or []:
+        provedor, _, maximo = item.rpartition("=")
+        if not provedor or not maximo.isdigit():
+            raise argparse.ArgumentTypeError(f"Limite inválido: {item!r} (use PROVEDOR=N, ex: Groq=4).")
+        limites[provedor] = int(maximo)
+    return limites
+
+
+def main(argv=None) -> int:
+    from tools.versioning import ativar_copia_na_escrita
+
+    load_dotenv()
+    ativar_copia_na_escrita()
+    parser = argparse.ArgumentParser(description="Responde em lote a perguntas sobre um dataset, sem a interface.")
+    parser.add_argument("dataset", help="Arquivo CSV/Excel, ou arquivo/diretório Parquet/CSV (lido pelo DuckDB).")
+    parser.add_argument("perguntas", help="JSONL com uma pergunta por linha ({\"id\": ..., \"pergunta\": ...}).")
+    parser.add_argument("--saida", default="resultados.jsonl", help="JSONL de resultados (padrão: resultados.jsonl).")
+    parser.add_argument("--provedor", default=PROVEDOR_PADRAO,
+                        help="Provedor padrão: 'LLM de Teste (Gemini)', Gemini, OpenAI, Groq ou Anthropic.")
+    parser.add_argument("--modelo", default="", help="Modelo padrão do provedor.")
+    parser.add_argument("--chave", default=None,
+                        help="Chave de API do provedor padrão (padrão: a variável de ambiente do provedor).")
+    parser.add_argument("--limite", action="append", metavar="PROVEDOR=N",
+                        help=f"Chamadas simultâneas ao provedor (repetível; padrão: {LIMITE_PADRAO}).")
+    parser.add_argument("--paralelo", type=int, default=None,
+                        help=f"Perguntas em andamento (padrão: {PERGUNTAS_POR_VAGA}x a soma dos limites).")
+    parser.add_argument("--dir-graficos", default=None, help="Onde gravar os gráficos (padrão: <saida>_graficos).")
+    args = parser.parse_args(argv)
+
+    try:
+        limites = _ler_limites(args.limite)
+        validar_ids(ler_perguntas(args.perguntas))
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    resumo = executar_lote(args.dataset, args.perguntas, args.saida, args.provedor, args.modelo, args.chave,
+                           limites, args.paralelo, args.dir_graficos)
+    print(json.dumps(resumo, ensure_ascii=False, indent=2))
+    return 0 if resumo["status"].get("erro", 0) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
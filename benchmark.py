@@ -0,0 +1,505 @@
+# benchmark.py
+
+# Benchmark offline do agente, sem chave de API nem rede.
+# Um modelo de chat falso (`LLMRoteirizado`) reproduz roteiros ReAct fixos, de
+# modo que o tempo medido é só o da aplicação: ingestão, montagem do agente,
+# execução de cada ferramenta, gráficos e a latência de ponta a ponta de cada
+# turno. Os datasets são sintéticos, no formato do dataset de fraudes de cartão
+# (V1..V28, Time, Amount, Class), de 10 mil a 10 milhões de linhas. Cada tamanho
+# roda em um processo separado, com caches em um diretório temporário, para que
+# o pico de memória e os tempos "frios" não se misturem entre os tamanhos.
+#
+# Uso:
+#   python benchmark.py                                  # 10k, 100k e 1M linhas
+#   python benchmark.py --linhas 10000 10000000 --repeticoes 5
+#   python benchmark.py --saida atual.json --baseline base.json --tolerancia 0.2
+#
+# A saída é um JSON; com --baseline, as métricas são comparadas e o processo
+# termina com código 1 se alguma piorou além da tolerância. Só bloqueiam as
+# medianas e mínimos das repetições e a memória; os tempos de uma única medição
+# (frios, ingestão, montagem) são informados, mas variam demais para reprovar.
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+TAMANHOS_PADRAO = (10_000, 100_000, 1_000_000)
+TAMANHOS_COMPLETOS = (10_000, 100_000, 1_000_000, 10_000_000)
+DIRETORIO_DADOS_PADRAO = os.path.join(".cache", "benchmark")
+FORMATO_RESULTADO = 1
+# Diferenças absolutas abaixo destes pisos são tratadas como ruído na comparação
+# (para tempos, o piso também cresce com a dispersão das repetições)
+PISO_SEGUNDOS = 0.02
+PISO_MB = 5.0
+_LINHAS_POR_BLOCO = 1_000_000
+
+
+# --- Datasets sintéticos ---
+
+def gerar_dataset_fraude(linhas: int, caminho: str, semente: int = 0, taxa_fraude: float = 0.0017):
+    """
+    Grava em `caminho` um CSV sintético no formato do dataset de fraudes de cartão.
+
+    As fraudes têm médias deslocadas em algumas componentes (V4, V11, V14, V17) e
+    valores (Amount) com outra distribuição, para que as análises tenham o que mostrar.
+    O arquivo é gerado em blocos, então 10 milhões de linhas não precisam caber na memória.
+    """
+    rng = np.random.default_rng(semente)
+    deslocamentos = {4: 2.5, 11: 2.0, 14: -4.0, 17: -3.0}
+    gravadas = 0
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        while gravadas < linhas:
+            n = min(_LINHAS_POR_BLOCO, linhas - gravadas)
+            classe = (rng.random(n) < taxa_fraude).astype("int8")
+            bloco = {}
+            for i in range(1, 29):
+                valores = rng.standard_normal(n, dtype="float32")
+                if i in deslocamentos:
+                    valores += deslocamentos[i] * classe
+                bloco[f"V{i}"] = valores
+            bloco["Time"] = np.sort(rng.integers(0, 172_800, n)) + 0.0
+            bloco["Amount"] = np.round(np.where(classe == 1, rng.exponential(120, n), rng.lognormal(3.0, 1.2, n)), 2)
+            bloco["Class"] = classe
+            pd.DataFrame(bloco).to_csv(arquivo, header=gravadas == 0, index=False, float_format="%.6g")
+            gravadas += n
+
+
+def obter_dataset(linhas: int, diretorio: str, semente: int = 0) -> str:
+    """Caminho do CSV sintético com `linhas` linhas, gerado apenas na primeira vez."""
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f"fraude_{linhas}_{semente}.csv")
+    if not os.path.exists(caminho):
+        temporario = caminho + ".tmp"
+        gerar_dataset_fraude(linhas, temporario, semente)
+        os.replace(temporario, caminho)
+    return caminho
+
+
+# --- Modelo de chat roteirizado ---
+
+def _criar_classe_llm():
+    """Cria a classe do modelo falso (importa o LangChain só no processo que executa o benchmark)."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class LLMRoteirizado(BaseChatModel):
+        """
+        Modelo de chat determinístico que reproduz roteiros ReAct.
+
+        O roteiro é escolhido pela pergunta (a última linha "Question:" do prompt) e o
+        passo, pelo número de observações que já estão no scratchpad. Não guarda estado,
+        então pode ser compartilhado entre turnos e threads.
+        """
+
+        roteiros: dict
+        latencia_s: float = 0.0
+
+        @property
+        def _llm_type(self) -> str:
+            return "roteirizado"
+
+        def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+            prompt = "\n".join(str(m.content) for m in messages)
+            trecho = prompt.rsplit("\nQuestion: ", 1)[-1]
+            pergunta = trecho.split("\n", 1)[0].strip()
+            respostas = self.roteiros.get(pergunta, [])
+            passo = trecho.count("\nObservation:")
+            if passo < len(respostas):
+                texto = respostas[passo]
+            else:
+                texto = "Thought: Agora eu sei a resposta final.\nFinal Answer: Fim do roteiro."
+            if self.latencia_s:
+                time.sleep(self.latencia_s)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+    return LLMRoteirizado
+
+
+def _roteiro(acoes: list, resposta: str) -> list:
+    """Respostas do LLM para uma sequência de ações (ferramenta, entrada) seguida da resposta final."""
+    respostas = [
+        f"Thought: Passo {i + 1} da análise.\nAction: {ferramenta}\nAction Input: {entrada}"
+        for i, (ferramenta, entrada) in enumerate(acoes)
+    ]
+    respostas.append(f"Thought: Agora eu sei a resposta final.\nFinal Answer: {resposta}")
+    return respostas
+
+
+# Cenários de perguntas típicas; `graficos` marca os que medem a renderização de gráficos
+CENARIOS = [
+    {
+        "nome": "contagem_classes",
+        "pergunta": "Quantas transações são fraudes?",
+        "acoes": [("python_code_executor", "print(df['Class'].value_counts())")],
+        "resposta": "A contagem de fraudes está na saída acima.",
+    },
+    {
+        "nome": "estatisticas_por_classe",
+        "pergunta": "Compare o valor das transações entre fraudes e normais.",
+        "acoes": [("python_code_executor", "print(df.groupby('Class', observed=True)['Amount'].describe())")],
+        "resposta": "As fraudes têm valores com outra distribuição.",
+    },
+    {
+        "nome": "correlacoes",
+        "pergunta": "Quais variáveis mais se correlacionam com a fraude?",
+        "acoes": [
+            ("consultar_perfil_dataset", "correlacoes"),
+            ("python_code_executor", "print(df.corrwith(df['Class'].astype('float64')).abs().sort_values().tail(5))"),
+        ],
+        "resposta": "V14, V17, V4 e V11 são as mais correlacionadas.",
+    },
+    {
+        "nome": "histograma",
+        "pergunta": "Mostre a distribuição dos valores das transações.",
+        "acoes": [("python_code_executor", "histograma(df['Amount'], log=True)\nplt.savefig('distribuicao_amount.png')")],
+        "resposta": "Distribuição dos valores. [CHART_PATH:distribuicao_amount.png]",
+        "graficos": True,
+    },
+    {
+        "nome": "dispersao",
+        "pergunta": "Mostre a relação entre V14 e V17 por classe.",
+        "acoes": [("python_code_executor", "dispersao(df, 'V14', 'V17', hue='Class')\nplt.savefig('v14_v17.png')")],
+        "resposta": "As fraudes se separam em V14 e V17. [CHART_PATH:v14_v17.png]",
+        "graficos": True,
+    },
+    {
+        "nome": "sql_agregacao",
+        "pergunta": "Qual o valor médio e total por classe?",
+        "acoes": [("consultar_sql", "SELECT Class, count(*) AS n, avg(Amount) AS media, sum(Amount) AS total "
+                                    "FROM dados GROUP BY Class ORDER BY Class")],
+        "resposta": "Os valores por classe estão na saída acima.",
+        "requer": "duckdb",
+    },
+]
+
+
+# --- Medição (processo filho, um por tamanho) ---
+
+def _memoria_pico_mb():
+    """Pico de memória residente do processo em MB, ou None se não for possível medir."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return pico / 1024 ** 2 if sys.platform == "darwin" else pico / 1024
+
+
+def _resumir(tempos: list) -> dict:
+    """Primeira medição (fria, sem caches de execução) e estatísticas das repetições."""
+    resumo = {"frio": tempos[0]}
+    repetidas = tempos[1:]
+    if repetidas:
+        ordenadas = sorted(repetidas)
+        resumo["mediana"] = statistics.median(ordenadas)
+        resumo["p95"] = ordenadas[min(len(ordenadas) - 1, int(round(0.95 * (len(ordenadas) - 1))))]
+        resumo["min"] = ordenadas[0]
+    return resumo
+
+
+def _criar_cronometro():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class CronometroFerramentas(BaseCallbackHandler):
+        """Mede o tempo de cada chamada de ferramenta do agente."""
+
+        def __init__(self):
+            self.inicios = {}
+            self.tempos = []
+
+        def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+            self.inicios[run_id] = ((serialized or {}).get("name", "ferramenta"), time.perf_counter())
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            nome, inicio = self.inicios.pop(run_id, (None, None))
+            if nome is not None:
+                self.tempos.append((nome, time.perf_counter() - inicio))
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            self.on_tool_end(None, run_id=run_id)
+
+    return CronometroFerramentas()
+
+
+def executar_tamanho(caminho_csv: str, repeticoes: int, latencia_llm_s: float) -> dict:
+    """Mede ingestão, montagem do agente e os turnos de todos os cenários para um dataset."""
+    import workflow
+    from dataset_cache import CacheDatasets, DIRETORIO_CACHE_PADRAO
+    from streaming import ExecucaoStreaming
+    from tools.execution_context import ContextoExecucao
+    from tools.sql_engine import duckdb_disponivel
+
+    resultado = {"tamanho_csv_bytes": os.path.getsize(caminho_csv), "memoria_pico_mb": {}}
+
+    # 1. Ingestão: parsing completo (fria) e leitura do cache Arrow por outro processo (mmap)
+    inicio = time.perf_counter()
+    df, dataset_hash, relatorio = CacheDatasets(DIRETORIO_CACHE_PADRAO).carregar(caminho_csv)
+    fria = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    df, _, _ = CacheDatasets(DIRETORIO_CACHE_PADRAO).carregar(caminho_csv)
+    resultado["ingestao_s"] = {"fria": fria, "cache": time.perf_counter() - inicio}
+    resultado["linhas"] = relatorio.linhas
+    resultado["memoria_pico_mb"]["ingestao"] = _memoria_pico_mb()
+
+    # 2. Montagem do agente (contexto, amostra, perfil e prompt): primeira vez e com os caches em memória
+    cenarios = [c for c in CENARIOS if c.get("requer") != "duckdb" or duckdb_disponivel()]
+    roteiros = {c["pergunta"]: _roteiro(c["acoes"], c["resposta"]) for c in cenarios}
+    llm = _criar_classe_llm()(roteiros=roteiros, latencia_s=latencia_llm_s)
+    workflow._get_llm_instance = lambda *args, **kwargs: llm
+    tempos_montagem = []
+    for _ in range(2):
+        inicio = time.perf_counter()
+        contexto = ContextoExecucao(df, dataset_hash=dataset_hash)
+        agente = workflow.criar_fluxo_agente(df, "Roteirizado", "", "roteiro", dataset_hash, contexto)
+        tempos_montagem.append(time.perf_counter() - inicio)
+    if isinstance(agente, str):
+        raise RuntimeError(agente)
+    resultado["construcao_agente_s"] = {"fria": tempos_montagem[0], "cache": tempos_montagem[1]}
+    resultado["memoria_pico_mb"]["agente"] = _memoria_pico_mb()
+
+    # 3. Turnos completos de cada cenário, como na interface (execução em streaming)
+    resultado["cenarios"] = {}
+    tempos_graficos = []
+    for cenario in cenarios:
+        tempos_turno, tempos_ferramentas = [], {}
+        for _ in range(repeticoes):
+            cronometro = _criar_cronometro()
+            entrada = {"input": cenario["pergunta"], "chat_history": "", "modo_analise": ""}
+            inicio = time.perf_counter()
+            execucao = ExecucaoStreaming(agente, entrada, contexto, callbacks=[cronometro]).iniciar()
+            for evento in execucao.eventos():
+                if evento is not None and evento[0] == "erro":
+                    raise evento[1]
+            tempos_turno.append(time.perf_counter() - inicio)
+            por_ferramenta = {}
+            for nome, tempo in cronometro.tempos:
+                por_ferramenta[nome] = por_ferramenta.get(nome, 0.0) + tempo
+            for nome, tempo in por_ferramenta.items():
+                tempos_ferramentas.setdefault(nome, []).append(tempo)
+        resultado["cenarios"][cenario["nome"]] = {
+            "turno_s": _resumir(tempos_turno),
+            "ferramentas_s": {nome: _resumir(tempos) for nome, tempos in tempos_ferramentas.items()},
+        }
+        if cenario.get("graficos"):
+            tempos_graficos.append(tempos_ferramentas.get("python_code_executor", [0.0])[0])
+    # Tempo de execução (frio) do código que gera os gráficos, somado entre os cenários de gráficos
+    resultado["graficos_s"] = sum(tempos_graficos)
+    resultado["memoria_pico_mb"]["total"] = _memoria_pico_mb()
+    if contexto.sandbox is not None:
+        contexto.sandbox.encerrar()
+    return resultado
+
+
+def _executar_filho(args):
+    """Ponto de entrada do processo filho: mede um tamanho e grava o resultado em JSON."""
+    from tools.versioning import ativar_copia_na_escrita
+    ativar_copia_na_escrita()
+    resultado = executar_tamanho(args.csv, args.repeticoes, args.latencia_llm)
+    with open(args.resultado, "w", encoding="utf-8") as f:
+        json.dump(resultado, f)
+
+
+def medir_tamanho(linhas: int, args) -> dict:
+    """Gera (se preciso) o dataset e mede o tamanho em um processo novo, com caches vazios."""
+    caminho_csv = obter_dataset(linhas, args.dir_dados, args.semente)
+    diretorio_temporario = tempfile.mkdtemp(prefix="eda_benchmark_")
+    try:
+        caminho_resultado = os.path.join(diretorio_temporario, "resultado.json")
+        ambiente = {
+            **os.environ,
+            "EDA_CACHE_DIR": os.path.join(diretorio_temporario, "datasets"),
+            "EDA_PROFILE_DIR": os.path.join(diretorio_temporario, "profiles"),
+            "EDA_SQL_TEMP_DIR": os.path.join(diretorio_temporario, "duckdb"),
+            "EDA_LLM_CACHE": "0",
+            "EDA_SANDBOX": "1" if args.sandbox else "0",
+        }
+        comando = [sys.executable, os.path.abspath(__file__), "--_filho", "--csv", caminho_csv,
+                   "--resultado", caminho_resultado, "--repeticoes", str(args.repeticoes),
+                   "--latencia-llm", str(args.latencia_llm)]
+        # A saída do agente (verbose) é descartada; erros aparecem no stderr
+        processo = subprocess.run(comando, env=ambiente, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  stdout=subprocess.DEVNULL)
+        if processo.returncode != 0:
+            raise RuntimeError(f"O benchmark de {linhas} linhas falhou (código {processo.returncode}).")
+        with open(caminho_resultado, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(diretorio_temporario, ignore_errors=True)
+
+
+# --- Resultado e comparação com a linha de base ---
+
+def _ambiente() -> dict:
+    commit = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        pass
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def _metricas(resultado: dict) -> dict:
+    """Achata as métricas comparáveis (tempos em `_s` e memória em `_mb`) em {caminho: valor}."""
+    metricas = {}
+
+    def visitar(valor, caminho, comparavel):
+        if isinstance(valor, dict):
+            for chave, filho in valor.items():
+                visitar(filho, caminho + [str(chave)], comparavel or str(chave).endswith(("_s", "_mb")))
+        elif comparavel and isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            metricas["/".join(caminho)] = float(valor)
+
+    visitar(resultado.get("resultados", {}), [], False)
+    return metricas
+
+
+def _bloqueante(caminho: str) -> bool:
+    """Métricas estáveis o bastante para reprovar: memória e mediana/mínimo das repetições."""
+    return "_mb" in caminho or caminho.endswith(("/mediana", "/min"))
+
+
+def _dispersao(metricas: dict, caminho: str) -> float:
+    """Dispersão (p95 - mínimo) das repetições da métrica, ou 0 se não houver."""
+    prefixo = caminho.rsplit("/", 1)[0]
+    p95, minimo = metricas.get(prefixo + "/p95"), metricas.get(prefixo + "/min")
+    return p95 - minimo if p95 is not None and minimo is not None else 0.0
+
+
+def comparar(atual: dict, base: dict, tolerancia: float = 0.2) -> dict:
+    """
+    Compara as métricas com as de uma execução anterior (menor é melhor em todas).
+
+    Uma métrica piorou (ou melhorou) se variou mais que `tolerancia` (fração) e mais
+    que o piso de ruído: 5 MB para memória e, para tempos, o maior entre 20 ms e a
+    dispersão das repetições nas duas execuções. Só a memória e a mediana/mínimo das
+    repetições entram em `regressoes`; as variações das medições únicas (frias,
+    ingestão, montagem) vão para `informativas` e não reprovam.
+    """
+    metricas_atuais, metricas_base = _metricas(atual), _metricas(base)
+    comparacao = {"regressoes": [], "melhorias": [], "informativas": [], "sem_base": []}
+    for caminho, valor in sorted(metricas_atuais.items()):
+        if caminho not in metricas_base:
+            comparacao["sem_base"].append(caminho)
+            continue
+        anterior = metricas_base[caminho]
+        if "_mb" in caminho:
+            piso = PISO_MB
+        else:
+            piso = max(PISO_SEGUNDOS, _dispersao(metricas_atuais, caminho), _dispersao(metricas_base, caminho))
+        if abs(valor - anterior) < piso:
+            continue
+        item = {"metrica": caminho, "base": anterior, "atual": valor,
+                "razao": valor / anterior if anterior else None}
+        if not _bloqueante(caminho):
+            if abs(valor - anterior) > anterior * tolerancia:
+                comparacao["informativas"].append(item)
+        elif valor > anterior * (1 + tolerancia):
+            comparacao["regressoes"].append(item)
+        elif valor < anterior * (1 - tolerancia):
+            comparacao["melhorias"].append(item)
+    return comparacao
+
+
+def _imprimir_resumo(resultado: dict):
+    for linhas, medidas in resultado["resultados"].items():
+        memoria = medidas["memoria_pico_mb"].get("total")
+        print(f"\n== {int(linhas):,} linhas ==".replace(",", "."))
+        print(f"ingestão: {medidas['ingestao_s']['fria']:.3f}s (cache {medidas['ingestao_s']['cache']:.3f}s) | "
+              f"agente: {medidas['construcao_agente_s']['fria']:.3f}s (cache {medidas['construcao_agente_s']['cache']:.3f}s) | "
+              f"gráficos: {medidas['graficos_s']:.3f}s | pico de memória: "
+              + (f"{memoria:.0f} MB" if memoria is not None else "n/d"))
+        for nome, cenario in medidas["cenarios"].items():
+            turno = cenario["turno_s"]
+            repetido = f", repetido {turno['mediana']:.3f}s" if "mediana" in turno else ""
+            print(f"  {nome:<26} turno {turno['frio']:.3f}s{repetido}")
+
+
+def _imprimir_comparacao(comparacao: dict):
+    for titulo, chave in (("Regressões", "regressoes"), ("Melhorias", "melhorias"),
+                          ("Variações em medições únicas (não reprovam)", "informativas")):
+        if comparacao[chave]:
+            print(f"\n{titulo} ({len(comparacao[chave])}):")
+            for item in comparacao[chave]:
+                razao = f"{item['razao']:.2f}x" if item["razao"] is not None else "n/d"
+                print(f"  {item['metrica']}: {item['base']:.4g} -> {item['atual']:.4g} ({razao})")
+    if not comparacao["regressoes"]:
+        print("\nNenhuma regressão acima da tolerância.")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline do agente de análise de dados.")
+    parser.add_argument("--linhas", type=int, nargs="+", default=None,
+                        help="Tamanhos dos datasets sintéticos (padrão: 10k, 100k e 1M).")
+    parser.add_argument("--completo", action="store_true", help="Inclui o dataset de 10 milhões de linhas.")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Turnos por cenário (o primeiro é frio).")
+    parser.add_argument("--latencia-llm", type=float, default=0.0,
+                        help="Latência simulada por chamada ao LLM, em segundos.")
+    parser.add_argument("--sandbox", action="store_true", help="Executa o código no pool de processos (EDA_SANDBOX=1).")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--dir-dados", default=DIRETORIO_DADOS_PADRAO, help="Onde os CSVs sintéticos são guardados.")
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados (padrão: só imprime).")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparação.")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="Variação relativa tolerada antes de apontar uma regressão (padrão: 0.2).")
+    # Uso interno: execução de um tamanho no processo filho
+    parser.add_argument("--_filho", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    parser.add_argument("--resultado", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args._filho:
+        _executar_filho(args)
+        return 0
+
+    tamanhos = args.linhas or (TAMANHOS_COMPLETOS if args.completo else TAMANHOS_PADRAO)
+    resultado = {
+        "formato": FORMATO_RESULTADO,
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "ambiente": _ambiente(),
+        "parametros": {"repeticoes": args.repeticoes, "latencia_llm_s": args.latencia_llm,
+                       "sandbox": args.sandbox, "semente": args.semente},
+        "resultados": {},
+    }
+    for linhas in tamanhos:
+        print(f"Medindo {linhas:,} linhas...".replace(",", "."), flush=True)
+        resultado["resultados"][str(linhas)] = medir_tamanho(linhas, args)
+    _imprimir_resumo(resultado)
+
+    codigo_saida = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        comparacao = comparar(resultado, base, args.tolerancia)
+        resultado["comparacao"] = {"baseline": args.baseline, "tolerancia": args.tolerancia, **comparacao}
+        _imprimir_comparacao(comparacao)
+        codigo_saida = 1 if comparacao["regressoes"] else 0
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados gravados em {args.saida}.")
+    return codigo_saida
+
+
+if __name__ == "__main__":
+    sys.exit(main())
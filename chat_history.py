@@ -0,0 +1,158 @@
+# chat_history.py
+
+# Histórico do chat com orçamento de tokens para o prompt do agente.
+# As últimas trocas entram na íntegra; as mais antigas são incorporadas a um
+# resumo, atualizado de forma incremental (apenas com as mensagens novas) e
+# guardado entre as perguntas. Assim o tamanho do `chat_history` no prompt fica
+# praticamente constante, por mais longa que seja a conversa.
+import os
+import threading
+
+MAX_TOKENS_PADRAO = int(os.getenv("EDA_HISTORICO_MAX_TOKENS", "1200"))
+TURNOS_RECENTES_PADRAO = int(os.getenv("EDA_HISTORICO_TURNOS_RECENTES", "2"))
+
+# Fração do orçamento reservada ao resumo das mensagens antigas
+_FRACAO_RESUMO = 0.4
+_ROTULOS = {"user": "Usuário", "assistant": "Agente"}
+
+PROMPT_RESUMO = """Você mantém o resumo de uma conversa entre um usuário e um agente de análise de dados.
+Atualize o resumo abaixo incorporando as novas mensagens. Preserve números, nomes de colunas,
+conclusões e os gráficos já gerados; descarte saudações e detalhes sem importância.
+Escreva em português, em no máximo {max_palavras} palavras, e responda apenas com o resumo.
+
+Resumo atual:
+{resumo}
+
+Novas mensagens:
+{mensagens}
+
+Resumo atualizado:"""
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa rápida de tokens (cerca de 4 caracteres por token), sem depender do tokenizador do provedor."""
+    return len(texto) // 4 + 1
+
+
+def _truncar(texto: str, max_tokens: int, manter_final: bool = False) -> str:
+    """Corta o texto para caber em `max_tokens`, mantendo o início (ou o final, o mais recente)."""
+    max_caracteres = max(max_tokens, 1) * 4
+    if len(texto) <= max_caracteres:
+        return texto
+    if manter_final:
+        return "[...] " + texto[-max_caracteres:].lstrip()
+    return texto[:max_caracteres].rstrip() + " [...]"
+
+
+def formatar_mensagens(mensagens: list) -> str:
+    """Formata mensagens {'role', 'content'} como linhas "Usuário: ..." / "Agente: ..."."""
+    return "\n".join(f"{_ROTULOS.get(m['role'], m['role'])}: {m['content']}" for m in mensagens)
+
+
+class HistoricoCompacto:
+    """
+    Monta o `chat_history` do agente dentro de um orçamento de tokens.
+
+    Args:
+        llm: Modelo usado para resumir as mensagens antigas. Sem ele (ou se a chamada
+            falhar), o resumo é extrativo: o início de cada mensagem antiga.
+        max_tokens: Orçamento de tokens do histórico no prompt.
+        turnos_recentes: Quantas trocas (pergunta e resposta) entram na íntegra.
+    """
+
+    def __init__(self, llm=None, max_tokens: int = MAX_TOKENS_PADRAO, turnos_recentes: int = TURNOS_RECENTES_PADRAO):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.turnos_recentes = turnos_recentes
+        self.resumo = ""
+        # Quantas mensagens, do início da conversa, já estão incorporadas ao resumo
+        self.mensagens_resumidas = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def _max_tokens_resumo(self) -> int:
+        return int(self.max_tokens * _FRACAO_RESUMO)
+
+    def _inicio_recentes(self, mensagens: list) -> int:
+        return max(0, len(mensagens) - 2 * self.turnos_recentes)
+
+    def montar(self, mensagens: list) -> str:
+        """
+        Retorna o histórico para o prompt: o resumo das mensagens antigas seguido
+        das trocas recentes na íntegra, tudo dentro do orçamento de tokens.
+        """
+        inicio_recentes = self._inicio_recentes(mensagens)
+        with self._lock:
+            resumo = self.resumo
+            resumidas = min(self.mensagens_resumidas, inicio_recentes)
+
+        # Mensagens antigas que o resumo ainda não cobre (ex: resumo em andamento) entram truncadas
+        pendentes = mensagens[resumidas:inicio_recentes]
+        if pendentes:
+            resumo = "\n".join(filter(None, [resumo, self._resumo_extrativo(pendentes)]))
+        resumo = _truncar(resumo, self._max_tokens_resumo, manter_final=True)
+
+        recentes = mensagens[inicio_recentes:]
+        disponivel = self.max_tokens - (estimar_tokens(resumo) if resumo else 0)
+        texto_recentes = formatar_mensagens(recentes)
+        if recentes and estimar_tokens(texto_recentes) > disponivel:
+            # Respostas longas: cada mensagem recente recebe uma parte igual do orçamento
+            por_mensagem = max(disponivel // len(recentes), 1)
+            texto_recentes = formatar_mensagens(
+                [{**m, "content": _truncar(m["content"], por_mensagem)} for m in recentes]
+            )
+
+        partes = []
+        if resumo:
+            partes.append(f"Resumo da conversa anterior:\n{resumo}")
+        if texto_recentes:
+            partes.append(texto_recentes)
+        return "\n\n".join(partes)
+
+    def atualizar_resumo(self, mensagens: list, em_segundo_plano: bool = True):
+        """
+        Incorpora ao resumo as mensagens que saíram da janela de trocas recentes.
+        Só as mensagens novas são enviadas ao LLM, junto com o resumo atual.
+        Em segundo plano, a próxima pergunta não espera pelo resumo.
+        """
+        if self._inicio_recentes(mensagens) <= self.mensagens_resumidas:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            # Um resumo já está em andamento; as mensagens restantes entram no próximo
+            return
+        mensagens = list(mensagens)
+        if em_segundo_plano:
+            self._thread = threading.Thread(target=self._resumir, args=(mensagens,), daemon=True)
+            self._thread.start()
+        else:
+            self._resumir(mensagens)
+
+    def _resumir(self, mensagens: list):
+        with self._lock:
+            resumo_atual = self.resumo
+            inicio = self.mensagens_resumidas
+        fim = self._inicio_recentes(mensagens)
+        novas = mensagens[inicio:fim]
+        novo_resumo = None
+        if self.llm is not None:
+            try:
+                max_palavras = max(self._max_tokens_resumo * 3 // 4, 20)
+                resposta = self.llm.invoke(PROMPT_RESUMO.format(
+                    max_palavras=max_palavras,
+                    resumo=resumo_atual or "(vazio)",
+                    mensagens=formatar_mensagens(novas),
+                ))
+                novo_resumo = str(resposta.content).strip()
+            except Exception as e:
+                print(f"AVISO: falha ao resumir o histórico do chat ({e}); usando resumo extrativo.")
+        if not novo_resumo:
+            novo_resumo = "\n".join(filter(None, [resumo_atual, self._resumo_extrativo(novas)]))
+        with self._lock:
+            self.resumo = _truncar(novo_resumo, self._max_tokens_resumo, manter_final=True)
+            self.mensagens_resumidas = fim
+
+    def _resumo_extrativo(self, mensagens: list) -> str:
+        """Resumo sem LLM: o início de cada mensagem."""
+        por_mensagem = max(self._max_tokens_resumo // max(len(mensagens), 1), 15)
+        return formatar_mensagens([{**m, "content": _truncar(m["content"], por_mensagem)} for m in mensagens])
@@ -0,0 +1,178 @@
+# dataset_cache.py
+
+# Cache local, endereçado por conteúdo, para os datasets enviados.
+# Cada arquivo é identificado pelo hash dos seus bytes e gravado uma única vez
+# no formato Arrow IPC (sem compressão), que é lido via memory-map. Todas as
+# sessões que enviam o mesmo arquivo compartilham o mesmo buffer somente-leitura.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from ingestion import RelatorioIngestao, carregar_arquivo, ler_conteudo
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # O cache é opcional; sem pyarrow, cada sessão faz o parsing normalmente
+    pa = None
+
+DIRETORIO_CACHE_PADRAO = os.getenv("EDA_CACHE_DIR", os.path.join(".cache", "datasets"))
+LIMITE_CACHE_MB_PADRAO = int(os.getenv("EDA_CACHE_MAX_MB", "2048"))
+# Quantos datasets ficam abertos (mapeados) ao mesmo tempo no processo
+MAX_DATASETS_ABERTOS = int(os.getenv("EDA_CACHE_MAX_ABERTOS", "8"))
+
+
+def hash_conteudo(conteudo: bytes) -> str:
+    """Calcula o hash (BLAKE2b, 128 bits) que identifica um dataset pelo seu conteúdo."""
+    return hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+
+
+class CacheDatasets:
+    """
+    Cache de datasets em disco (Arrow IPC) com limite de tamanho e despejo LRU.
+
+    Os DataFrames abertos ficam registrados por hash (também em ordem LRU), de modo
+    que N sessões com o mesmo arquivo ocupam a memória uma vez só. Como as páginas
+    vêm de um arquivo mapeado, o SO pode liberá-las sob pressão de memória.
+    """
+
+    def __init__(self, diretorio: str = DIRETORIO_CACHE_PADRAO, limite_mb: int = LIMITE_CACHE_MB_PADRAO):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_mb * 1024 ** 2
+        self._abertos = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def caminho(self, dataset_hash: str) -> str:
+        """Caminho do arquivo Arrow correspondente a um hash."""
+        return os.path.join(self.diretorio, f"{dataset_hash}.arrow")
+
+    def carregar(self, arquivo, nome_arquivo: str = None):
+        """
+        Carrega um dataset, reaproveitando o cache quando o conteúdo já é conhecido.
+
+        Returns:
+            Uma tupla (DataFrame, hash do dataset, RelatorioIngestao). O DataFrame é
+            uma cópia rasa, exclusiva do chamador, sobre o buffer compartilhado.
+        """
+        if nome_arquivo is None:
+            nome_arquivo = getattr(arquivo, "name", None) or os.fspath(arquivo)
+        conteudo = ler_conteudo(arquivo)
+        dataset_hash = hash_conteudo(conteudo)
+
+        inicio = time.perf_counter()
+        with self._lock:
+            df = self._abertos.get(dataset_hash)
+            motor = "memória compartilhada"
+            if df is None and pa is not None and os.path.exists(self.caminho(dataset_hash)):
+                df = self._ler_mmap(dataset_hash)
+                motor = "cache arrow (mmap)"
+            if df is not None:
+                self._registrar(dataset_hash, df)
+                memoria = int(df.memory_usage(deep=False).sum())
+                relatorio = RelatorioIngestao(
+                    nome_arquivo=nome_arquivo,
+                    motor=motor,
+                    linhas=len(df),
+                    colunas=df.shape[1],
+                    tempo_parse_s=time.perf_counter() - inicio,
+                    tempo_otimizacao_s=0.0,
+                    memoria_original_bytes=memoria,
+                    memoria_final_bytes=memoria,
+                )
+                return df.copy(deep=False), dataset_hash, relatorio
+
+        # Cache miss: faz o parsing completo fora do lock e grava o resultado
+        df, relatorio = carregar_arquivo(conteudo, nome_arquivo)
+        if pa is None:
+            return df, dataset_hash, relatorio
+
+        with self._lock:
+            try:
+                self._gravar(dataset_hash, df)
+                self._despejar_excedente(manter=dataset_hash)
+                df = self._ler_mmap(dataset_hash)
+            except (OSError, pa.ArrowException) as e:
+                # Falha de disco ou tipo não suportado pelo Arrow: segue com o DataFrame em memória
+                print(f"AVISO: não foi possível gravar o dataset no cache: {e}")
+            self._registrar(dataset_hash, df)
+        return df.copy(deep=False), dataset_hash, relatorio
+
+    def obter(self, dataset_hash: str):
+        """Retorna o DataFrame de um hash já conhecido, ou None se não estiver no cache."""
+        with self._lock:
+            df = self._abertos.get(dataset_hash)
+            if df is None and pa is not None and os.path.exists(self.caminho(dataset_hash)):
+                df = self._ler_mmap(dataset_hash)
+            if df is not None:
+                self._registrar(dataset_hash, df)
+        return None if df is None else df.copy(deep=False)
+
+    def _registrar(self, dataset_hash: str, df: pd.DataFrame):
+        """Marca o dataset como o mais recente e fecha os excedentes mais antigos."""
+        self._abertos[dataset_hash] = df
+        self._abertos.move_to_end(dataset_hash)
+        while len(self._abertos) > MAX_DATASETS_ABERTOS:
+            self._abertos.popitem(last=False)
+
+    def _gravar(self, dataset_hash: str, df: pd.DataFrame):
+        """Grava o DataFrame em Arrow IPC sem compressão (requisito para leitura zero-copy)."""
+        caminho = self.caminho(dataset_hash)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        feather.write_feather(tabela, temporario, compression="uncompressed")
+        # A renomeação é atômica: outro processo nunca lê um arquivo pela metade
+        os.replace(temporario, caminho)
+
+    def _ler_mmap(self, dataset_hash: str) -> pd.DataFrame:
+        """Abre o arquivo via memory-map; colunas numéricas sem nulos não são copiadas."""
+        caminho = self.caminho(dataset_hash)
+        # O mapeamento não é fechado explicitamente: os buffers da tabela o mantêm vivo
+        tabela = pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all()
+        # Atualiza o mtime, usado como "último acesso" na política LRU
+        os.utime(caminho, None)
+        return tabela.to_pandas(split_blocks=True)
+
+    def _despejar_excedente(self, manter: str = None):
+        """Remove os arquivos menos usados recentemente até o cache caber no limite."""
+        entradas = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(".arrow"):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                estado = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, nome[:-len(".arrow")], caminho))
+
+        total = sum(tamanho for _, tamanho, _, _ in entradas)
+        for _, tamanho, dataset_hash, caminho in sorted(entradas):
+            if total <= self.limite_bytes:
+                break
+            if dataset_hash == manter:
+                continue
+            # Sessões que já mapearam o arquivo continuam válidas: o SO só libera
+            # o espaço quando o último mapeamento for fechado.
+            try:
+                os.remove(caminho)
+            except OSError:
+                continue
+            total -= tamanho
+
+
+_cache_global = None
+_cache_global_lock = threading.Lock()
+
+
+def obter_cache_datasets() -> CacheDatasets:
+    """Retorna a instância do cache compartilhada por todas as sessões do processo."""
+    global _cache_global
+    with _cache_global_lock:
+        if _cache_global is None:
+            _cache_global = CacheDatasets()
+        return _cache_global
@@ -0,0 +1,158 @@
+# ingestion.py
+
+# Caminho de ingestão rápido para os arquivos enviados pelo usuário.
+# Usa parsers multithread (pyarrow para CSV, calamine para Excel) quando
+# disponíveis e reduz os tipos das colunas para diminuir a memória residente.
+import io
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+EXTENSOES_SUPORTADAS = (".csv", ".xls", ".xlsx")
+
+# Colunas de texto com até este número de valores distintos (e que repetem
+# bastante) viram 'category'. Isso cobre rótulos como 'Class' ou 'Estado'.
+MAX_VALORES_CATEGORICOS = 1000
+PROPORCAO_MAX_CATEGORICA = 0.5
+
+
+@dataclass
+class RelatorioIngestao:
+    """Métricas de uma carga: tempo de parsing e memória economizada."""
+    nome_arquivo: str
+    motor: str
+    linhas: int
+    colunas: int
+    tempo_parse_s: float
+    tempo_otimizacao_s: float
+    memoria_original_bytes: int
+    memoria_final_bytes: int
+
+    @property
+    def memoria_economizada_bytes(self) -> int:
+        return self.memoria_original_bytes - self.memoria_final_bytes
+
+    def resumo(self) -> str:
+        """Texto curto para exibir na interface."""
+        original_mb = self.memoria_original_bytes / 1024 ** 2
+        final_mb = self.memoria_final_bytes / 1024 ** 2
+        reducao = 0.0
+        if self.memoria_original_bytes:
+            reducao = 100 * self.memoria_economizada_bytes / self.memoria_original_bytes
+        return (
+            f"{self.linhas:,} linhas × {self.colunas} colunas lidas em {self.tempo_parse_s:.2f}s "
+            f"(motor `{self.motor}`). Memória: {original_mb:.1f} MB → {final_mb:.1f} MB (-{reducao:.0f}%)."
+        )
+
+
+def ler_conteudo(arquivo) -> bytes:
+    """Obtém o conteúdo bruto de um UploadedFile, arquivo aberto, caminho ou bytes."""
+    if isinstance(arquivo, (bytes, bytearray, memoryview)):
+        return bytes(arquivo)
+    if isinstance(arquivo, (str, os.PathLike)):
+        with open(arquivo, "rb") as f:
+            return f.read()
+    if hasattr(arquivo, "getvalue"):
+        return arquivo.getvalue()
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)
+    return arquivo.read()
+
+
+def _ler_csv(conteudo: bytes):
+    """Lê um CSV com o motor pyarrow (multithread), caindo para o motor C se necessário."""
+    try:
+        return pd.read_csv(io.BytesIO(conteudo), engine="pyarrow"), "pyarrow"
+    except (ImportError, ValueError) as e:
+        # O pyarrow pode não estar instalado ou não suportar alguma particularidade do arquivo
+        print(f"AVISO: leitura com pyarrow falhou ({e}); usando o motor padrão do pandas.")
+        return pd.read_csv(io.BytesIO(conteudo), low_memory=False), "c"
+
+
+def _ler_excel(conteudo: bytes):
+    """Lê uma planilha com o motor calamine (Rust), caindo para o openpyxl se necessário."""
+    try:
+        return pd.read_excel(io.BytesIO(conteudo), engine="calamine"), "calamine"
+    except (ImportError, ValueError) as e:
+        print(f"AVISO: leitura com calamine falhou ({e}); usando o motor padrão do pandas.")
+        return pd.read_excel(io.BytesIO(conteudo)), "openpyxl"
+
+
+def otimizar_tipos(df: pd.DataFrame, reduzir_floats: bool = True) -> pd.DataFrame:
+    """
+    Reduz os tipos das colunas do DataFrame para economizar memória.
+
+    - floats viram float32 (precisão de ~7 dígitos, suficiente para EDA);
+    - inteiros viram o menor tipo inteiro que comporta os valores;
+    - textos com baixa cardinalidade viram 'category'.
+    """
+    colunas_otimizadas = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_bool_dtype(serie):
+            continue
+        if pd.api.types.is_float_dtype(serie):
+            if reduzir_floats and serie.dtype != np.float32:
+                colunas_otimizadas[coluna] = serie.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(serie):
+            colunas_otimizadas[coluna] = pd.to_numeric(serie, downcast="integer")
+        elif pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            num_valores = serie.nunique(dropna=True)
+            if num_valores <= MAX_VALORES_CATEGORICOS and num_valores <= PROPORCAO_MAX_CATEGORICA * max(len(serie), 1):
+                colunas_otimizadas[coluna] = serie.astype("category")
+
+    if not colunas_otimizadas:
+        return df
+    # Cópia rasa: apenas as colunas convertidas ocupam memória nova
+    df = df.copy(deep=False)
+    for coluna, serie in colunas_otimizadas.items():
+        df[coluna] = serie
+    return df
+
+
+def carregar_arquivo(arquivo, nome_arquivo: str = None, reduzir_floats: bool = True):
+    """
+    Carrega um arquivo CSV ou Excel em um DataFrame com tipos compactos.
+
+    Args:
+        arquivo: Um UploadedFile do Streamlit, um objeto de arquivo binário, um caminho ou bytes.
+        nome_arquivo: Nome usado para detectar a extensão (padrão: `arquivo.name` ou o caminho).
+        reduzir_floats: Se True, converte colunas float64 para float32.
+
+    Returns:
+        Uma tupla (DataFrame, RelatorioIngestao).
+    """
+    if nome_arquivo is None:
+        nome_arquivo = getattr(arquivo, "name", None) or os.fspath(arquivo)
+    extensao = os.path.splitext(nome_arquivo)[1].lower()
+    if extensao not in EXTENSOES_SUPORTADAS:
+        raise ValueError(f"Formato de arquivo não suportado: '{extensao}'. Use CSV ou Excel.")
+
+    conteudo = ler_conteudo(arquivo)
+
+    inicio = time.perf_counter()
+    if extensao == ".csv":
+        df, motor = _ler_csv(conteudo)
+    else:
+        df, motor = _ler_excel(conteudo)
+    tempo_parse = time.perf_counter() - inicio
+
+    memoria_original = int(df.memory_usage(deep=True).sum())
+    inicio = time.perf_counter()
+    df = otimizar_tipos(df, reduzir_floats=reduzir_floats)
+    tempo_otimizacao = time.perf_counter() - inicio
+
+    relatorio = RelatorioIngestao(
+        nome_arquivo=nome_arquivo,
+        motor=motor,
+        linhas=len(df),
+        colunas=df.shape[1],
+        tempo_parse_s=tempo_parse,
+        tempo_otimizacao_s=tempo_otimizacao,
+        memoria_original_bytes=memoria_original,
+        memoria_final_bytes=int(df.memory_usage(deep=True).sum()),
+    )
+    return df, relatorio
@@ -0,0 +1,266 @@
+# llm_cache.py
+
+# Cache persistente (SQLite) das respostas dos LLMs, na frente de todos os provedores.
+# A chave combina provedor, modelo (e parâmetros), o prompt completo renderizado e o
+# hash do dataset. Há ainda uma camada opcional que guarda a resposta final inteira
+# (passos e gráficos incluídos) por pergunta normalizada, e a reproduz sem chamar o LLM.
+import base64
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+CAMINHO_PADRAO = os.getenv("EDA_LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+TTL_PADRAO_S = float(os.getenv("EDA_LLM_CACHE_TTL_H", "168")) * 3600
+LIMITE_PADRAO_MB = int(os.getenv("EDA_LLM_CACHE_MAX_MB", "256"))
+
+# A limpeza (TTL e tamanho) roda a cada N gravações, não em todas
+_GRAVACOES_ENTRE_LIMPEZAS = 50
+
+
+def cache_llm_habilitado() -> bool:
+    """Indica se o cache de respostas do LLM está ativo (padrão; desative com EDA_LLM_CACHE=0)."""
+    return os.getenv("EDA_LLM_CACHE", "1").lower() in ("1", "true", "sim")
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """Normaliza a pergunta: minúsculas, sem acentos, sem pontuação final e espaços simples."""
+    texto = unicodedata.normalize("NFKD", pergunta.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"\s+", " ", texto).strip()
+    return texto.rstrip(" ?!.;:")
+
+
+def _chave(*partes: str) -> str:
+    conteudo = "\0".join(partes).encode("utf-8")
+    return hashlib.blake2b(conteudo, digest_size=20).hexdigest()
+
+
+class BancoCacheLLM:
+    """
+    Arquivo SQLite com as respostas em cache, compartilhado por todas as sessões.
+
+    Guarda duas tabelas: `geracoes` (uma resposta do LLM por prompt) e `respostas`
+    (respostas finais completas por pergunta normalizada).
+    """
+
+    def __init__(self, caminho: str = CAMINHO_PADRAO, ttl_s: float = TTL_PADRAO_S, limite_mb: int = LIMITE_PADRAO_MB):
+        self.caminho = caminho
+        self.ttl_s = ttl_s
+        self.limite_bytes = limite_mb * 1024 ** 2
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._gravacoes = 0
+        self.acertos = {"geracoes": 0, "respostas": 0}
+        self.falhas = {"geracoes": 0, "respostas": 0}
+        with self._lock, self._conexao:
+            # WAL permite leituras simultâneas de vários processos do servidor
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            for tabela in ("geracoes", "respostas"):
+                self._conexao.execute(
+                    f"CREATE TABLE IF NOT EXISTS {tabela} ("
+                    "chave TEXT PRIMARY KEY, valor TEXT NOT NULL, criado REAL NOT NULL, "
+                    "acessado REAL NOT NULL, tamanho INTEGER NOT NULL)"
+                )
+                self._conexao.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_acessado ON {tabela}(acessado)")
+
+    def ler(self, tabela: str, chave: str) -> Optional[str]:
+        """Lê um valor que não expirou e atualiza o seu último acesso."""
+        agora = time.time()
+        with self._lock, self._conexao:
+            linha = self._conexao.execute(
+                f"SELECT valor, criado FROM {tabela} WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None or agora - linha[1] > self.ttl_s:
+                self.falhas[tabela] += 1
+                return None
+            self._conexao.execute(f"UPDATE {tabela} SET acessado = ? WHERE chave = ?", (agora, chave))
+            self.acertos[tabela] += 1
+            return linha[0]
+
+    def gravar(self, tabela: str, chave: str, valor: str):
+        agora = time.time()
+        with self._lock, self._conexao:
+            self._conexao.execute(
+                f"INSERT OR REPLACE INTO {tabela} (chave, valor, criado, acessado, tamanho) VALUES (?, ?, ?, ?, ?)",
+                (chave, valor, agora, agora, len(valor)),
+            )
+            self._gravacoes += 1
+            if self._gravacoes % _GRAVACOES_ENTRE_LIMPEZAS == 0:
+                self._limpar(agora)
+
+    def _limpar(self, agora: float):
+        """Remove os itens expirados e, se preciso, os menos acessados até caber no limite."""
+        for tabela in ("geracoes", "respostas"):
+            self._conexao.execute(f"DELETE FROM {tabela} WHERE criado < ?", (agora - self.ttl_s,))
+        total = sum(
+            self._conexao.execute(f"SELECT COALESCE(SUM(tamanho), 0) FROM {tabela}").fetchone()[0]
+            for tabela in ("geracoes", "respostas")
+        )
+        while total > self.limite_bytes:
+            # Remove em lotes os itens com acesso mais antigo, considerando as duas tabelas
+            candidatos = []
+            for tabela in ("geracoes", "respostas"):
+                candidatos += [
+                    (acessado, tabela, chave, tamanho)
+                    for chave, acessado, tamanho in self._conexao.execute(
+                        f"SELECT chave, acessado, tamanho FROM {tabela} ORDER BY acessado LIMIT 100"
+                    )
+                ]
+            if not candidatos:
+                break
+            for _, tabela, chave, tamanho in sorted(candidatos)[:100]:
+                self._conexao.execute(f"DELETE FROM {tabela} WHERE chave = ?", (chave,))
+                total -= tamanho
+                if total <= self.limite_bytes:
+                    break
+
+    def limpar_tudo(self):
+        with self._lock, self._conexao:
+            for tabela in ("geracoes", "respostas"):
+                self._conexao.execute(f"DELETE FROM {tabela}")
+
+    def estatisticas(self) -> dict:
+        """Acertos, falhas e taxa de acerto de cada camada do cache."""
+        with self._lock:
+            estatisticas = {}
+            for tabela in ("geracoes", "respostas"):
+                total = self.acertos[tabela] + self.falhas[tabela]
+                estatisticas[tabela] = {
+                    "acertos": self.acertos[tabela],
+                    "falhas": self.falhas[tabela],
+                    "taxa_acerto": self.acertos[tabela] / total if total else 0.0,
+                    "entradas": self._conexao.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0],
+                }
+            return estatisticas
+
+
+class CacheLLM(BaseCache):
+    """Visão do `BancoCacheLLM` restrita a um dataset, no formato de cache do LangChain."""
+
+    def __init__(self, banco: BancoCacheLLM, dataset_hash: str):
+        self.banco = banco
+        self.dataset_hash = dataset_hash or ""
+
+    # Só o texto de cada geração é guardado (o agente ReAct não usa tool calls nativas),
+    # o que evita desserializar objetos arbitrários lidos do disco.
+    def lookup(self, prompt: str, llm_string: str):
+        valor = self.banco.ler("geracoes", _chave(self.dataset_hash, llm_string, prompt))
+        if valor is None:
+            return None
+        # A marca `cache_llm` permite à telemetria contar os acertos
+        return [ChatGeneration(message=AIMessage(content=texto, response_metadata={"cache_llm": True}))
+                for texto in json.loads(valor)]
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        textos = json.dumps([geracao.text for geracao in return_val], ensure_ascii=False)
+        self.banco.gravar("geracoes", _chave(self.dataset_hash, llm_string, prompt), textos)
+
+    def clear(self, **kwargs):
+        self.banco.limpar_tudo()
+
+    # --- Camada opcional: respostas finais completas por pergunta normalizada ---
+
+    def obter_resposta(self, provedor: str, modelo: str, pergunta: str) -> Optional[dict]:
+        """
+        Retorna uma resposta completa já dada à mesma pergunta (normalizada), ou None.
+        A chave não inclui o estado da sessão: só consulte (e guarde) respostas de perguntas
+        feitas sem conversa anterior e com o escopo no estado inicial (`ContextoExecucao.estado_inicial`).
+        O dicionário tem 'output', 'passos' (tool, tool_input, log, observação) e 'graficos'
+        ({caminho: bytes}).
+        """
+        chave = _chave(self.dataset_hash, provedor, modelo, normalizar_pergunta(pergunta))
+        valor = self.banco.ler("respostas", chave)
+        if valor is None:
+            return None
+        resposta = json.loads(valor)
+        resposta["graficos"] = {c: base64.b64decode(b) for c, b in resposta["graficos"].items()}
+        return resposta
+
+    def guardar_resposta(self, provedor: str, modelo: str, pergunta: str, output: str, passos: list, graficos: dict):
+        """Guarda a resposta completa de uma pergunta, com os gráficos citados nela."""
+        chave = _chave(self.dataset_hash, provedor, modelo, normalizar_pergunta(pergunta))
+        valor = json.dumps({
+            "output": output,
+            "passos": [[acao.tool, acao.tool_input, acao.log, observacao] for acao, observacao in passos],
+            "graficos": {c: base64.b64encode(b).decode("ascii") for c, b in graficos.items()},
+        }, ensure_ascii=False)
+        self.banco.gravar("respostas", chave, valor)
+
+
+class ChatComCache(BaseChatModel):
+    """
+    Envolve um chat model de qualquer provedor e aplica o `CacheLLM` também no
+    modo streaming (o LangChain só consulta o cache em `invoke`).
+    """
+
+    modelo: Any
+    provedor: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cache-{self.modelo._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"provedor": self.provedor, **self.modelo._identifying_params}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # O cache de `invoke` é tratado pelo próprio BaseChatModel (campo `cache`)
+        return self.modelo._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        cache = self.cache if isinstance(self.cache, BaseCache) else None
+        if cache is not None:
+            prompt = dumps(messages)
+            llm_string = self._get_llm_string(stop=stop, **kwargs)
+            geracoes = cache.lookup(prompt, llm_string)
+            if geracoes:
+                # Acerto: entrega a resposta inteira como um único chunk
+                yield ChatGenerationChunk(message=AIMessageChunk(content=geracoes[0].text,
+                                                                 response_metadata={"cache_llm": True}))
+                return
+
+        texto = []
+        if type(self.modelo)._stream is BaseChatModel._stream:
+            # Modelo sem suporte a streaming: gera a resposta inteira de uma vez
+            resultado = self.modelo._generate(messages, stop=stop, **kwargs)
+            texto.append(resultado.generations[0].text)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=texto[0]))
+        else:
+            # Os tokens são repassados ao callback pelo próprio BaseChatModel.stream
+            for chunk in self.modelo._stream(messages, stop=stop, **kwargs):
+                texto.append(chunk.text)
+                yield chunk
+        if cache is not None:
+            cache.update(prompt, llm_string, [ChatGeneration(message=AIMessage(content="".join(texto)))])
+
+
+_banco_global = None
+_banco_global_lock = threading.Lock()
+
+
+def obter_banco_cache_llm() -> BancoCacheLLM:
+    """Retorna o banco de cache compartilhado pelo processo (criado sob demanda)."""
+    global _banco_global
+    with _banco_global_lock:
+        if _banco_global is None:
+            _banco_global = BancoCacheLLM()
+        return _banco_global
+
+
+def envolver_com_cache(llm: BaseChatModel, provedor: str, dataset_hash: str) -> ChatComCache:
+    """Retorna o LLM envolvido pelo cache persistente, restrito ao dataset informado."""
+    return ChatComCache(modelo=llm, provedor=provedor, cache=CacheLLM(obter_banco_cache_llm(), dataset_hash))
@@ -0,0 +1,385 @@
+# llm_gateway.py
+
+# Camada de resiliência entre o agente e os provedores de LLM.
+# - Conexões: os clientes de um mesmo provedor compartilham um pool HTTP (keep-alive),
+#   então sessões, modelos e chaves diferentes reaproveitam as conexões já abertas.
+# - Taxa: cada chave de API tem um balde de fichas (token bucket) com as requisições
+#   por minuto do provedor (EDA_LLM_RPM). Um 429 com Retry-After pausa o balde da
+#   chave inteira, não só a requisição que o recebeu.
+# - Falhas transitórias (429, 5xx, timeouts, conexão) são repetidas com espera
+#   exponencial e jitter. Os clientes dos provedores são criados sem retentativas
+#   próprias, para que só esta camada decida quando repetir.
+# - Alternativo: com EDA_LLM_FALLBACK, uma requisição que passa de EDA_LLM_HEDGE_S
+#   segundos sem responder é disparada também no provedor/modelo alternativo, e vale
+#   a primeira resposta (hedging). Se o principal esgota as tentativas, o alternativo
+#   responde no lugar dele. Isso corta a cauda (p95/p99) da latência de cada passo.
+#
+# Configuração (provedores ausentes usam os padrões):
+#   EDA_LLM_RPM="Groq=30,Gemini=15"                       requisições por minuto, por chave
+#   EDA_LLM_FALLBACK="Groq=OpenAI:gpt-4o-mini,Gemini=Gemini:gemini-1.5-flash"
+#   EDA_LLM_HEDGE_S=8                                      0 desativa o hedging (o failover continua)
+#   EDA_LLM_TENTATIVAS=4, EDA_LLM_TIMEOUT_S=60
+#   EDA_LLM_BASE_URL="OpenAI=http://127.0.0.1:8080/v1"    ex: um servidor local para testes offline
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+TENTATIVAS = int(os.getenv("EDA_LLM_TENTATIVAS", "4"))
+TIMEOUT_S = float(os.getenv("EDA_LLM_TIMEOUT_S", "60"))
+HEDGE_S = float(os.getenv("EDA_LLM_HEDGE_S", "0"))
+# Conexões mantidas abertas por provedor no pool HTTP compartilhado
+CONEXOES_POR_PROVEDOR = int(os.getenv("EDA_LLM_CONEXOES", "20"))
+ESPERA_BASE_S = 0.5
+ESPERA_MAX_S = 30.0
+
+# Variável de ambiente com a chave de API de cada provedor (usada pelo alternativo e pelo batch.py)
+VARIAVEIS_CHAVE = {
+    "Gemini": "GOOGLE_API_KEY",
+    "OpenAI": "OPENAI_API_KEY",
+    "Groq": "GROQ_API_KEY",
+    "Anthropic": "ANTHROPIC_API_KEY",
+}
+_ERROS_TRANSITORIOS = ("Timeout", "Connection", "RateLimit", "ResourceExhausted", "ServiceUnavailable",
+                       "DeadlineExceeded", "InternalServerError", "Overloaded")
+
+
+def _ler_mapa(variavel: str) -> dict:
+    """Lê uma variável no formato "Provedor=valor,Provedor=valor"."""
+    mapa = {}
+    for item in os.getenv(variavel, "").split(","):
+        provedor, _, valor = item.partition("=")
+        if provedor.strip() and valor.strip():
+            mapa[provedor.strip()] = valor.strip()
+    return mapa
+
+
+def url_base(provedor: str):
+    """URL alternativa da API do provedor (EDA_LLM_BASE_URL), ou None para a oficial."""
+    return _ler_mapa("EDA_LLM_BASE_URL").get(provedor)
+
+
+def provedor_alternativo(provedor: str):
+    """Provedor e modelo alternativos configurados para o provedor (EDA_LLM_FALLBACK), ou None."""
+    alvo = _ler_mapa("EDA_LLM_FALLBACK").get(provedor)
+    if not alvo:
+        return None
+    nome, _, modelo = alvo.partition(":")
+    return nome.strip(), modelo.strip()
+
+
+def chave_ambiente(provedor: str) -> str:
+    """Chave de API do provedor lida da variável de ambiente correspondente."""
+    return os.getenv(VARIAVEIS_CHAVE.get(provedor, ""), "")
+
+
+# --- Pool HTTP compartilhado ---
+
+_clientes_http = {}
+_clientes_http_lock = threading.Lock()
+
+
+def cliente_http(provedor: str):
+    """Cliente httpx do provedor, compartilhado por todos os modelos e chaves (conexões keep-alive)."""
+    import httpx
+
+    with _clientes_http_lock:
+        cliente = _clientes_http.get(provedor)
+        if cliente is None:
+            cliente = httpx.Client(
+                timeout=TIMEOUT_S,
+                limits=httpx.Limits(max_connections=CONEXOES_POR_PROVEDOR,
+                                    max_keepalive_connections=CONEXOES_POR_PROVEDOR),
+            )
+            _clientes_http[provedor] = cliente
+        return cliente
+
+
+# --- Limite de taxa por chave ---
+
+class BaldeFichas:
+    """
+    Balde de fichas (token bucket) de uma chave de API.
+
+    Args:
+        por_minuto: Requisições por minuto. Se None, não limita a taxa; o balde só
+            aplica as pausas pedidas pelo provedor (Retry-After).
+    """
+
+    def __init__(self, por_minuto: float = None):
+        self.taxa = por_minuto / 60 if por_minuto else None
+        # Rajada de até 10 s de requisições, para não concentrar o minuto inteiro no início
+        self.capacidade = max(1.0, por_minuto / 6) if por_minuto else 1.0
+        self._fichas = self.capacidade
+        self._atualizado = time.monotonic()
+        self._pausa_ate = 0.0
+        self._lock = threading.Lock()
+
+    def retirar(self, cancelado: threading.Event = None) -> float:
+        """Espera uma ficha e a consome; retorna o tempo de espera (interrompido por `cancelado`)."""
+        esperado = 0.0
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                if agora < self._pausa_ate:
+                    espera = self._pausa_ate - agora
+                elif self.taxa is None:
+                    return esperado
+                else:
+                    self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado) * self.taxa)
+                    self._atualizado = agora
+                    if self._fichas >= 1:
+                        self._fichas -= 1
+                        return esperado
+                    espera = (1 - self._fichas) / self.taxa
+            if cancelado is not None:
+                if cancelado.wait(espera):
+                    return esperado
+            else:
+                time.sleep(espera)
+            esperado += espera
+
+    def pausar(self, segundos: float):
+        """Suspende a chave inteira (ex: após um 429 com Retry-After)."""
+        with self._lock:
+            self._pausa_ate = max(self._pausa_ate, time.monotonic() + segundos)
+            self._fichas = 0.0
+            self._atualizado = time.monotonic()
+
+
+_baldes = {}
+_baldes_lock = threading.Lock()
+
+
+def obter_balde(provedor: str, chave_hash: str) -> BaldeFichas:
+    """Balde da chave de API (identificada pelo hash), compartilhado pelo processo."""
+    with _baldes_lock:
+        balde = _baldes.get((provedor, chave_hash))
+        if balde is None:
+            rpm = _ler_mapa("EDA_LLM_RPM").get(provedor)
+            balde = BaldeFichas(float(rpm) if rpm else None)
+            _baldes[(provedor, chave_hash)] = balde
+        return balde
+
+
+# --- Classificação de erros ---
+
+def _status_http(erro):
+    for origem in (erro, erro.__cause__):
+        if origem is None:
+            continue
+        for codigo in (getattr(origem, "status_code", None),
+                       getattr(getattr(origem, "response", None), "status_code", None),
+                       getattr(origem, "code", None)):
+            if isinstance(codigo, int):
+                return codigo
+    return None
+
+
+def erro_transitorio(erro: Exception) -> bool:
+    """Indica se vale repetir a requisição: limite de taxa, erro do servidor, timeout ou conexão."""
+    status = _status_http(erro)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return any(nome in type(erro).__name__ for nome in _ERROS_TRANSITORIOS)
+
+
+def _espera_pedida(erro: Exception):
+    """Segundos pedidos pelo provedor no cabeçalho Retry-After, se houver."""
+    cabecalhos = getattr(getattr(erro, "response", None), "headers", None) or {}
+    for nome, escala in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return min(float(cabecalhos[nome]) * escala, ESPERA_MAX_S)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def _iterar(modelo, messages, stop, kwargs, streaming: bool):
+    """Resposta do modelo como iterador: um ChatResult (generate) ou os chunks (stream)."""
+    if not streaming:
+        yield modelo._generate(messages, stop=stop, **kwargs)
+    elif type(modelo)._stream is BaseChatModel._stream:
+        # Modelo sem suporte a streaming: gera a resposta inteira de uma vez
+        mensagem = modelo._generate(messages, stop=stop, **kwargs).generations[0].message
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content=mensagem.content, usage_metadata=getattr(mensagem, "usage_metadata", None),
+            response_metadata=dict(mensagem.response_metadata)))
+    else:
+        yield from modelo._stream(messages, stop=stop, **kwargs)
+
+
+def _marcar(item, metadados: dict):
+    mensagens = [geracao.message for geracao in item.generations] if isinstance(item, ChatResult) else [item.message]
+    for mensagem in mensagens:
+        mensagem.response_metadata.update(metadados)
+
+
+class ChatResiliente(BaseChatModel):
+    """
+    Envolve o chat model de um provedor com limite de taxa por chave, retentativas e,
+    opcionalmente, um modelo alternativo para hedging e failover.
+
+    Só repete uma requisição antes do primeiro token: depois que o streaming começou,
+    um erro é repassado ao agente. No hedging, a requisição perdedora é abandonada
+    (o streaming é fechado; uma chamada sem streaming termina em segundo plano e a
+    resposta é descartada). Os metadados da resposta informam as tentativas
+    (`tentativas_llm`) e se ela veio do alternativo (`fallback_llm`).
+    """
+
+    modelo: Any
+    provedor: str = ""
+    chave_hash: str = ""
+    alternativo: Any = None
+    provedor_alternativo: str = ""
+    chave_hash_alternativo: str = ""
+    hedge_s: float = HEDGE_S
+    tentativas: int = TENTATIVAS
+
+    @property
+    def _llm_type(self) -> str:
+        return self.modelo._llm_type
+
+    @property
+    def _identifying_params(self) -> dict:
+        # Os mesmos do modelo principal: a resposta do alternativo vale para a mesma pergunta
+        return self.modelo._identifying_params
+
+    def _com_retentativas(self, modelo, balde: BaldeFichas, abrir, cancelado: threading.Event, info: dict):
+        """Itens da resposta de `modelo`, repetindo a requisição em falhas transitórias antes do primeiro item."""
+        for tentativa in range(1, self.tentativas + 1):
+            balde.retirar(cancelado)
+            if cancelado.is_set():
+                return
+            iterador = abrir(modelo)
+            try:
+                primeiro = next(iterador)
+            except StopIteration:
+                return
+            except Exception as e:
+                if tentativa == self.tentativas or cancelado.is_set() or not erro_transitorio(e):
+                    raise
+                pedida = _espera_pedida(e)
+                if pedida is not None and _status_http(e) == 429:
+                    balde.pausar(pedida)
+                # Espera exponencial com jitter completo (ou a pedida pelo provedor, se maior)
+                espera = max(pedida or 0.0, random.uniform(0, min(ESPERA_MAX_S, ESPERA_BASE_S * 2 ** (tentativa - 1))))
+                print(f"AVISO: falha transitória no LLM ({type(e).__name__}); "
+                      f"tentativa {tentativa + 1} de {self.tentativas} em {espera:.1f}s.")
+                if cancelado.wait(espera):
+                    return
+                continue
+            info["tentativas"] = tentativa
+            yield primeiro
+            yield from iterador
+            return
+
+    def _candidatos(self) -> list:
+        candidatos = [(self.modelo, obter_balde(self.provedor, self.chave_hash))]
+        if self.alternativo is not None:
+            candidatos.append((self.alternativo, obter_balde(self.provedor_alternativo, self.chave_hash_alternativo)))
+        return candidatos
+
+    def _responder(self, abrir):
+        candidatos = self._candidatos()
+        if len(candidatos) == 1:
+            # Sem alternativo: tudo na thread de quem chamou
+            info = {}
+            primeiro = True
+            for item in self._com_retentativas(*candidatos[0], abrir, threading.Event(), info):
+                if primeiro:
+                    _marcar(item, {"tentativas_llm": info["tentativas"], "fallback_llm": False})
+                    primeiro = False
+                yield item
+            return
+        yield from self._correr(candidatos, abrir)
+
+    def _correr(self, candidatos: list, abrir):
+        """Dispara o principal e, após `hedge_s` sem resposta (ou se ele falhar), o alternativo; vale o primeiro."""
+        fila = queue.Queue()
+        cancelados = [threading.Event() for _ in candidatos]
+        infos = [{} for _ in candidatos]
+        iniciados = []
+
+        def produzir(indice):
+            itens = self._com_retentativas(*candidatos[indice], abrir, cancelados[indice], infos[indice])
+            try:
+                for item in itens:
+                    if cancelados[indice].is_set():
+                        return
+                    fila.put((indice, "item", item))
+                fila.put((indice, "fim", None))
+            except Exception as e:
+                fila.put((indice, "erro", e))
+            finally:
+                # Fecha o streaming abandonado (e libera a vaga do limite do provedor)
+                itens.close()
+
+        def iniciar():
+            indice = len(iniciados)
+            iniciados.append(indice)
+            threading.Thread(target=produzir, args=(indice,), daemon=True, name=f"llm-{indice}").start()
+
+        iniciar()
+        prazo = time.monotonic() + self.hedge_s if self.hedge_s > 0 else None
+        vencedor = None
+        erros = []
+        try:
+            while True:
+                timeout = None
+                if vencedor is None and prazo is not None and len(iniciados) < len(candidatos):
+                    timeout = max(0.0, prazo - time.monotonic())
+                try:
+                    indice, tipo, valor = fila.get(timeout=timeout)
+                except queue.Empty:
+                    # Principal lento: dispara o alternativo em paralelo
+                    iniciar()
+                    continue
+                if vencedor is not None and indice != vencedor:
+                    continue
+                if tipo == "erro":
+                    if vencedor is not None:
+                        raise valor
+                    erros.append(valor)
+                    if len(iniciados) < len(candidatos):
+                        print(f"AVISO: o LLM principal falhou ({type(valor).__name__}); usando o alternativo.")
+                        iniciar()
+                    elif len(erros) == len(iniciados):
+                        raise erros[0]
+                    continue
+                if vencedor is None:
+                    vencedor = indice
+                    for outro, cancelado in enumerate(cancelados):
+                        if outro != indice:
+                            cancelado.set()
+                    if tipo == "item":
+                        _marcar(valor, {"tentativas_llm": infos[indice].get("tentativas", 1),
+                                        "fallback_llm": indice > 0})
+                if tipo == "fim":
+                    return
+                yield valor
+        finally:
+            for cancelado in cancelados:
+                cancelado.set()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        for resultado in self._responder(lambda modelo: _iterar(modelo, messages, stop, kwargs, streaming=False)):
+            return resultado
+        raise RuntimeError("O LLM não retornou resposta.")
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Os tokens são repassados ao callback pelo próprio BaseChatModel.stream
+        yield from self._responder(lambda modelo: _iterar(modelo, messages, stop, kwargs, streaming=True))
+
+
+def envolver_com_gateway(llm: BaseChatModel, provedor: str, chave_hash: str, alternativo: BaseChatModel = None,
+                         provedor_alternativo: str = "", chave_hash_alternativo: str = "") -> ChatResiliente:
+    """Retorna o LLM envolvido pela camada de resiliência (taxa, retentativas e alternativo)."""
+    return ChatResiliente(modelo=llm, provedor=provedor, chave_hash=chave_hash, alternativo=alternativo,
+                          provedor_alternativo=provedor_alternativo, chave_hash_alternativo=chave_hash_alternativo)
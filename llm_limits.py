@@ -0,0 +1,118 @@
+# llm_limits.py
+
+# Limite de chamadas simultâneas ao LLM por provedor, compartilhado pelo processo.
+# O limite envolve o cliente do provedor (abaixo do cache do LLM, então acertos
+# do cache não ocupam vaga): quando todas as vagas estão em uso, a chamada espera.
+# Assim, muitas perguntas podem rodar em paralelo (ex: no processamento em lote),
+# executando código enquanto outras esperam o LLM, sem ultrapassar o limite de
+# requisições simultâneas do provedor. O tempo de espera vai nos metadados da
+# resposta (`espera_limite_s`), onde a telemetria o lê.
+#
+# Configuração: EDA_LLM_LIMITES="Groq=2,OpenAI=8" (provedores ausentes não têm limite).
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+_limites = {}
+_limites_lock = threading.Lock()
+
+
+def _ler_limites_ambiente() -> dict:
+    limites = {}
+    for item in os.getenv("EDA_LLM_LIMITES", "").split(","):
+        provedor, _, maximo = item.rpartition("=")
+        if provedor.strip() and maximo.strip().isdigit():
+            limites[provedor.strip()] = int(maximo)
+    return limites
+
+
+def definir_limite(provedor: str, maximo: int = None):
+    """Define (ou remove, com `maximo` None) o número máximo de chamadas simultâneas ao provedor."""
+    with _limites_lock:
+        if maximo is None:
+            _limites.pop(provedor, None)
+        else:
+            # Chamadas em andamento liberam o semáforo antigo; as novas usam o novo limite
+            _limites[provedor] = (max(1, int(maximo)), threading.BoundedSemaphore(max(1, int(maximo))))
+
+
+def limite_provedor(provedor: str):
+    """Número máximo de chamadas simultâneas ao provedor, ou None se não há limite."""
+    with _limites_lock:
+        limite = _limites.get(provedor)
+        return limite[0] if limite is not None else None
+
+
+@contextmanager
+def _vaga(provedor: str):
+    """Ocupa uma vaga do provedor durante o bloco; gera o tempo que esperou por ela."""
+    with _limites_lock:
+        limite = _limites.get(provedor)
+    if limite is None:
+        yield 0.0
+        return
+    semaforo = limite[1]
+    inicio = time.perf_counter()
+    semaforo.acquire()
+    try:
+        yield time.perf_counter() - inicio
+    finally:
+        semaforo.release()
+
+
+class ChatComLimite(BaseChatModel):
+    """Envolve um chat model e limita as chamadas simultâneas ao provedor (ver `definir_limite`)."""
+
+    modelo: Any
+    provedor: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return self.modelo._llm_type
+
+    @property
+    def _identifying_params(self) -> dict:
+        # Os mesmos do modelo envolvido: o limite não muda a resposta (nem a chave do cache)
+        return self.modelo._identifying_params
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        with _vaga(self.provedor) as espera:
+            resultado = self.modelo._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        for geracao in resultado.generations:
+            geracao.message.response_metadata["espera_limite_s"] = espera
+        return resultado
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # A vaga fica ocupada até o último token (ou até o consumidor abandonar o stream)
+        with _vaga(self.provedor) as espera:
+            if type(self.modelo)._stream is BaseChatModel._stream:
+                # Modelo sem suporte a streaming: gera a resposta inteira de uma vez
+                mensagem = self.modelo._generate(messages, stop=stop, **kwargs).generations[0].message
+                chunks = [ChatGenerationChunk(message=AIMessageChunk(
+                    content=mensagem.content, usage_metadata=getattr(mensagem, "usage_metadata", None)))]
+            else:
+                # Os tokens são repassados ao callback pelo próprio BaseChatModel.stream
+                chunks = self.modelo._stream(messages, stop=stop, **kwargs)
+            primeiro = True
+            for chunk in chunks:
+                if primeiro:
+                    chunk.message.response_metadata["espera_limite_s"] = espera
+                    primeiro = False
+                yield chunk
+
+
+def limitar_concorrencia(llm: BaseChatModel, provedor: str) -> BaseChatModel:
+    """Envolve o LLM com o limite do provedor, se houver um definido; senão, o retorna sem mudança."""
+    if limite_provedor(provedor) is None:
+        return llm
+    return ChatComLimite(modelo=llm, provedor=provedor)
+
+
+for _provedor, _maximo in _ler_limites_ambiente().items():
+    definir_limite(_provedor, _maximo)
@@ -2,13 +2,31 @@
 
 import streamlit as st
 from dotenv import load_dotenv
-from workflow import criar_fluxo_agente
+from workflow import criar_fluxo_agente, obter_llm, instrucoes_modo_analise
+from ingestion import EXTENSOES_SUPORTADAS
+from dataset_cache import obter_cache_datasets
+from tools.custom_tools import PREFIXO_CACHE
+from tools.execution_cache import cache_execucao
+from tools.execution_context import ContextoExecucao
+from tools.sql_engine import (
+    duckdb_disponivel, diretorios_permitidos, validar_caminho_servidor, carregar_fonte_servidor
+)
+from streaming import ExecucaoStreaming
+from chat_history import HistoricoCompacto
+from refinement import Refinamento, codigos_para_refinar
+from tools.sampling import descrever_amostra
+from tools.versioning import ativar_copia_na_escrita
+from llm_cache import CacheLLM, obter_banco_cache_llm, cache_llm_habilitado
+from telemetry import TelemetriaTurno
+from langchain_core.agents import AgentAction
 import os
-import pandas as pd
 import re
+import time
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
+# Os DataFrames compartilhados entre as sessões dependem da cópia na escrita do pandas
+ativar_copia_na_escrita()
 
 # --- Configuração da Página e Estado da Sessão ---
 
@@ -22,6 +40,24 @@ def inicializar_estado_sessao():
         st.session_state.agente_analise = None
     if "df" not in st.session_state:
         st.session_state.df = None
+    if "dataset_hash" not in st.session_state:
+        st.session_state.dataset_hash = None
+    if "contexto_execucao" not in st.session_state:
+        st.session_state.contexto_execucao = None
+    if "execucao_em_andamento" not in st.session_state:
+        st.session_state.execucao_em_andamento = False
+    if "config_llm" not in st.session_state:
+        st.session_state.config_llm = None
+    if "historico" not in st.session_state:
+        st.session_state.historico = HistoricoCompacto()
+    if "llm" not in st.session_state:
+        st.session_state.llm = None
+
+    # O botão "Cancelar análise" interrompe o ciclo anterior do script no meio da execução;
+    # aqui o cancelamento é registrado no histórico do chat.
+    if st.session_state.execucao_em_andamento and st.session_state.get("cancelar_execucao"):
+        st.session_state.mensagens.append({"role": "assistant", "content": "Análise cancelada pelo usuário."})
+        st.session_state.execucao_em_andamento = False
 
 inicializar_estado_sessao()
 
@@ -57,9 +93,41 @@ with st.sidebar:
         
         model_name = st.text_input("Nome do Modelo:", placeholder=model_name_placeholder)
 
+    # Camada opcional do cache do LLM: perguntas repetidas sobre o mesmo arquivo são respondidas sem chamar o LLM
+    usar_cache_respostas = st.checkbox(
+        "Reaproveitar respostas de perguntas repetidas",
+        value=False,
+        disabled=not cache_llm_habilitado(),
+        help="Se a mesma pergunta (ignorando maiúsculas, acentos e pontuação) já foi respondida para este arquivo "
+             "com o mesmo modelo, a resposta guardada é exibida, com passos e gráficos, sem chamar o LLM.",
+    )
+
+    # Modo aproximado: o agente itera sobre uma amostra estratificada e a resposta é refinada depois
+    modo_aproximado = st.checkbox(
+        "Modo aproximado (amostra estratificada)",
+        value=False,
+        help="Em datasets grandes, o agente analisa `df_sample` (que preserva a proporção das classes e as "
+             "categorias raras) e informa a fração e os intervalos de confiança. Em seguida, o mesmo código é "
+             "reexecutado sobre todos os dados em segundo plano e a resposta é atualizada.",
+    )
+    contexto_atual = st.session_state.contexto_execucao
+    if modo_aproximado and contexto_atual is not None:
+        if contexto_atual.amostra_parcial:
+            st.caption(f"`df_sample`: {descrever_amostra(contexto_atual.amostra, contexto_atual.linhas_dataset)}.")
+        else:
+            st.caption("O dataset é pequeno: a análise usa todos os dados.")
+
     st.header("📂 Upload de Dados")
     uploaded_file = st.file_uploader("Escolha um arquivo CSV ou Excel", type=["csv", "xls", "xlsx"])
 
+    # Extrações grandes (acima do limite de upload ou da memória) são lidas direto do servidor pelo DuckDB
+    caminho_servidor = ""
+    if duckdb_disponivel() and diretorios_permitidos():
+        caminho_servidor = st.text_input(
+            "Ou caminho no servidor (arquivo ou pasta Parquet/CSV):",
+            help="O agente consulta todos os dados via SQL; o `df` do pandas recebe uma amostra se a fonte for grande.",
+        ).strip()
+
     # Botão para criar/atualizar o agente
     if st.button("Criar/Atualizar Agente"):
         # Validação condicional da chave de API
@@ -67,26 +135,39 @@ with st.sidebar:
             st.warning("Por favor, insira sua chave de API.")
         elif llm_provider != "LLM de Teste (Gemini)" and not model_name:
             st.warning(f"Por favor, insira o nome do modelo. Sugestão: `{model_name_placeholder}`")
-        elif uploaded_file is None:
+        elif uploaded_file is None and not caminho_servidor:
             st.warning("Por favor, carregue um arquivo CSV ou Excel.")
         else:
             with st.spinner("Processando arquivo e configurando agente..."):
                 try:
-                    # Carrega o DataFrame com base na extensão do arquivo
-                    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-                    if file_extension == ".csv":
-                        df = pd.read_csv(uploaded_file)
-                    elif file_extension in [".xls", ".xlsx"]:
-                        # Para ler arquivos Excel, a biblioteca 'openpyxl' pode ser necessária
-                        df = pd.read_excel(uploaded_file)
+                    fonte_servidor, total_linhas_fonte = None, None
+                    if uploaded_file is not None:
+                        # Carrega o DataFrame com base na extensão do arquivo
+                        file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+                        if file_extension not in EXTENSOES_SUPORTADAS:
+                            # Esta parte é redundante por causa do 'type' no file_uploader, mas é uma boa prática
+                            st.error("Formato de arquivo não suportado. Use CSV ou Excel.")
+                            st.stop()
+                        # Leitura multithread com tipos compactos (float32, inteiros pequenos, categorias).
+                        # Arquivos já conhecidos vêm do cache em disco, compartilhado entre as sessões.
+                        df, dataset_hash, relatorio_ingestao = obter_cache_datasets().carregar(uploaded_file)
+                        nome_fonte = uploaded_file.name
                     else:
-                        # Esta parte é redundante por causa do 'type' no file_uploader, mas é uma boa prática
-                        st.error("Formato de arquivo não suportado. Use CSV ou Excel.")
-                        st.stop()
+                        try:
+                            fonte_servidor = validar_caminho_servidor(caminho_servidor)
+                        except ValueError as e:
+                            st.error(str(e))
+                            st.stop()
+                        # O DuckDB lê a fonte em streaming; o `df` recebe a fonte inteira ou uma amostra
+                        df, dataset_hash, relatorio_ingestao, total_linhas_fonte = carregar_fonte_servidor(fonte_servidor)
+                        nome_fonte = caminho_servidor
                     st.session_state.df = df
+                    st.session_state.dataset_hash = dataset_hash
                     
-                    # Cria o agente com as configurações fornecidas
-                    agente = criar_fluxo_agente(df, llm_provider, api_key, model_name)
+                    # Cria o agente com as configurações fornecidas, com um escopo de execução exclusivo desta sessão
+                    contexto = ContextoExecucao(df, dataset_hash=dataset_hash, fonte_servidor=fonte_servidor,
+                                                total_linhas_fonte=total_linhas_fonte)
+                    agente = criar_fluxo_agente(df, llm_provider, api_key, model_name, dataset_hash, contexto)
                     
                     # Verifica se a criação do agente retornou um erro
                     if isinstance(agente, str): # A função agora retorna uma string em caso de erro
@@ -94,9 +175,19 @@ with st.sidebar:
                         st.session_state.agente_analise = None
                     else:
                         st.session_state.agente_analise = agente
+                        # O escopo da análise anterior não será mais usado (libera o trabalhador do sandbox)
+                        if st.session_state.get("contexto_execucao") is not None:
+                            st.session_state.contexto_execucao.descartar()
+                        st.session_state.contexto_execucao = contexto
+                        st.session_state.config_llm = (llm_provider, model_name or os.getenv("TEST_GEMINI_MODEL_NAME", ""))
+                        # Histórico com orçamento de tokens; as mensagens antigas são resumidas pelo mesmo LLM,
+                        # que também reescreve as respostas refinadas do modo aproximado
+                        st.session_state.llm = obter_llm(llm_provider, api_key, model_name, dataset_hash)
+                        st.session_state.historico = HistoricoCompacto(st.session_state.llm)
                         # Reseta o chat para a nova análise
-                        st.session_state.mensagens = [{"role": "assistant", "content": f"Agente configurado com `{llm_provider} ({model_name})` e arquivo `{uploaded_file.name}` carregado. O que gostaria de saber?"}]
+                        st.session_state.mensagens = [{"role": "assistant", "content": f"Agente configurado com `{llm_provider} ({model_name})` e arquivo `{nome_fonte}` carregado. O que gostaria de saber?"}]
                         st.success("Agente pronto!")
+                        st.caption(relatorio_ingestao.resumo())
                         st.dataframe(df.head())
 
                 except Exception as e:
@@ -106,12 +197,118 @@ with st.sidebar:
                     st.error("Ocorreu uma falha ao configurar o agente. Verifique as configurações do LLM e o arquivo enviado.")
                     # Garante que o estado do agente seja limpo em caso de erro
                     st.session_state.df = None
+                    st.session_state.dataset_hash = None
                     st.session_state.agente_analise = None
+                    if st.session_state.get("contexto_execucao") is not None:
+                        st.session_state.contexto_execucao.descartar()
+                    st.session_state.contexto_execucao = None
+                    st.session_state.config_llm = None
+                    st.session_state.llm = None
                     # Força a re-renderização da página para mostrar a tela de boas-vindas
                     st.rerun()
 
+    # Versões do `df`: quando o agente altera o dataset (remove colunas, filtra linhas), voltar a uma
+    # versão anterior ou aos dados originais só troca a referência, sem reler o arquivo nem recriar o agente
+    contexto_atual = st.session_state.contexto_execucao
+    resumo_versoes = contexto_atual.resumo_versoes() if contexto_atual is not None else None
+    if resumo_versoes is not None and len(resumo_versoes["versoes"]) > 1:
+        st.header("🗂️ Versões do `df`")
+        st.caption(
+            f"Versão atual: {resumo_versoes['atual']} · {len(resumo_versoes['versoes']) - 1} alterações guardadas "
+            f"· {resumo_versoes['mb_extra']:.0f} MB além dos dados originais."
+        )
+        versoes_por_numero = {versao["versao"]: versao for versao in resumo_versoes["versoes"]}
+        numeros = list(versoes_por_numero)
+        versao_escolhida = st.selectbox(
+            "Versão:", numeros, index=numeros.index(resumo_versoes["atual"]),
+            format_func=lambda n: (f"{n}: {versoes_por_numero[n]['descricao']} "
+                                   f"({versoes_por_numero[n]['linhas']:,} × {versoes_por_numero[n]['colunas']})".replace(",", ".")),
+        )
+        coluna_desfazer, coluna_restaurar, coluna_reiniciar = st.columns(3)
+        try:
+            aviso = None
+            if coluna_desfazer.button("↩️ Desfazer", help="Volta o `df` para a versão anterior à atual."):
+                atual = contexto_atual.restaurar_versao(desfazer=True)["atual"]
+                aviso = f"O `df` voltou para a versão {atual} ({versoes_por_numero[atual]['descricao']})."
+            if coluna_restaurar.button("Restaurar", help="Volta o `df` para a versão escolhida acima."):
+                contexto_atual.restaurar_versao(versao_escolhida)
+                aviso = (f"O `df` voltou para a versão {versao_escolhida} "
+                         f"({versoes_por_numero[versao_escolhida]['descricao']}).")
+            if coluna_reiniciar.button("🔄 Originais", help="Recomeça o escopo com os dados originais. As variáveis "
+                                                           "definidas pelo agente se perdem; o agente não é recriado."):
+                contexto_atual.reiniciar_escopo()
+                aviso = "O escopo foi reiniciado com os dados originais; as variáveis definidas antes se perderam."
+            if aviso is not None:
+                # O aviso entra no histórico para que o agente saiba que o `df` mudou
+                st.session_state.mensagens.append({"role": "assistant", "content": aviso})
+                st.rerun()
+        except ValueError as e:
+            st.warning(str(e))
+
 # --- Exibição da Interface Principal ---
 
+@st.fragment(run_every=2)
+def aguardar_refinamento(refinamento):
+    """Aguarda o refinamento em segundo plano e, ao terminar, redesenha a página com a resposta exata."""
+    if refinamento.concluido:
+        st.rerun()
+    st.caption("⏳ Valores aproximados. Confirmando com todos os dados em segundo plano...")
+
+def exibir_painel_desempenho(registro):
+    """Exibe o tempo de cada etapa do turno, os tokens, a memória e os acertos de cache."""
+    totais, memoria = registro["totais"], registro["memoria"]
+    with st.expander(f"⏱️ Desempenho do turno ({registro['duracao_s']:.1f}s)", expanded=False):
+        colunas = st.columns(5)
+        colunas[0].metric("LLM", f"{totais['llm_s']:.2f}s", f"{totais['chamadas_llm']} chamadas", delta_color="off")
+        colunas[1].metric("Ferramentas", f"{totais['ferramentas_s']:.2f}s",
+                          f"gráficos: {totais['graficos_s']:.2f}s", delta_color="off")
+        colunas[2].metric("Interface", f"{totais['renderizacao_s']:.2f}s",
+                          f"outros: {totais['outros_s']:.2f}s", delta_color="off")
+        colunas[3].metric("Tokens", f"{totais['tokens_prompt'] + totais['tokens_resposta']:,}".replace(",", "."),
+                          f"{totais['tokens_prompt']} prompt / {totais['tokens_resposta']} resposta", delta_color="off")
+        if memoria["pico_mb"] is not None:
+            colunas[4].metric("Memória (pico)", f"{memoria['pico_mb']:.0f} MB",
+                              f"{memoria['delta_pico_mb']:+.0f} MB no turno", delta_color="off")
+        st.caption(
+            f"Cache do LLM: {totais['acertos_cache_llm']} de {totais['chamadas_llm']} chamadas · "
+            f"Cache de execução: {totais['acertos_cache_execucao']} acertos"
+            + (f" · {totais['retentativas_llm']} retentativas" if totais.get("retentativas_llm") else "")
+            + (f" · {totais['respostas_fallback_llm']} respostas do LLM alternativo"
+               if totais.get("respostas_fallback_llm") else "")
+            + (" · tokens estimados pelo tamanho do texto" if any(c["tokens_estimados"] for c in registro["ciclos"]) else "")
+        )
+        if registro["ciclos"]:
+            st.dataframe([
+                {
+                    "Ciclo": c["indice"],
+                    "LLM (s)": round(c["llm_s"], 3),
+                    "1º token (s)": round(c["primeiro_token_s"], 3) if c["primeiro_token_s"] is not None else None,
+                    "Tokens (prompt/resposta)": f"{c['tokens_prompt']}/{c['tokens_resposta']}",
+                    "Ferramenta": c["ferramenta"] or "",
+                    "Ferramenta (s)": round(c["ferramenta_s"], 3),
+                    "Gráficos (s)": round(c["graficos_s"], 3),
+                    "Interface (s)": round(c["renderizacao_s"], 3),
+                    "Cache": "LLM" if c["cache_llm"] else ("execução" if c["cache_execucao"] else ""),
+                }
+                for c in registro["ciclos"]
+            ], hide_index=True)
+
+def exibir_mensagem(mensagem):
+    """Exibe uma mensagem do histórico, aplicando o refinamento do modo aproximado quando ele termina."""
+    refinamento = mensagem.get("refinamento")
+    if refinamento is not None and refinamento.concluido:
+        mensagem["content"] = re.sub(r'\[CHART_PATH:.*?\]', '', refinamento.resposta_refinada).strip()
+        mensagem["refinada"] = True
+        del mensagem["refinamento"]
+        refinamento = None
+    st.write(mensagem["content"])
+    if refinamento is not None:
+        aguardar_refinamento(refinamento)
+    elif mensagem.get("refinada"):
+        st.caption("✅ Resposta atualizada com todos os dados.")
+    if mensagem.get("desempenho"):
+        exibir_painel_desempenho(mensagem["desempenho"])
+
 # Se o agente ainda não foi criado, exibe a tela de boas-vindas.
 if st.session_state.agente_analise is None:
     st.info("👋 **Bem-vindo ao Agente de Análise de Dados!** Configure o LLM e carregue seu arquivo na barra lateral para começar.")
@@ -144,10 +341,75 @@ if st.session_state.agente_analise is None:
 else:
     for mensagem in st.session_state.mensagens:
         with st.chat_message(mensagem["role"]):
-            st.write(mensagem["content"])
+            exibir_mensagem(mensagem)
 
 # --- Lógica do Chat ---
 
+def exibir_passo(i, acao, observacao):
+    """Exibe um ciclo (Pensamento, Ação e Observação) do raciocínio do agente."""
+    st.subheader(f"🔄 Ciclo {i+1}")
+
+    # 1. Pensamento do Agente
+    st.markdown("##### 1. Pensamento")
+    # O atributo 'log' contém a cadeia de pensamento completa que o LLM gerou.
+    st.text(acao.log.strip())
+
+    # 2. Ação Executada
+    st.markdown("##### 2. Ação")
+    st.markdown(f"**Ferramenta:** `{acao.tool}`")
+    st.markdown("**Entrada da Ação (código executado):**")
+    st.code(acao.tool_input, language="python")
+
+    # 3. Observação (Resultado da Ação)
+    st.markdown("##### 3. Observação")
+    if acao.tool in ("python_code_executor", "consultar_sql"):
+        if observacao.startswith(PREFIXO_CACHE):
+            st.caption("♻️ Cache: acerto (resultado reaproveitado, sem reexecutar o código).")
+            observacao = observacao[len(PREFIXO_CACHE):]
+        else:
+            st.caption("⚙️ Cache: falha (código executado).")
+    # A observação já vem formatada da nossa ferramenta customizada
+    st.markdown(observacao)
+
+def obter_cache_respostas():
+    """Cache de respostas completas do dataset da sessão, ou None se o cache do LLM estiver desativado."""
+    if not cache_llm_habilitado() or st.session_state.config_llm is None:
+        return None
+    return CacheLLM(obter_banco_cache_llm(), st.session_state.dataset_hash)
+
+def obter_grafico(nome):
+    """Bytes de um gráfico gerado nesta sessão (citado como [CHART_PATH:nome]), ou None."""
+    contexto = st.session_state.contexto_execucao
+    return contexto.graficos.obter(nome) if contexto is not None else None
+
+def ler_graficos_citados(texto):
+    """Lê os gráficos citados em tags [CHART_PATH:...] da resposta, para guardá-los com ela."""
+    graficos = {}
+    for nome in re.findall(r'\[CHART_PATH:(.*?)\]', texto):
+        conteudo = obter_grafico(nome)
+        if conteudo is not None:
+            graficos[nome.strip()] = conteudo
+    return graficos
+
+def reproduzir_resposta_cache(resposta_cache):
+    """Exibe os passos de uma resposta guardada no cache e restaura os seus gráficos. Retorna (saída, passos)."""
+    if st.session_state.contexto_execucao is not None:
+        for nome, conteudo in resposta_cache["graficos"].items():
+            st.session_state.contexto_execucao.graficos.guardar(nome, conteudo)
+    passos = [
+        (AgentAction(tool=tool, tool_input=tool_input, log=log), observacao)
+        for tool, tool_input, log, observacao in resposta_cache["passos"]
+    ]
+    st.caption("♻️ Resposta reaproveitada do cache (o LLM não foi chamado).")
+    with st.status("Ver Raciocínio do Agente", state="complete", expanded=False):
+        for i, (acao, observacao) in enumerate(passos):
+            if i:
+                st.divider()
+            exibir_passo(i, acao, observacao)
+        if not passos:
+            st.write("Nenhum passo intermediário foi executado (ex: o agente respondeu diretamente).")
+    return resposta_cache["output"], passos
+
 if prompt := st.chat_input("Qual sua pergunta sobre os dados?"):
     if st.session_state.agente_analise is None:
         st.warning("Por favor, carregue um arquivo CSV ou Excel na barra lateral primeiro.")
@@ -158,73 +420,162 @@ if prompt := st.chat_input("Qual sua pergunta sobre os dados?"):
     with st.chat_message("user"):
         st.write(prompt)
 
-    # Invoca o agente e obtém a resposta
+    # Executa o agente em segundo plano, exibindo cada passo assim que é produzido
     with st.chat_message("assistant"):
-        with st.spinner("Analisando..."):
-            # Prepara a entrada para o agente, incluindo o histórico do chat
-            # Simplificado para usar a estrutura de mensagens diretamente,
-            # que já é limpa e não contém dados de UI.
-            entrada_agente = {
-                "input": prompt,
-                "chat_history": st.session_state.mensagens
-            }
-
-            try:
-                # Invoca o agente
-                resposta = st.session_state.agente_analise.invoke(entrada_agente)
-
-                # Variável para armazenar a resposta limpa para o histórico
-                resposta_limpa_para_historico = ""
+        # Prepara a entrada para o agente, incluindo o histórico do chat.
+        # O histórico é compactado (trocas recentes na íntegra e um resumo das antigas)
+        # para que o prompt não cresça a cada pergunta. A pergunta atual vai em "input".
+        # No modo aproximado, o prompt da pergunta inclui as regras de uso de `df_sample`.
+        modo_analise = instrucoes_modo_analise(st.session_state.contexto_execucao, modo_aproximado)
+        entrada_agente = {
+            "input": prompt,
+            "chat_history": st.session_state.historico.montar(st.session_state.mensagens[:-1]),
+            "modo_analise": modo_analise,
+        }
+        # Tempos, tokens, memória e acertos de cache do turno (painel de desempenho e arquivos de telemetria)
+        provedor, modelo = st.session_state.config_llm or ("", "")
+        telemetria = TelemetriaTurno(st.session_state.contexto_execucao, provedor, modelo, prompt).iniciar()
+        status_turno = "ok"
+
+        try:
+            # Pergunta repetida sobre o mesmo arquivo: reproduz a resposta guardada, sem chamar o LLM.
+            # Respostas aproximadas (modo aproximado) não são guardadas nem reaproveitadas, nem as
+            # que dependem da conversa ou de um `df`/variáveis alterados nesta sessão.
+            resposta_cache = None
+            sem_contexto_anterior = (
+                not any(m["role"] == "user" for m in st.session_state.mensagens[:-1])
+                and st.session_state.contexto_execucao.estado_inicial
+            )
+            cache_respostas = (obter_cache_respostas()
+                               if usar_cache_respostas and not modo_analise and sem_contexto_anterior else None)
+            if cache_respostas is not None:
+                resposta_cache = cache_respostas.obter_resposta(*st.session_state.config_llm, prompt)
+
+            if resposta_cache is not None:
+                status_turno = "cache_respostas"
+                with telemetria.medir_renderizacao():
+                    resposta_final, intermediate_steps = reproduzir_resposta_cache(resposta_cache)
+            else:
+                # Um clique no botão interrompe este ciclo do script; o cancelamento
+                # é registrado no início do próximo (ver inicializar_estado_sessao).
+                area_cancelar = st.empty()
+                area_cancelar.button("⏹️ Cancelar análise", key="cancelar_execucao")
+                st.session_state.execucao_em_andamento = True
+                execucao = ExecucaoStreaming(
+                    st.session_state.agente_analise, entrada_agente, st.session_state.contexto_execucao,
+                    callbacks=[telemetria],
+                ).iniciar()
+
+                intermediate_steps = []
+                resposta_final = None
+                cancelado = False
+                inicio = time.monotonic()
+                segundos_exibidos = 0
+
+                with st.status("Analisando...", expanded=True) as painel:
+                    stats_cache = cache_execucao.estatisticas()
+                    st.caption(
+                        f"Cache de execução: {stats_cache['acertos']} acertos, {stats_cache['falhas']} falhas "
+                        f"({stats_cache['taxa_acerto']:.0%}), {stats_cache['entradas']} resultados guardados."
+                    )
+                    if cache_llm_habilitado():
+                        stats_llm = obter_banco_cache_llm().estatisticas()["geracoes"]
+                        st.caption(
+                            f"Cache do LLM: {stats_llm['acertos']} acertos, {stats_llm['falhas']} falhas "
+                            f"({stats_llm['taxa_acerto']:.0%}), {stats_llm['entradas']} respostas guardadas."
+                        )
+                    area_pensamento = st.empty()
+                    area_ferramenta = st.empty()
+                    texto_pensamento = ""
+                    try:
+                        for evento in execucao.eventos():
+                            if evento is None:
+                                # Atualiza o tempo decorrido; cada atualização também permite
+                                # que o Streamlit interrompa o script se o usuário cancelar.
+                                segundos = int(time.monotonic() - inicio)
+                                if segundos != segundos_exibidos:
+                                    segundos_exibidos = segundos
+                                    painel.update(label=f"Analisando... ({segundos}s)")
+                                continue
+
+                            tipo = evento[0]
+                            if tipo == "llm_inicio":
+                                texto_pensamento = ""
+                            elif tipo == "token":
+                                # Exibe o pensamento do LLM token a token
+                                texto_pensamento += evento[1]
+                                area_pensamento.text(texto_pensamento)
+                            elif tipo == "ferramenta":
+                                area_ferramenta.caption(f"⚙️ Executando `{evento[1]}`...")
+                            elif tipo == "passo":
+                                area_pensamento.empty()
+                                area_ferramenta.empty()
+                                if intermediate_steps:
+                                    st.divider()
+                                with telemetria.medir_renderizacao(len(intermediate_steps) + 1):
+                                    exibir_passo(len(intermediate_steps), evento[1], evento[2])
+                                intermediate_steps.append((evento[1], evento[2]))
+                                # Os próximos tokens vão para uma área nova, abaixo do passo
+                                area_pensamento = st.empty()
+                                area_ferramenta = st.empty()
+                            elif tipo == "saida":
+                                resposta_final = evento[1]
+                                area_pensamento.empty()
+                            elif tipo == "cancelado":
+                                cancelado = True
+                            elif tipo == "erro":
+                                raise evento[1]
+                    finally:
+                        # Se o script foi interrompido (ex: botão cancelar), encerra a execução em segundo plano
+                        if not execucao.concluida:
+                            execucao.cancelar()
+                            telemetria.finalizar("cancelado")
 
-                # Exibe os passos intermediários do agente de forma estruturada
-                with st.expander("Ver Raciocínio do Agente", expanded=False):
-                    intermediate_steps = resposta.get("intermediate_steps", [])
                     if not intermediate_steps:
                         st.write("Nenhum passo intermediário foi executado (ex: o agente respondeu diretamente).")
-                    else:
-                        for i, passo in enumerate(intermediate_steps):
-                            st.subheader(f"🔄 Ciclo {i+1}")
-                            acao, observacao = passo
-
-                            # 1. Pensamento do Agente
-                            st.markdown("##### 1. Pensamento")
-                            # O atributo 'log' contém a cadeia de pensamento completa que o LLM gerou.
-                            st.text(acao.log.strip())
-
-                            # 2. Ação Executada
-                            st.markdown("##### 2. Ação")
-                            st.markdown(f"**Ferramenta:** `{acao.tool}`")
-                            st.markdown("**Entrada da Ação (código executado):**")
-                            st.code(acao.tool_input, language="python")
-
-                            # 3. Observação (Resultado da Ação)
-                            st.markdown("##### 3. Observação")
-                            # A observação já vem formatada da nossa ferramenta customizada
-                            st.markdown(observacao)
-                            
-                            if i < len(intermediate_steps) - 1:
-                                st.divider()
-
-                # Exibe a resposta final do agente
-                resposta_final = resposta.get("output", "Desculpe, não consegui obter uma resposta.")                
-
-                # Lógica para lidar com o limite de iteração atingido de forma mais amigável
-                if "Agent stopped due to iteration limit" in resposta_final:
-                    st.warning("A análise se tornou muito complexa e não foi concluída no tempo limite. Aqui está o último passo do raciocínio:")
-                    intermediate_steps = resposta.get("intermediate_steps", [])
-                    if intermediate_steps:
-                        # Pega a última observação, que é o resultado mais recente que o agente viu
-                        ultima_acao, ultima_observacao = intermediate_steps[-1]
-                        # Exibe o último passo diretamente na interface
-                        st.markdown("##### Pensamento")
-                        st.text(ultima_acao.log.strip())
-                        st.markdown("##### Observação")
-                        st.markdown(ultima_observacao)
-                    # Adiciona a mensagem de erro ao histórico
-                    resposta_limpa_para_historico = "A análise não foi concluída no tempo limite."
-                else:
-                    # Se o agente concluiu, processa a resposta final normalmente
-                    resposta_limpa_para_historico = resposta_final
+                    painel.update(label="Ver Raciocínio do Agente", state="complete", expanded=False)
+
+                area_cancelar.empty()
+                st.session_state.execucao_em_andamento = False
+
+                if cancelado:
+                    telemetria.finalizar("cancelado")
+                    st.warning("Análise cancelada.")
+                    st.session_state.mensagens.append({"role": "assistant", "content": "Análise cancelada pelo usuário."})
+                    st.stop()
+
+            # Painel de desempenho, logo abaixo do "Ver Raciocínio do Agente" (preenchido ao final do turno)
+            area_desempenho = st.empty()
+            resposta_obtida = resposta_final is not None
+            resposta = {
+                "output": resposta_final or "Desculpe, não consegui obter uma resposta.",
+                "intermediate_steps": intermediate_steps,
+            }
+
+            # Variável para armazenar a resposta limpa para o histórico
+            resposta_limpa_para_historico = ""
+
+            # Exibe a resposta final do agente
+            resposta_final = resposta.get("output", "Desculpe, não consegui obter uma resposta.")                
+
+            # Lógica para lidar com o limite de iteração atingido de forma mais amigável
+            if "Agent stopped due to iteration limit" in resposta_final:
+                st.warning("A análise se tornou muito complexa e não foi concluída no tempo limite. Aqui está o último passo do raciocínio:")
+                intermediate_steps = resposta.get("intermediate_steps", [])
+                if intermediate_steps:
+                    # Pega a última observação, que é o resultado mais recente que o agente viu
+                    ultima_acao, ultima_observacao = intermediate_steps[-1]
+                    # Exibe o último passo diretamente na interface
+                    st.markdown("##### Pensamento")
+                    st.text(ultima_acao.log.strip())
+                    st.markdown("##### Observação")
+                    st.markdown(ultima_observacao)
+                # Adiciona a mensagem de erro ao histórico
+                resposta_limpa_para_historico = "A análise não foi concluída no tempo limite."
+            else:
+                # Se o agente concluiu, processa a resposta final normalmente
+                resposta_limpa_para_historico = resposta_final
+                with telemetria.medir_renderizacao():
                     # Lógica robusta para extrair e exibir um ou mais gráficos
                     chart_tag = "[CHART_PATH:"
                     if chart_tag in resposta_final:
@@ -236,8 +587,12 @@ if prompt := st.chat_input("Qual sua pergunta sobre os dados?"):
                             if ']' in part:
                                 caminho_imagem, texto_depois = part.split(']', 1)
                                 caminho_imagem = caminho_imagem.strip()
+                                # Os gráficos ficam em memória, no contexto de execução da sessão
+                                imagem = obter_grafico(caminho_imagem)
                                 try:
-                                    st.image(caminho_imagem, caption="Gráfico gerado pelo agente.", use_column_width=True)
+                                    if imagem is None:
+                                        raise FileNotFoundError("gráfico não encontrado nesta sessão")
+                                    st.image(imagem, caption="Gráfico gerado pelo agente.", use_column_width=True)
                                 except Exception as img_e:
                                     st.error(f"Erro ao exibir o gráfico em '{caminho_imagem}': {img_e}")
                                 if texto_depois.strip():
@@ -246,11 +601,41 @@ if prompt := st.chat_input("Qual sua pergunta sobre os dados?"):
                                 st.write(f"{chart_tag}{part}")
                     else:
                         st.write(resposta_final)
-                
-                # Adiciona a resposta limpa (sem tags de gráfico) do agente ao histórico
-                if resposta_limpa_para_historico:
-                    st.session_state.mensagens.append({"role": "assistant", "content": resposta_limpa_para_historico})
-            except Exception as e:
-                st.error("Ocorreu um erro durante a execução do agente. Veja os detalhes abaixo:")
-                st.exception(e)
-                st.session_state.mensagens.append({"role": "assistant", "content": f"Erro na execução: {e}"})
\ No newline at end of file
+
+                # Guarda a resposta completa para perguntas repetidas (camada opcional do cache do LLM)
+                if cache_respostas is not None and resposta_cache is None and resposta_obtida:
+                    cache_respostas.guardar_resposta(
+                        *st.session_state.config_llm, prompt, resposta_final, intermediate_steps,
+                        ler_graficos_citados(resposta_final)
+                    )
+            
+            # Modo aproximado: o código da resposta é reexecutado sobre todos os dados em segundo plano
+            refinamento = None
+            if modo_analise and resposta_obtida and "Agent stopped due to iteration limit" not in resposta_final:
+                codigos = codigos_para_refinar(intermediate_steps)
+                if codigos:
+                    refinamento = Refinamento(
+                        st.session_state.contexto_execucao, codigos, prompt, resposta_final, st.session_state.llm
+                    ).iniciar()
+
+            registro = telemetria.finalizar(status_turno)
+            with area_desempenho.container():
+                exibir_painel_desempenho(registro)
+
+            # Adiciona a resposta limpa (sem tags de gráfico) do agente ao histórico
+            if resposta_limpa_para_historico:
+                mensagem = {"role": "assistant", "content": resposta_limpa_para_historico}
+                if refinamento is not None:
+                    mensagem["refinamento"] = refinamento
+                mensagem["desempenho"] = registro
+                st.session_state.mensagens.append(mensagem)
+            # Incorpora ao resumo (em segundo plano) as trocas que saíram da janela recente
+            st.session_state.historico.atualizar_resumo(st.session_state.mensagens)
+            if refinamento is not None:
+                # Ao terminar, a página é redesenhada e a resposta exata substitui a aproximada
+                aguardar_refinamento(refinamento)
+        except Exception as e:
+            st.error("Ocorreu um erro durante a execução do agente. Veja os detalhes abaixo:")
+            st.exception(e)
+            telemetria.finalizar("erro")
+            st.session_state.mensagens.append({"role": "assistant", "content": f"Erro na execução: {e}"})
\ No newline at end of file
@@ -0,0 +1,214 @@
+# profiling.py
+
+# Perfil do dataset calculado uma única vez na carga dos dados.
+# O resumo compacto vai direto para o prompt do agente, poupando os ciclos
+# ReAct que antes eram gastos com df.info(), df.describe() e value_counts().
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+DIRETORIO_PERFIS = os.getenv("EDA_PROFILE_DIR", os.path.join(".cache", "profiles"))
+
+# Nomes usuais da coluna alvo, usados para os resumos por classe
+NOMES_COLUNA_ALVO = ("Class", "class", "target", "Target", "label", "Label", "fraud", "Fraud")
+MAX_CLASSES = 20
+NUM_CORRELACOES = 10
+
+SECOES_PERFIL = ("esquema", "estatisticas", "classes", "correlacoes")
+
+_perfis = {}
+_perfis_lock = threading.Lock()
+
+
+def detectar_coluna_alvo(df: pd.DataFrame):
+    """Retorna a coluna alvo (ex: 'Class') se houver uma com poucas classes."""
+    for nome in NOMES_COLUNA_ALVO:
+        if nome in df.columns and df[nome].nunique(dropna=True) <= MAX_CLASSES:
+            return nome
+    return None
+
+
+def _arredondar(valor):
+    """Converte escalares numpy em tipos nativos (serializáveis em JSON) com 4 casas."""
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    if isinstance(valor, (np.integer, int)):
+        return int(valor)
+    if isinstance(valor, (np.floating, float)):
+        return round(float(valor), 4)
+    return str(valor)
+
+
+def gerar_perfil(df: pd.DataFrame) -> dict:
+    """
+    Calcula o perfil do DataFrame com operações vetorizadas.
+
+    Returns:
+        Um dicionário serializável com esquema, nulos, quantis, resumos por classe
+        e as correlações mais fortes.
+    """
+    numericas = df.select_dtypes(include="number")
+    nulos = df.isna().sum()
+
+    perfil = {
+        "linhas": int(len(df)),
+        "colunas": int(df.shape[1]),
+        "memoria_mb": round(df.memory_usage(deep=True).sum() / 1024 ** 2, 1),
+        "esquema": [
+            {"coluna": str(c), "tipo": str(df[c].dtype), "nulos": int(nulos[c])}
+            for c in df.columns
+        ],
+        "estatisticas": {},
+        "coluna_alvo": None,
+        "classes": {},
+        "correlacoes": [],
+        "correlacoes_alvo": [],
+    }
+
+    # Um único describe() calcula média, desvio, mínimo, quartis e máximo de todas as colunas
+    if not numericas.empty:
+        descricao = numericas.describe(percentiles=[0.25, 0.5, 0.75, 0.99]).T
+        perfil["estatisticas"] = {
+            str(coluna): {estat: _arredondar(valor) for estat, valor in linha.items()}
+            for coluna, linha in descricao.iterrows()
+        }
+
+    coluna_alvo = detectar_coluna_alvo(df)
+    if coluna_alvo is not None:
+        perfil["coluna_alvo"] = str(coluna_alvo)
+        contagens = df[coluna_alvo].value_counts(dropna=False)
+        medias = numericas.drop(columns=[coluna_alvo], errors="ignore").groupby(df[coluna_alvo], observed=True).mean()
+        for classe, contagem in contagens.items():
+            perfil["classes"][str(classe)] = {
+                "contagem": int(contagem),
+                "proporcao": round(contagem / max(len(df), 1), 6),
+                "medias": {
+                    str(c): _arredondar(v) for c, v in medias.loc[classe].items()
+                } if classe in medias.index else {},
+            }
+
+    if numericas.shape[1] > 1:
+        corr = numericas.corr()
+        valores = corr.to_numpy()
+        # Apenas o triângulo superior, sem a diagonal, para não repetir pares
+        linhas, colunas = np.triu_indices_from(valores, k=1)
+        pares = valores[linhas, colunas]
+        validos = ~np.isnan(pares)
+        linhas, colunas, pares = linhas[validos], colunas[validos], pares[validos]
+        ordem = np.argsort(-np.abs(pares))[:NUM_CORRELACOES]
+        perfil["correlacoes"] = [
+            [str(corr.index[linhas[i]]), str(corr.columns[colunas[i]]), _arredondar(pares[i])]
+            for i in ordem
+        ]
+        if coluna_alvo in corr.columns:
+            alvo = corr[coluna_alvo].drop(coluna_alvo).dropna()
+            alvo = alvo.reindex(alvo.abs().sort_values(ascending=False).index)[:NUM_CORRELACOES]
+            perfil["correlacoes_alvo"] = [[str(c), _arredondar(v)] for c, v in alvo.items()]
+
+    return perfil
+
+
+def obter_perfil(df: pd.DataFrame, dataset_hash: str = None) -> dict:
+    """
+    Retorna o perfil do dataset, usando o cache (memória e disco) quando há um hash.
+    """
+    if dataset_hash is None:
+        return gerar_perfil(df)
+
+    with _perfis_lock:
+        if dataset_hash in _perfis:
+            return _perfis[dataset_hash]
+
+    caminho = os.path.join(DIRETORIO_PERFIS, f"{dataset_hash}.json")
+    perfil = None
+    if os.path.exists(caminho):
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                perfil = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"AVISO: perfil em cache ilegível ({e}); recalculando.")
+
+    if perfil is None:
+        perfil = gerar_perfil(df)
+        try:
+            os.makedirs(DIRETORIO_PERFIS, exist_ok=True)
+            with open(caminho, "w", encoding="utf-8") as f:
+                json.dump(perfil, f, ensure_ascii=False)
+        except OSError as e:
+            print(f"AVISO: não foi possível gravar o perfil em cache: {e}")
+
+    with _perfis_lock:
+        _perfis[dataset_hash] = perfil
+    return perfil
+
+
+def formatar_secao(perfil: dict, secao: str) -> str:
+    """Formata uma seção do perfil (ou as estatísticas de uma coluna) como texto."""
+    if secao == "esquema":
+        linhas = [f"- {c['coluna']} ({c['tipo']}, nulos={c['nulos']})" for c in perfil["esquema"]]
+        return f"{perfil['linhas']} linhas × {perfil['colunas']} colunas ({perfil['memoria_mb']} MB):\n" + "\n".join(linhas)
+
+    if secao == "estatisticas":
+        linhas = []
+        for coluna, estat in perfil["estatisticas"].items():
+            linhas.append(
+                f"- {coluna}: média={estat.get('mean')}, desvio={estat.get('std')}, min={estat.get('min')}, "
+                f"q25={estat.get('25%')}, mediana={estat.get('50%')}, q75={estat.get('75%')}, "
+                f"q99={estat.get('99%')}, max={estat.get('max')}"
+            )
+        return "\n".join(linhas) or "Nenhuma coluna numérica."
+
+    if secao == "classes":
+        if not perfil["coluna_alvo"]:
+            return "Nenhuma coluna alvo (ex: 'Class') foi identificada."
+        linhas = [f"Coluna alvo: {perfil['coluna_alvo']}"]
+        for classe, info in perfil["classes"].items():
+            linhas.append(f"- {classe}: {info['contagem']} linhas ({info['proporcao']:.4%})")
+            if info["medias"]:
+                medias = ", ".join(f"{c}={v}" for c, v in info["medias"].items())
+                linhas.append(f"  médias: {medias}")
+        return "\n".join(linhas)
+
+    if secao == "correlacoes":
+        linhas = ["Pares com maior |correlação| (Pearson):"]
+        linhas += [f"- {a} × {b}: {v}" for a, b, v in perfil["correlacoes"]]
+        if perfil["correlacoes_alvo"]:
+            linhas.append(f"Correlações com {perfil['coluna_alvo']}:")
+            linhas += [f"- {c}: {v}" for c, v in perfil["correlacoes_alvo"]]
+        return "\n".join(linhas)
+
+    if secao in perfil["estatisticas"]:
+        return f"{secao}: " + ", ".join(f"{k}={v}" for k, v in perfil["estatisticas"][secao].items())
+
+    return f"Seção desconhecida: '{secao}'. Use uma de {list(SECOES_PERFIL)} ou o nome de uma coluna numérica."
+
+
+def resumo_para_prompt(perfil: dict, max_colunas: int = 40) -> str:
+    """Gera a versão compacta do perfil que é inserida no prompt do agente."""
+    esquema = perfil["esquema"]
+    colunas = ", ".join(f"{c['coluna']}:{c['tipo']}" for c in esquema[:max_colunas])
+    if len(esquema) > max_colunas:
+        colunas += f", ... (+{len(esquema) - max_colunas} colunas)"
+    total_nulos = sum(c["nulos"] for c in esquema)
+    com_nulos = [f"{c['coluna']}={c['nulos']}" for c in esquema if c["nulos"]]
+
+    linhas = [
+        f"- Formato: {perfil['linhas']} linhas × {perfil['colunas']} colunas ({perfil['memoria_mb']} MB).",
+        f"- Colunas e tipos: {colunas}.",
+        f"- Valores nulos: {total_nulos}" + (f" ({', '.join(com_nulos[:10])})." if com_nulos else "."),
+    ]
+    if perfil["coluna_alvo"]:
+        classes = ", ".join(
+            f"{classe}={info['contagem']} ({info['proporcao']:.4%})" for classe, info in perfil["classes"].items()
+        )
+        linhas.append(f"- Coluna alvo `{perfil['coluna_alvo']}`: {classes}.")
+    if perfil["correlacoes"]:
+        pares = ", ".join(f"{a}×{b}={v}" for a, b, v in perfil["correlacoes"][:5])
+        linhas.append(f"- Correlações mais fortes: {pares}.")
+    if perfil["correlacoes_alvo"]:
+        alvo = ", ".join(f"{c}={v}" for c, v in perfil["correlacoes_alvo"][:5])
+        linhas.append(f"- Correlações com `{perfil['coluna_alvo']}`: {alvo}.")
+    return "\n".join(linhas)
@@ -0,0 +1,100 @@
+# refinement.py
+
+# Refinamento progressivo das respostas do modo aproximado.
+# No modo aproximado o agente itera sobre `df_sample`; depois da resposta, o
+# código executado é repetido em segundo plano sobre todos os dados e o LLM
+# reescreve a resposta com os valores exatos. A interface mostra a resposta
+# aproximada de imediato e a substitui quando o refinamento termina.
+import threading
+
+from tools.execution_context import limpar_codigo
+
+PROMPT_REFINAMENTO = """Você respondeu a uma pergunta sobre um dataset usando uma amostra estratificada (`df_sample`).
+O mesmo código foi reexecutado sobre todos os dados ({linhas} linhas). Reescreva a resposta usando os valores
+exatos da nova saída: remova intervalos de confiança e menções à amostra, mantenha a estrutura, o idioma
+(português) e as tags [CHART_PATH:...]. Se algum valor não aparecer na nova saída, mantenha-o como aproximado.
+Responda apenas com a resposta reescrita.
+
+Pergunta: {pergunta}
+
+Resposta aproximada:
+{resposta}
+
+Saída do código sobre todos os dados:
+{observacao}
+
+Resposta reescrita:"""
+
+
+def codigos_para_refinar(passos: list) -> list:
+    """
+    Códigos do `python_code_executor` que rodaram com sucesso, na ordem, se algum usou `df_sample`.
+    Os passos anteriores entram porque o código final pode depender das variáveis que eles definiram.
+    """
+    codigos = [
+        limpar_codigo(str(acao.tool_input)) for acao, observacao in passos
+        if acao.tool == "python_code_executor" and not str(observacao).lstrip().startswith("Erro")
+    ]
+    return codigos if any("df_sample" in codigo for codigo in codigos) else []
+
+
+class Refinamento:
+    """
+    Reexecuta sobre todos os dados, em uma thread, o código de uma resposta do modo aproximado.
+
+    Args:
+        contexto: O `ContextoExecucao` da sessão.
+        codigos: Os códigos a reexecutar (ver `codigos_para_refinar`).
+        pergunta: A pergunta do usuário.
+        resposta: A resposta aproximada do agente.
+        llm: Modelo usado para reescrever a resposta. Sem ele (ou se a chamada falhar),
+            a saída sobre todos os dados é anexada à resposta aproximada.
+    """
+
+    def __init__(self, contexto, codigos: list, pergunta: str, resposta: str, llm=None):
+        self.contexto = contexto
+        self.codigos = codigos
+        self.pergunta = pergunta
+        self.resposta = resposta
+        self.llm = llm
+        self.resposta_refinada = None
+        self._thread = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def concluido(self) -> bool:
+        return self._thread is not None and not self._thread.is_alive()
+
+    def aguardar(self, timeout_s: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+        return self.resposta_refinada
+
+    def _executar(self):
+        try:
+            observacao = self.contexto.refinar(self.codigos)
+        except Exception as e:
+            print(f"AVISO: falha ao refinar a resposta com todos os dados ({e}).")
+            self.resposta_refinada = self.resposta
+            return
+        if observacao.lstrip().startswith("Erro"):
+            self.resposta_refinada = (f"{self.resposta}\n\n_Não foi possível confirmar os valores com todos os dados:_\n"
+                                      f"{observacao}")
+            return
+
+        reescrita = None
+        if self.llm is not None:
+            try:
+                reescrita = str(self.llm.invoke(PROMPT_REFINAMENTO.format(
+                    linhas=f"{self.contexto.linhas_dataset:,}".replace(",", "."),
+                    pergunta=self.pergunta,
+                    resposta=self.resposta,
+                    observacao=observacao,
+                )).content).strip()
+            except Exception as e:
+                print(f"AVISO: falha ao reescrever a resposta refinada ({e}); anexando a saída completa.")
+        self.resposta_refinada = reescrita or f"{self.resposta}\n\n**Resultado com todos os dados:**\n{observacao}"
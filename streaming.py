@@ -0,0 +1,109 @@
+# streaming.py
+
+# Execução do agente em segundo plano, com os eventos (tokens do LLM, ações e
+# observações) publicados em uma fila à medida que são produzidos. A interface
+# consome a fila na thread do Streamlit e pode cancelar a execução a qualquer momento.
+import queue
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class ExecucaoCancelada(Exception):
+    """Levantada dentro da execução do agente quando o usuário a cancela."""
+
+
+class CallbackFila(BaseCallbackHandler):
+    """Publica os eventos do agente em uma fila e interrompe a execução se cancelada."""
+
+    # Sem isso, o LangChain engoliria a ExecucaoCancelada levantada nos callbacks
+    raise_error = True
+
+    def __init__(self, fila: queue.Queue, cancelamento: threading.Event):
+        self.fila = fila
+        self.cancelamento = cancelamento
+
+    def _verificar_cancelamento(self):
+        if self.cancelamento.is_set():
+            raise ExecucaoCancelada()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._verificar_cancelamento()
+        self.fila.put(("llm_inicio",))
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._verificar_cancelamento()
+        self.fila.put(("llm_inicio",))
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self._verificar_cancelamento()
+        self.fila.put(("token", token))
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self._verificar_cancelamento()
+        self.fila.put(("ferramenta", (serialized or {}).get("name", "ferramenta"), input_str))
+
+
+class ExecucaoStreaming:
+    """
+    Executa `agente.stream(entrada)` em uma thread e expõe os eventos produzidos.
+
+    Eventos (tuplas cujo primeiro item é o tipo):
+        ("llm_inicio",), ("token", texto), ("ferramenta", nome, entrada),
+        ("passo", acao, observacao), ("saida", texto), ("cancelado",), ("erro", exceção)
+    """
+
+    def __init__(self, agente, entrada: dict, contexto=None, callbacks: list = None):
+        self.agente = agente
+        self.entrada = entrada
+        self.contexto = contexto
+        self.callbacks = callbacks or []
+        self.fila = queue.Queue()
+        self.cancelamento = threading.Event()
+        self.concluida = False
+        self._thread = None
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+        return self
+
+    def _executar(self):
+        callback = CallbackFila(self.fila, self.cancelamento)
+        try:
+            for chunk in self.agente.stream(self.entrada, config={"callbacks": [callback] + self.callbacks}):
+                for passo in chunk.get("steps", []):
+                    self.fila.put(("passo", passo.action, passo.observation))
+                if "output" in chunk:
+                    self.fila.put(("saida", chunk["output"]))
+        except ExecucaoCancelada:
+            self.fila.put(("cancelado",))
+        except Exception as e:
+            if self.cancelamento.is_set():
+                self.fila.put(("cancelado",))
+            else:
+                self.fila.put(("erro", e))
+        finally:
+            self.fila.put(("fim",))
+
+    def eventos(self, intervalo_s: float = 0.1):
+        """
+        Gera os eventos até o fim da execução. Gera None a cada `intervalo_s` sem
+        eventos, para que o chamador possa atualizar a interface (e ser interrompido).
+        """
+        while True:
+            try:
+                evento = self.fila.get(timeout=intervalo_s)
+            except queue.Empty:
+                yield None
+                continue
+            if evento[0] == "fim":
+                self.concluida = True
+                return
+            yield evento
+
+    def cancelar(self):
+        """Pede a interrupção: no próximo callback do agente e, no modo sandbox, também do código em execução."""
+        self.cancelamento.set()
+        if self.contexto is not None:
+            self.contexto.cancelar()
@@ -0,0 +1,408 @@
+# telemetry.py
+
+# Instrumentação de desempenho de cada turno (pergunta) do agente.
+# Um callback do LangChain registra, por ciclo (chamada ao LLM + ferramenta):
+# o tempo do LLM e do primeiro token, os tokens de prompt e de resposta, o tempo
+# da ferramenta e dos gráficos e os acertos de cache; a interface acrescenta o
+# tempo de renderização. Ao final do turno, o registro é mostrado no painel de
+# desempenho, anexado a um arquivo JSONL e exportado como spans no formato
+# OTLP/JSON do OpenTelemetry (arquivo e, opcionalmente, um coletor via HTTP).
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from chat_history import estimar_tokens
+from tools.sandbox import memoria_rss_mb
+
+CAMINHO_TRACE = os.getenv("EDA_TELEMETRIA_PATH", os.path.join(".cache", "telemetria.jsonl"))
+CAMINHO_OTLP = os.getenv("EDA_TELEMETRIA_OTLP_PATH", os.path.join(".cache", "telemetria_otlp.jsonl"))
+# Ex: http://localhost:4318/v1/traces (coletor OpenTelemetry com o receptor OTLP/HTTP)
+ENDPOINT_OTLP = os.getenv("EDA_TELEMETRIA_OTLP_ENDPOINT", "")
+LIMITE_ARQUIVO_MB = int(os.getenv("EDA_TELEMETRIA_MAX_MB", "64"))
+NOME_SERVICO = "agente-analise-dados"
+_INTERVALO_MEMORIA_S = 0.05
+_FERRAMENTAS_EXECUCAO = ("python_code_executor", "consultar_sql")
+
+_lock_arquivos = threading.Lock()
+
+
+def telemetria_habilitada() -> bool:
+    """Indica se os turnos são gravados em arquivo (variável EDA_TELEMETRIA, padrão ativada)."""
+    return os.getenv("EDA_TELEMETRIA", "1").lower() in ("1", "true", "sim")
+
+
+class MonitorMemoria:
+    """Amostra a memória residente do processo em uma thread, para obter o pico durante o turno."""
+
+    def __init__(self, intervalo_s: float = _INTERVALO_MEMORIA_S):
+        self.intervalo_s = intervalo_s
+        self.inicial_mb = None
+        self.pico_mb = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        self.inicial_mb = self.pico_mb = memoria_rss_mb(os.getpid())
+        if self.inicial_mb is not None:
+            self._thread = threading.Thread(target=self._amostrar, daemon=True)
+            self._thread.start()
+        return self
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo_s):
+            atual = memoria_rss_mb(os.getpid())
+            if atual is not None and atual > self.pico_mb:
+                self.pico_mb = atual
+
+    def parar(self) -> dict:
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.inicial_mb is None:
+            return {"inicial_mb": None, "pico_mb": None, "delta_pico_mb": None}
+        return {
+            "inicial_mb": round(self.inicial_mb, 1),
+            "pico_mb": round(self.pico_mb, 1),
+            "delta_pico_mb": round(self.pico_mb - self.inicial_mb, 1),
+        }
+
+
+def _novo_id(bytes_: int) -> str:
+    return secrets.token_hex(bytes_)
+
+
+def _agora_ns() -> int:
+    return time.time_ns()
+
+
+class TelemetriaTurno(BaseCallbackHandler):
+    """
+    Registra o desempenho de um turno do agente.
+
+    Passe a instância nos `callbacks` da execução e chame `finalizar` ao término.
+    Os tempos de renderização da interface são medidos com `medir_renderizacao`.
+
+    Args:
+        contexto: O `ContextoExecucao` da sessão, de onde vêm as métricas de cache e gráficos.
+        provedor: Provedor do LLM.
+        modelo: Nome do modelo.
+        pergunta: A pergunta do usuário (só o tamanho é registrado).
+    """
+
+    def __init__(self, contexto=None, provedor: str = "", modelo: str = "", pergunta: str = ""):
+        self.contexto = contexto
+        self.provedor = provedor
+        self.modelo = modelo
+        self.tamanho_pergunta = len(pergunta)
+        self.trace_id = _novo_id(16)
+        self.span_raiz = _novo_id(8)
+        self.ciclos = []
+        self.spans = []
+        self.registro = None
+        self._inicio_ns = None
+        self._inicio = None
+        self._abertos = {}
+        self._renderizacao_fora_ciclos = 0.0
+        self._memoria = MonitorMemoria()
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        self._inicio_ns = _agora_ns()
+        self._inicio = time.perf_counter()
+        self._memoria.iniciar()
+        return self
+
+    def _ciclo_atual(self) -> dict:
+        if not self.ciclos:
+            self._novo_ciclo()
+        return self.ciclos[-1]
+
+    def _novo_ciclo(self) -> dict:
+        ciclo = {
+            "indice": len(self.ciclos) + 1,
+            "llm_s": 0.0, "primeiro_token_s": None, "espera_limite_s": 0.0, "retentativas_llm": 0, "fallback_llm": False,
+            "tokens_prompt": 0, "tokens_resposta": 0, "tokens_estimados": False, "cache_llm": False,
+            "ferramenta": None, "ferramenta_s": 0.0, "cache_execucao": None,
+            "graficos": 0, "graficos_s": 0.0, "renderizacao_s": 0.0,
+        }
+        self.ciclos.append(ciclo)
+        return ciclo
+
+    def _abrir_span(self, run_id, nome: str, atributos: dict = None):
+        self._abertos[run_id] = {
+            "span_id": _novo_id(8), "nome": nome, "inicio_ns": _agora_ns(),
+            "inicio": time.perf_counter(), "atributos": atributos or {},
+        }
+
+    def _fechar_span(self, run_id, atributos: dict = None, erro: str = None):
+        span = self._abertos.pop(run_id, None)
+        if span is None:
+            return None
+        span["fim_ns"] = _agora_ns()
+        span["duracao_s"] = time.perf_counter() - span["inicio"]
+        span["atributos"].update(atributos or {})
+        span["erro"] = erro
+        self.spans.append(span)
+        return span
+
+    # --- Callbacks do LLM ---
+
+    def _inicio_llm(self, run_id, tokens_prompt: int):
+        with self._lock:
+            ciclo = self._novo_ciclo()
+            ciclo["tokens_prompt"] = tokens_prompt
+            self._abrir_span(run_id, "llm", {"eda.ciclo": ciclo["indice"]})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        texto = "".join(str(m.content) for lista in messages for m in lista)
+        self._inicio_llm(run_id, estimar_tokens(texto))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._inicio_llm(run_id, estimar_tokens("".join(prompts)))
+
+    def on_llm_new_token(self, token: str, *, run_id, **kwargs):
+        with self._lock:
+            span = self._abertos.get(run_id)
+            ciclo = self._ciclo_atual()
+            if span is not None and ciclo["primeiro_token_s"] is None:
+                ciclo["primeiro_token_s"] = time.perf_counter() - span["inicio"]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            ciclo = self._ciclo_atual()
+            geracao = response.generations[0][0] if response.generations and response.generations[0] else None
+            mensagem = getattr(geracao, "message", None)
+            uso = getattr(mensagem, "usage_metadata", None)
+            uso_provedor = (response.llm_output or {}).get("token_usage") or {}
+            if uso:
+                ciclo["tokens_prompt"], ciclo["tokens_resposta"] = uso["input_tokens"], uso["output_tokens"]
+            elif uso_provedor.get("prompt_tokens") is not None:
+                ciclo["tokens_prompt"] = uso_provedor["prompt_tokens"]
+                ciclo["tokens_resposta"] = uso_provedor.get("completion_tokens", 0)
+            else:
+                # O provedor não informou o uso: estimativa pelo tamanho do texto
+                ciclo["tokens_resposta"] = estimar_tokens(geracao.text) if geracao is not None else 0
+                ciclo["tokens_estimados"] = True
+            metadados = getattr(mensagem, "response_metadata", {})
+            ciclo["cache_llm"] = bool(metadados.get("cache_llm"))
+            # Tempo na fila do limite de chamadas simultâneas ao provedor (llm_limits.py), incluído em llm_s
+            ciclo["espera_limite_s"] = float(metadados.get("espera_limite_s", 0.0))
+            # Retentativas e resposta do LLM alternativo (llm_gateway.py)
+            ciclo["retentativas_llm"] = max(0, int(metadados.get("tentativas_llm", 1)) - 1)
+            ciclo["fallback_llm"] = bool(metadados.get("fallback_llm"))
+            span = self._fechar_span(run_id, {
+                "gen_ai.system": self.provedor,
+                "gen_ai.request.model": self.modelo,
+                "gen_ai.usage.input_tokens": ciclo["tokens_prompt"],
+                "gen_ai.usage.output_tokens": ciclo["tokens_resposta"],
+                "eda.tokens_estimados": ciclo["tokens_estimados"],
+                "eda.cache_llm": ciclo["cache_llm"],
+                "eda.espera_limite_s": ciclo["espera_limite_s"],
+                "eda.retentativas_llm": ciclo["retentativas_llm"],
+                "eda.fallback_llm": ciclo["fallback_llm"],
+            })
+            if span is not None:
+                ciclo["llm_s"] += span["duracao_s"]
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._fechar_span(run_id, erro=repr(error))
+
+    # --- Callbacks das ferramentas ---
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        nome = (serialized or {}).get("name", "ferramenta")
+        with self._lock:
+            ciclo = self._ciclo_atual()
+            ciclo["ferramenta"] = nome
+            self._abrir_span(run_id, f"ferramenta {nome}", {"eda.ciclo": ciclo["indice"], "eda.ferramenta": nome})
+        if self.contexto is not None:
+            self.contexto.metricas_execucao = {}
+
+    def on_tool_end(self, output, *, run_id, erro: str = None, **kwargs):
+        metricas = {}
+        if self.contexto is not None:
+            metricas = dict(self.contexto.metricas_execucao)
+        with self._lock:
+            ciclo = self._ciclo_atual()
+            if ciclo["ferramenta"] in _FERRAMENTAS_EXECUCAO and metricas:
+                ciclo["cache_execucao"] = metricas.get("cache")
+                ciclo["graficos"] = metricas.get("graficos", 0)
+                ciclo["graficos_s"] = metricas.get("graficos_s", 0.0)
+            span = self._fechar_span(run_id, {
+                "eda.cache_execucao": ciclo["cache_execucao"],
+                "eda.graficos": ciclo["graficos"],
+                "eda.graficos_s": ciclo["graficos_s"],
+            }, erro=erro)
+            if span is not None:
+                ciclo["ferramenta_s"] += span["duracao_s"]
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.on_tool_end(None, run_id=run_id, erro=repr(error))
+
+    # --- Interface ---
+
+    @contextmanager
+    def medir_renderizacao(self, ciclo: int = None):
+        """Mede a renderização na interface; sem `ciclo`, o tempo conta só no total do turno."""
+        chave = object()
+        with self._lock:
+            self._abrir_span(chave, "renderizacao", {"eda.ciclo": ciclo} if ciclo else {})
+        try:
+            yield
+        finally:
+            with self._lock:
+                span = self._fechar_span(chave)
+                if ciclo and 0 < ciclo <= len(self.ciclos):
+                    self.ciclos[ciclo - 1]["renderizacao_s"] += span["duracao_s"]
+                else:
+                    self._renderizacao_fora_ciclos += span["duracao_s"]
+
+    def finalizar(self, status: str = "ok", dataset_hash: str = None) -> dict:
+        """Encerra o turno, monta o registro e o exporta (JSONL e OTLP). Retorna o registro."""
+        if self.registro is not None:
+            return self.registro
+        duracao = time.perf_counter() - self._inicio
+        fim_ns = _agora_ns()
+        memoria = self._memoria.parar()
+        with self._lock:
+            ciclos = [dict(c) for c in self.ciclos]
+            spans = list(self.spans)
+        renderizacao = sum(c["renderizacao_s"] for c in ciclos) + self._renderizacao_fora_ciclos
+        totais = {
+            "llm_s": sum(c["llm_s"] for c in ciclos),
+            "espera_limite_s": sum(c["espera_limite_s"] for c in ciclos),
+            "ferramentas_s": sum(c["ferramenta_s"] for c in ciclos),
+            "graficos_s": sum(c["graficos_s"] for c in ciclos),
+            "renderizacao_s": renderizacao,
+            "chamadas_llm": len(ciclos),
+            "tokens_prompt": sum(c["tokens_prompt"] for c in ciclos),
+            "tokens_resposta": sum(c["tokens_resposta"] for c in ciclos),
+            "acertos_cache_llm": sum(1 for c in ciclos if c["cache_llm"]),
+            "acertos_cache_execucao": sum(1 for c in ciclos if c["cache_execucao"]),
+            "retentativas_llm": sum(c["retentativas_llm"] for c in ciclos),
+            "respostas_fallback_llm": sum(1 for c in ciclos if c["fallback_llm"]),
+        }
+        # O restante é do agente (parsing, montagem do prompt) e da espera entre os eventos
+        totais["outros_s"] = max(duracao - totais["llm_s"] - totais["ferramentas_s"] - renderizacao, 0.0)
+        self.registro = {
+            "trace_id": self.trace_id,
+            "inicio": datetime.fromtimestamp(self._inicio_ns / 1e9, timezone.utc).isoformat(),
+            "duracao_s": duracao,
+            "status": status,
+            "sessao": getattr(self.contexto, "id", None),
+            "dataset_hash": dataset_hash or getattr(self.contexto, "dataset_hash", None),
+            "provedor": self.provedor,
+            "modelo": self.modelo,
+            "tamanho_pergunta": self.tamanho_pergunta,
+            "totais": totais,
+            "memoria": memoria,
+            "ciclos": ciclos,
+        }
+        if telemetria_habilitada():
+            exportar(self.registro, spans_otlp(self.registro, spans, self._inicio_ns, fim_ns, self.span_raiz))
+        return self.registro
+
+
+# --- Exportação ---
+
+def _valor_otlp(valor) -> dict:
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+def _atributos_otlp(atributos: dict) -> list:
+    return [{"key": chave, "value": _valor_otlp(valor)} for chave, valor in atributos.items() if valor is not None]
+
+
+def spans_otlp(registro: dict, spans: list, inicio_ns: int, fim_ns: int, span_raiz: str) -> dict:
+    """Monta o payload OTLP/JSON (ExportTraceServiceRequest) do turno: um span raiz e um por etapa."""
+    totais = registro["totais"]
+    raiz = {
+        "traceId": registro["trace_id"],
+        "spanId": span_raiz,
+        "name": "turno do agente",
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(inicio_ns),
+        "endTimeUnixNano": str(fim_ns),
+        "attributes": _atributos_otlp({
+            "eda.status": registro["status"],
+            "eda.sessao": registro["sessao"],
+            "eda.dataset_hash": registro["dataset_hash"],
+            "gen_ai.system": registro["provedor"],
+            "gen_ai.request.model": registro["modelo"],
+            "gen_ai.usage.input_tokens": totais["tokens_prompt"],
+            "gen_ai.usage.output_tokens": totais["tokens_resposta"],
+            "eda.memoria.delta_pico_mb": registro["memoria"]["delta_pico_mb"],
+            "eda.acertos_cache_llm": totais["acertos_cache_llm"],
+            "eda.acertos_cache_execucao": totais["acertos_cache_execucao"],
+        }),
+        "status": {"code": 1 if registro["status"] == "ok" else 2},
+    }
+    filhos = []
+    for span in spans:
+        filho = {
+            "traceId": registro["trace_id"],
+            "spanId": span["span_id"],
+            "parentSpanId": span_raiz,
+            "name": span["nome"],
+            "kind": 3 if span["nome"] == "llm" else 1,  # SPAN_KIND_CLIENT para chamadas ao provedor
+            "startTimeUnixNano": str(span["inicio_ns"]),
+            "endTimeUnixNano": str(span["fim_ns"]),
+            "attributes": _atributos_otlp(span["atributos"]),
+            "status": {"code": 2, "message": span["erro"]} if span.get("erro") else {"code": 1},
+        }
+        filhos.append(filho)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _atributos_otlp({"service.name": NOME_SERVICO})},
+            "scopeSpans": [{"scope": {"name": "telemetry"}, "spans": [raiz] + filhos}],
+        }]
+    }
+
+
+def _anexar_linha(caminho: str, objeto: dict):
+    """Anexa uma linha JSON ao arquivo, rotacionando-o (para .1) ao passar do limite de tamanho."""
+    diretorio = os.path.dirname(caminho)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    if os.path.exists(caminho) and os.path.getsize(caminho) > LIMITE_ARQUIVO_MB * 1024 ** 2:
+        os.replace(caminho, caminho + ".1")
+    with open(caminho, "a", encoding="utf-8") as f:
+        f.write(json.dumps(objeto, ensure_ascii=False) + "\n")
+
+
+def _enviar_otlp(payload: dict):
+    try:
+        requisicao = urllib.request.Request(
+            ENDPOINT_OTLP, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        urllib.request.urlopen(requisicao, timeout=5).close()
+    except Exception as e:
+        print(f"AVISO: falha ao enviar a telemetria ao coletor OTLP ({e}).")
+
+
+def exportar(registro: dict, payload_otlp: dict):
+    """Grava o turno no trace JSONL e os spans no arquivo OTLP; envia ao coletor, se configurado."""
+    try:
+        with _lock_arquivos:
+            _anexar_linha(CAMINHO_TRACE, registro)
+            _anexar_linha(CAMINHO_OTLP, payload_otlp)
+    except OSError as e:
+        print(f"AVISO: não foi possível gravar a telemetria: {e}")
+    if ENDPOINT_OTLP:
+        # O envio não atrasa a resposta ao usuário
+        threading.Thread(target=_enviar_otlp, args=(payload_otlp,), daemon=True).start()
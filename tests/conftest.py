@@ -0,0 +1,12 @@
+# tests/conftest.py
+
+# Permite importar os módulos da aplicação (que ficam na raiz do repositório) nos testes
+# e ativa a cópia na escrita do pandas, como na inicialização da aplicação.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.versioning import ativar_copia_na_escrita  # noqa: E402
+
+ativar_copia_na_escrita()
@@ -0,0 +1,202 @@
+# tests/stub_llm.py
+
+# Servidor HTTP local compatível com a API de chat da OpenAI (/v1/chat/completions),
+# para testar a camada de resiliência (llm_gateway.py) sem rede nem chave de API.
+# Cada modelo tem o seu comportamento: taxa de 429 e de 5xx, latência com uma
+# cauda lenta e, para testes determinísticos, um roteiro de respostas consumido
+# em ordem ("429", "503" ou outro status HTTP, "lento", "corte", "ok"). Suporta streaming (SSE).
+#
+# Uso avulso, para medir a latência com a aplicação ou o batch.py:
+#   python tests/stub_llm.py --porta 8080 --taxa-429 0.15 --taxa-cauda 0.1 --latencia-cauda 3
+#   EDA_LLM_BASE_URL="OpenAI=http://127.0.0.1:8080/v1" OPENAI_API_KEY=x python batch.py ...
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ComportamentoModelo:
+    """
+    Como o servidor responde às requisições de um modelo.
+
+    Args:
+        taxa_429: Fração das requisições respondidas com 429 (com `Retry-After`).
+        taxa_5xx: Fração das requisições respondidas com 503.
+        latencia_s: Latência normal, antes da resposta (ou do primeiro token).
+        taxa_cauda: Fração das requisições com a latência da cauda.
+        latencia_cauda_s: Latência das requisições lentas.
+        retry_after_s: Valor do cabeçalho `Retry-After` dos 429.
+        roteiro: Respostas das primeiras requisições, em ordem, antes das taxas valerem.
+        resposta: Texto da resposta (padrão: uma Final Answer com o nome do modelo).
+    """
+
+    def __init__(self, taxa_429: float = 0.0, taxa_5xx: float = 0.0, latencia_s: float = 0.0,
+                 taxa_cauda: float = 0.0, latencia_cauda_s: float = 0.0, retry_after_s: float = 0.2,
+                 roteiro: list = None, resposta: str = None):
+        self.taxa_429 = taxa_429
+        self.taxa_5xx = taxa_5xx
+        self.latencia_s = latencia_s
+        self.taxa_cauda = taxa_cauda
+        self.latencia_cauda_s = latencia_cauda_s
+        self.retry_after_s = retry_after_s
+        self.roteiro = list(roteiro or [])
+        self.resposta = resposta
+
+    def proxima(self) -> str:
+        if self.roteiro:
+            return self.roteiro.pop(0)
+        sorteio = random.random()
+        if sorteio < self.taxa_429:
+            return "429"
+        if sorteio < self.taxa_429 + self.taxa_5xx:
+            return "503"
+        return "lento" if random.random() < self.taxa_cauda else "ok"
+
+
+class ServidorStubLLM:
+    """
+    Servidor stub em uma thread, para usar nos testes (`with ServidorStubLLM() as servidor:`).
+
+    Args:
+        modelos: Comportamento por nome de modelo; os demais usam `padrao`.
+        padrao: Comportamento dos modelos não listados.
+        porta: Porta local (0 escolhe uma livre).
+    """
+
+    def __init__(self, modelos: dict = None, padrao: ComportamentoModelo = None, porta: int = 0):
+        self.modelos = dict(modelos or {})
+        self.padrao = padrao or ComportamentoModelo()
+        # (instante de chegada, modelo, resposta escolhida) de cada requisição
+        self.requisicoes = []
+        self._lock = threading.Lock()
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", porta), _criar_manipulador(self))
+        self._servidor.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._servidor.server_port}/v1"
+
+    def requisicoes_do_modelo(self, modelo: str) -> list:
+        with self._lock:
+            return [r for r in self.requisicoes if r[1] == modelo]
+
+    def _registrar(self, modelo: str) -> tuple:
+        with self._lock:
+            comportamento = self.modelos.get(modelo, self.padrao)
+            acao = comportamento.proxima()
+            self.requisicoes.append((time.monotonic(), modelo, acao))
+            return comportamento, acao
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True, name="stub-llm")
+        self._thread.start()
+        return self
+
+    def encerrar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.encerrar()
+
+
+def _criar_manipulador(stub: ServidorStubLLM):
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def handle(self):
+            # O cliente abandona requisições (hedging, cancelamento): não é um erro do stub
+            try:
+                super().handle()
+            except (ConnectionError, OSError):
+                pass
+
+        def _json(self, status: int, corpo: dict, cabecalhos: dict = None):
+            dados = json.dumps(corpo).encode("utf-8")
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(dados)))
+            for nome, valor in (cabecalhos or {}).items():
+                self.send_header(nome, valor)
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def _pedaco(self, evento: str):
+            dados = f"data: {evento}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(dados):x}\r\n".encode() + dados + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            corpo = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))))
+            modelo = corpo.get("model", "")
+            comportamento, acao = stub._registrar(modelo)
+            if acao == "429":
+                self._json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                           {"retry-after": str(comportamento.retry_after_s)})
+                return
+            if acao.isdigit():
+                self._json(int(acao), {"error": {"message": f"Erro {acao} do stub", "type": "server_error"}})
+                return
+            time.sleep(comportamento.latencia_cauda_s if acao == "lento" else comportamento.latencia_s)
+            texto = comportamento.resposta or f"Thought: Agora eu sei a resposta final.\nFinal Answer: resposta de {modelo}"
+            if not corpo.get("stream"):
+                self._json(200, {
+                    "id": "stub", "object": "chat.completion", "created": 0, "model": modelo,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": texto}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": len(texto.split()), "total_tokens": 10},
+                })
+                return
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            palavras = texto.split(" ")
+            for i, palavra in enumerate(palavras):
+                if acao == "corte" and i == 2:
+                    # Encerra a conexão no meio do streaming, sem o fim da mensagem
+                    self.close_connection = True
+                    return
+                self._pedaco(json.dumps({
+                    "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": modelo,
+                    "choices": [{"index": 0, "delta": {"content": palavra + (" " if i < len(palavras) - 1 else "")},
+                                 "finish_reason": None}],
+                }))
+            self._pedaco(json.dumps({"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": modelo,
+                                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+            self._pedaco("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Manipulador
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local compatível com a API de chat da OpenAI.")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--taxa-5xx", type=float, default=0.0)
+    parser.add_argument("--latencia", type=float, default=0.1, help="Latência normal (s).")
+    parser.add_argument("--taxa-cauda", type=float, default=0.0, help="Fração de requisições lentas.")
+    parser.add_argument("--latencia-cauda", type=float, default=3.0, help="Latência das requisições lentas (s).")
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    padrao = ComportamentoModelo(args.taxa_429, args.taxa_5xx, args.latencia, args.taxa_cauda,
+                                 args.latencia_cauda, args.retry_after)
+    servidor = ServidorStubLLM(padrao=padrao, porta=args.porta)
+    print(f"Servidor stub em {servidor.url}")
+    try:
+        servidor._servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# tests/test_batch.py
+
+# Testes do processamento em lote: ids de perguntas e ordem dos resultados.
+import json
+import time
+
+import pandas as pd
+import pytest
+
+from batch import ProcessadorLote, ler_perguntas
+
+
+def _gravar_jsonl(caminho, itens):
+    caminho.write_text("\n".join(json.dumps(item, ensure_ascii=False) for item in itens) + "\n", encoding="utf-8")
+    return str(caminho)
+
+
+def test_ler_perguntas_numera_as_linhas_sem_id(tmp_path):
+    caminho = _gravar_jsonl(tmp_path / "p.jsonl", [{"pergunta": "a"}, {"id": "x", "question": "b"}, "c"])
+    perguntas = ler_perguntas(caminho)
+    assert [(p["id"], p["pergunta"]) for p in perguntas] == [("1", "a"), ("x", "b"), ("3", "c")]
+
+
+@pytest.mark.parametrize("itens", [
+    [{"id": "a", "pergunta": "1"}, {"id": "a", "pergunta": "2"}],
+    # O id explícito 2 colide com o número da segunda linha, que não tem id
+    [{"id": 2, "pergunta": "1"}, {"pergunta": "2"}],
+])
+def test_ler_perguntas_rejeita_ids_repetidos(tmp_path, itens):
+    with pytest.raises(ValueError, match="repetido"):
+        ler_perguntas(_gravar_jsonl(tmp_path / "p.jsonl", itens))
+
+
+def test_executar_rejeita_ids_repetidos():
+    processador = ProcessadorLote(pd.DataFrame({"a": [1]}), "hash", provedor="Teste", paralelo=2)
+    with pytest.raises(ValueError, match="repetido"):
+        processador.executar([{"id": "a", "pergunta": "1"}, {"id": "a", "pergunta": "2"}])
+
+
+def test_executar_retorna_resultados_na_ordem_das_perguntas(monkeypatch):
+    processador = ProcessadorLote(pd.DataFrame({"a": [1]}), "hash", provedor="Teste", paralelo=4)
+
+    def responder(pergunta):
+        # As primeiras perguntas terminam por último
+        time.sleep(0.05 * (4 - int(pergunta["id"])))
+        return {"id": pergunta["id"], "status": "ok", "tempos": {}}
+
+    monkeypatch.setattr(processador, "responder", responder)
+    concluidos = []
+    resultados = processador.executar([{"id": str(i), "pergunta": "p"} for i in range(4)],
+                                      ao_concluir=lambda r: concluidos.append(r["id"]))
+    assert [r["id"] for r in resultados] == ["0", "1", "2", "3"]
+    assert concluidos == ["3", "2", "1", "0"]
+
+
+@pytest.mark.parametrize("pergunta_id, arquivo", [
+    ("../fora", ".._fora_grafico.png"),
+    ("a/b", "a_b_grafico.png"),
+    ("q 1", "q_1_grafico.png"),
+])
+def test_graficos_ficam_no_diretorio_mesmo_com_id_inseguro(tmp_path, pergunta_id, arquivo):
+    from types import SimpleNamespace
+    from tools.charts import ArmazemGraficos
+
+    graficos = ArmazemGraficos()
+    graficos.guardar("grafico.png", b"\x89PNG")
+    diretorio = tmp_path / "graficos"
+    processador = ProcessadorLote(pd.DataFrame({"a": [1]}), "hash", provedor="Teste", dir_graficos=str(diretorio))
+    caminhos = processador._gravar_graficos(pergunta_id, SimpleNamespace(graficos=graficos))
+    assert caminhos == [str(diretorio / arquivo)]
+    assert sorted(p.name for p in tmp_path.rglob("*.png")) == [arquivo]
+
+
+def test_ler_perguntas_rejeita_ids_com_o_mesmo_prefixo_de_arquivo(tmp_path):
+    with pytest.raises(ValueError, match="mesmo nome de arquivo"):
+        ler_perguntas(_gravar_jsonl(tmp_path / "p.jsonl", [{"id": "a/b", "pergunta": "1"}, {"id": "a_b", "pergunta": "2"}]))
@@ -0,0 +1,37 @@
+# tests/test_benchmark.py
+
+# Testes da comparação com a baseline do benchmark: só métricas estáveis
+# (memória e mediana/mínimo das repetições) reprovam.
+from benchmark import comparar
+
+
+def _resultado(frio: float, mediana: float, p95: float, minimo: float, memoria: float = 100.0) -> dict:
+    return {"resultados": {"10000": {
+        "ingestao_s": {"fria": frio, "cache": 0.01},
+        "memoria_pico_mb": {"total": memoria},
+        "cenarios": {"sql": {"turno_s": {"frio": frio, "mediana": mediana, "p95": p95, "min": minimo}}},
+    }}}
+
+
+def test_tempo_frio_nao_reprova():
+    comparacao = comparar(_resultado(0.100, 0.020, 0.021, 0.019), _resultado(0.050, 0.020, 0.021, 0.019))
+    assert not comparacao["regressoes"]
+    metricas = {item["metrica"] for item in comparacao["informativas"]}
+    assert "10000/cenarios/sql/turno_s/frio" in metricas
+
+
+def test_mediana_acima_da_dispersao_reprova():
+    comparacao = comparar(_resultado(0.5, 0.300, 0.310, 0.290), _resultado(0.5, 0.200, 0.210, 0.190))
+    assert [item["metrica"] for item in comparacao["regressoes"]] == ["10000/cenarios/sql/turno_s/mediana",
+                                                                      "10000/cenarios/sql/turno_s/min"]
+
+
+def test_variacao_dentro_da_dispersao_e_ruido():
+    # Repetições espalhadas entre 0,1 s e 0,4 s: 0,25 s -> 0,32 s não é uma regressão
+    comparacao = comparar(_resultado(0.5, 0.32, 0.40, 0.10), _resultado(0.5, 0.25, 0.40, 0.10))
+    assert not comparacao["regressoes"]
+
+
+def test_memoria_reprova():
+    comparacao = comparar(_resultado(0.5, 0.2, 0.2, 0.2, memoria=200.0), _resultado(0.5, 0.2, 0.2, 0.2))
+    assert [item["metrica"] for item in comparacao["regressoes"]] == ["10000/memoria_pico_mb/total"]
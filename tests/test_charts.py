@@ -0,0 +1,38 @@
+# tests/test_charts.py
+
+# Testes da amostragem dos auxiliares de plotagem: o limite de linhas vale mesmo
+# com muitos estratos, e os estratos raros continuam representados.
+import numpy as np
+import pandas as pd
+
+from tools.charts import amostrar
+from tools.sampling import MIN_LINHAS_CATEGORIA
+
+
+def test_amostra_estratificada_respeita_max_linhas_com_muitos_estratos():
+    df = pd.DataFrame({"estrato": np.repeat(np.arange(100), 10_000), "valor": np.arange(1_000_000)})
+    amostra = amostrar(df, max_linhas=20_000, coluna_estrato="estrato")
+    assert len(amostra) <= 20_000
+    contagens = amostra["estrato"].value_counts()
+    assert len(contagens) == 100
+    # Estratos do mesmo tamanho recebem a mesma parte da amostra
+    assert contagens.max() - contagens.min() <= 1
+
+
+def test_amostra_estratificada_mantem_estratos_raros():
+    df = pd.DataFrame({"classe": [0] * 200_000 + [1] * 3, "valor": np.arange(200_003)})
+    amostra = amostrar(df, max_linhas=1_000, coluna_estrato="classe")
+    assert len(amostra) <= 1_000
+    assert (amostra["classe"] == 1).sum() == min(3, MIN_LINHAS_CATEGORIA)
+    assert amostra.index.is_monotonic_increasing
+
+
+def test_mais_estratos_que_o_limite():
+    df = pd.DataFrame({"estrato": np.arange(50_000) % 5_000, "valor": np.arange(50_000)})
+    assert len(amostrar(df, max_linhas=1_000, coluna_estrato="estrato")) == 1_000
+
+
+def test_sem_estrato_e_dados_pequenos():
+    df = pd.DataFrame({"valor": np.arange(30_000)})
+    assert len(amostrar(df, max_linhas=1_000)) == 1_000
+    assert amostrar(df, max_linhas=50_000) is df
@@ -0,0 +1,78 @@
+# tests/test_execution_cache.py
+
+# Testes da análise de código do cache de execução: código que altera o escopo
+# não pode ser servido pelo cache com o resultado do estado anterior.
+import uuid
+
+import pandas as pd
+import pytest
+
+from tools.execution_cache import analisar_codigo
+from tools.execution_context import ContextoExecucao, PREFIXO_CACHE
+
+
+@pytest.mark.parametrize("codigo", [
+    "x.sort()",
+    "x.reverse()",
+    "s.add(5)",
+    "s.discard(5)",
+    "d.popitem()",
+    "fila.appendleft(1)",
+    "a.fill(0)",
+    "np.random.shuffle(a)",
+    "np.random.seed(0)",
+    "random.shuffle(x)",
+    "df.sort_values('a', inplace=True)",
+    "print(x.pop())",
+    "for item in itens:\n    item.atualizar()",
+    "plt.rcParams.update({'font.size': 8})",
+])
+def test_chamadas_com_efeito_colateral_alteram_estado(codigo):
+    canonico, altera_estado = analisar_codigo(codigo)
+    assert canonico is not None
+    assert altera_estado
+
+
+@pytest.mark.parametrize("codigo", [
+    "print(x)",
+    "print(df['a'].mean())",
+    "display(df.head())",
+    "df.describe()",
+    "df.info()",
+    "df['a'].hist()",
+    "plt.title('Distribuição')\nplt.savefig('grafico.png')",
+    "sns.histplot(df['a'])",
+    "histograma(df['a'])",
+    "print([v * 2 for v in df['a']])",
+])
+def test_codigo_puro_pode_ser_cacheado(codigo):
+    canonico, altera_estado = analisar_codigo(codigo)
+    assert canonico is not None
+    assert not altera_estado
+
+
+@pytest.mark.parametrize("definicao, alteracao, esperado", [
+    ("x = [3, 1, 2]", "x.sort()", "[1, 2, 3]"),
+    ("s = {1, 2}", "s.add(5)", "{1, 2, 5}"),
+    ("x = [1, 2, 3]", "x.reverse()", "[3, 2, 1]"),
+    ("x = [0, 1, 2, 3, 4, 5, 6, 7]", "import random\nrandom.seed(1)\nrandom.shuffle(x)", "[3, 6, 1, 5, 7, 0, 4, 2]"),
+])
+def test_cache_nao_devolve_estado_anterior_a_alteracao(definicao, alteracao, esperado):
+    # Hash único: o cache de execução é compartilhado pelo processo
+    contexto = ContextoExecucao(pd.DataFrame({"a": [1, 2, 3]}), dataset_hash=uuid.uuid4().hex)
+    variavel = definicao.split(" =")[0]
+    contexto.executar(definicao)
+    contexto.executar(f"print({variavel})")
+    contexto.executar(alteracao)
+    observacao = contexto.executar(f"print({variavel})")
+    assert not observacao.startswith(PREFIXO_CACHE)
+    assert esperado in observacao
+
+
+def test_codigo_puro_repetido_vem_do_cache():
+    contexto = ContextoExecucao(pd.DataFrame({"a": [1, 2, 3]}), dataset_hash=uuid.uuid4().hex)
+    primeira = contexto.executar("print(df['a'].sum())")
+    segunda = contexto.executar("print(df['a'].sum())")
+    assert not primeira.startswith(PREFIXO_CACHE)
+    assert segunda.startswith(PREFIXO_CACHE)
+    assert "6" in segunda
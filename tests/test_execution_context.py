@@ -0,0 +1,84 @@
+# tests/test_execution_context.py
+
+# Testes de concorrência dos contextos de execução: várias sessões rodando código
+# ao mesmo tempo no mesmo processo não podem ver a saída, as variáveis nem os
+# gráficos umas das outras.
+import threading
+
+import pandas as pd
+
+from tools.execution_context import ContextoExecucao
+
+SESSOES = 16
+RODADAS = 20
+
+
+def test_sessoes_paralelas_nao_vazam_saida_nem_graficos():
+    contextos = [ContextoExecucao(pd.DataFrame({"sessao": [i] * 10, "valor": range(10)})) for i in range(SESSOES)]
+    erros = []
+    barreira = threading.Barrier(SESSOES)
+
+    def sessao(i):
+        contexto = contextos[i]
+        barreira.wait()
+        for rodada in range(RODADAS):
+            contexto.executar(f"v_{i} = {rodada}\nimport time\ntime.sleep(0.001)")
+            saida = contexto.executar(
+                f"print('sessao', int(df['sessao'].iloc[0]), 'rodada', v_{i})\n"
+                "print(sorted(nome for nome in globals() if nome.startswith('v_')))"
+            )
+            if f"sessao {i} rodada {rodada}" not in saida or f"['v_{i}']" not in saida:
+                erros.append((i, rodada, saida))
+            if rodada % 5 == 0:
+                saida = contexto.executar(
+                    f"plt.plot(df['valor'] * {i})\nplt.title('sessao {i}')\nplt.savefig('sessao_{i}_{rodada}.png')"
+                )
+                if f"sessao_{i}_{rodada}.png" not in saida:
+                    erros.append((i, rodada, saida))
+
+    threads = [threading.Thread(target=sessao, args=(i,)) for i in range(SESSOES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not erros, erros[:3]
+    for i, contexto in enumerate(contextos):
+        esperados = [f"sessao_{i}_{rodada}.png" for rodada in range(0, RODADAS, 5)]
+        assert contexto.graficos.nomes() == esperados
+        assert all(contexto.graficos.obter(nome).startswith(b"\x89PNG") for nome in esperados)
+
+
+def test_escopos_isolados_por_contexto():
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    primeiro, segundo = ContextoExecucao(df), ContextoExecucao(df)
+    primeiro.executar("df.drop(columns=['a'], inplace=True)\nx = 1")
+    saida = segundo.executar("print(list(df.columns), 'x' in globals())")
+    assert "['a'] False" in saida
+    assert list(df.columns) == ["a"]
+
+
+def test_grafico_de_funcao_definida_em_passo_anterior_e_capturado(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    contexto = ContextoExecucao(pd.DataFrame({"a": [1, 2, 3]}))
+    contexto.executar("def f():\n    plt.figure()\n    plt.hist(df['a'])\n    plt.savefig('x.png')")
+    saida = contexto.executar("f()")
+    assert "x.png" in saida
+    assert contexto.graficos.nomes() == ["x.png"]
+    assert not (tmp_path / "x.png").exists()
+
+
+def test_estado_inicial_do_escopo():
+    contexto = ContextoExecucao(pd.DataFrame({"a": [1, 2, 3]}))
+    assert contexto.estado_inicial
+    contexto.executar("print(df['a'].sum())")
+    assert contexto.estado_inicial
+    contexto.executar("df = df[df['a'] > 1]")
+    assert not contexto.estado_inicial
+    contexto.reiniciar_escopo()
+    assert contexto.estado_inicial
+    contexto.executar("limite = 2")
+    assert not contexto.estado_inicial
+    contexto.reiniciar_escopo()
+    contexto.restaurar_versao(1)
+    assert not contexto.estado_inicial
@@ -0,0 +1,121 @@
+# tests/test_llm_gateway.py
+
+# Testes da camada de resiliência dos LLMs contra o servidor stub local
+# (tests/stub_llm.py): retentativas, pausa da chave pelo Retry-After, streaming,
+# hedging e failover, sem rede nem chave de API real.
+import threading
+import time
+import uuid
+
+import pytest
+from langchain_openai import ChatOpenAI
+
+from llm_gateway import envolver_com_gateway
+from stub_llm import ComportamentoModelo, ServidorStubLLM
+
+
+@pytest.fixture
+def servidor():
+    with ServidorStubLLM() as stub:
+        yield stub
+
+
+def _cliente(servidor, modelo):
+    return ChatOpenAI(model=modelo, api_key="sk-teste", base_url=servidor.url, max_retries=0, timeout=10)
+
+
+def _gateway(servidor, modelo, alternativo=None, **campos):
+    # Chave única por teste: os baldes de fichas são compartilhados pelo processo
+    chave = uuid.uuid4().hex
+    llm = envolver_com_gateway(_cliente(servidor, modelo), "OpenAI", chave,
+                               _cliente(servidor, alternativo) if alternativo else None, "OpenAI", chave + "-alt")
+    return llm.model_copy(update=campos) if campos else llm
+
+
+def test_repete_apos_429(servidor):
+    servidor.modelos["principal"] = ComportamentoModelo(roteiro=["429", "ok"], retry_after_s=0.1)
+    resposta = _gateway(servidor, "principal").invoke("oi")
+    assert "resposta de principal" in resposta.content
+    assert [r[2] for r in servidor.requisicoes_do_modelo("principal")] == ["429", "ok"]
+    assert resposta.response_metadata["tentativas_llm"] == 2
+    assert resposta.response_metadata["fallback_llm"] is False
+
+
+def test_retry_after_pausa_a_chave_inteira(servidor):
+    servidor.modelos["principal"] = ComportamentoModelo(roteiro=["429"], retry_after_s=1.0)
+    primeiro = _gateway(servidor, "principal")
+    # Outra instância (outra sessão) com a mesma chave de API
+    segundo = primeiro.model_copy()
+    respostas = []
+    thread = threading.Thread(target=lambda: respostas.append(primeiro.invoke("oi")))
+    thread.start()
+    while not servidor.requisicoes_do_modelo("principal"):
+        time.sleep(0.01)
+    time.sleep(0.2)
+    respostas.append(segundo.invoke("oi"))
+    thread.join()
+
+    chegadas = [r[0] for r in servidor.requisicoes_do_modelo("principal")]
+    assert len(chegadas) == 3 and len(respostas) == 2
+    # Nenhuma requisição da chave chega ao servidor durante a pausa pedida
+    assert min(chegadas[1:]) - chegadas[0] >= 0.9
+
+
+def test_nao_repete_depois_que_o_streaming_comecou(servidor):
+    servidor.modelos["principal"] = ComportamentoModelo(roteiro=["corte"])
+    recebidos = []
+    with pytest.raises(Exception):
+        for pedaco in _gateway(servidor, "principal").stream("oi"):
+            recebidos.append(pedaco.content)
+    assert recebidos
+    assert len(servidor.requisicoes_do_modelo("principal")) == 1
+
+
+def test_hedging_dispara_o_alternativo_apos_hedge_s(servidor):
+    servidor.modelos["principal"] = ComportamentoModelo(latencia_s=3.0)
+    llm = _gateway(servidor, "principal", "alternativo", hedge_s=0.3)
+    inicio = time.monotonic()
+    resposta = llm.invoke("oi")
+    duracao = time.monotonic() - inicio
+
+    assert "resposta de alternativo" in resposta.content
+    assert resposta.response_metadata["fallback_llm"] is True
+    assert resposta.response_metadata["tentativas_llm"] == 1
+    assert duracao < 2.0
+    chegada_principal = servidor.requisicoes_do_modelo("principal")[0][0]
+    chegada_alternativo = servidor.requisicoes_do_modelo("alternativo")[0][0]
+    assert chegada_alternativo - chegada_principal >= 0.25
+
+
+def test_sem_hedging_o_principal_rapido_responde(servidor):
+    llm = _gateway(servidor, "principal", "alternativo", hedge_s=1.0)
+    resposta = llm.invoke("oi")
+    assert "resposta de principal" in resposta.content
+    assert resposta.response_metadata["fallback_llm"] is False
+    assert not servidor.requisicoes_do_modelo("alternativo")
+
+
+def test_failover_quando_o_principal_esgota_as_tentativas(servidor):
+    servidor.modelos["principal"] = ComportamentoModelo(taxa_5xx=1.0)
+    llm = _gateway(servidor, "principal", "alternativo", hedge_s=0, tentativas=2)
+    resposta = llm.invoke("oi")
+
+    assert "resposta de alternativo" in resposta.content
+    assert resposta.response_metadata["fallback_llm"] is True
+    assert len(servidor.requisicoes_do_modelo("principal")) == 2
+    assert len(servidor.requisicoes_do_modelo("alternativo")) == 1
+
+
+def test_metadados_no_streaming(servidor):
+    servidor.modelos["principal"] = ComportamentoModelo(roteiro=["503", "ok"])
+    pedacos = list(_gateway(servidor, "principal").stream("oi"))
+    assert "".join(p.content for p in pedacos).endswith("resposta de principal")
+    assert pedacos[0].response_metadata["tentativas_llm"] == 2
+    assert pedacos[0].response_metadata["fallback_llm"] is False
+
+
+def test_erro_permanente_nao_e_repetido(servidor):
+    servidor.modelos["principal"] = ComportamentoModelo(roteiro=["400"])
+    with pytest.raises(Exception):
+        _gateway(servidor, "principal").invoke("oi")
+    assert len(servidor.requisicoes_do_modelo("principal")) == 1
@@ -0,0 +1,33 @@
+# tests/test_observations.py
+
+# Testes da compactação das observações: o agente sempre recebe parte do
+# conteúdo, mesmo quando uma única linha passa do orçamento.
+from tools.observations import ArmazemSaidas, compactar_texto
+
+
+def test_linha_unica_maior_que_o_orcamento_e_cortada_por_caracteres():
+    compacto, truncado = compactar_texto("media_por_classe: " + "1.2345, " * 2000, max_tokens=100)
+    assert compacto.startswith("media_por_classe: 1.2345")
+    assert "linhas omitidas" not in compacto
+    assert len(compacto) <= 100 * 4
+    assert truncado is not None
+
+
+def test_linha_longa_entre_cabecalho_e_total_mantem_os_tres():
+    compacto, _ = compactar_texto("cabecalho\n" + "y" * 10_000 + "\nTotal: 5", max_tokens=100)
+    linhas = compacto.split("\n")
+    assert linhas[0] == "cabecalho"
+    assert linhas[1].startswith("yyy")
+    assert linhas[-1] == "Total: 5"
+
+
+def test_texto_dentro_do_orcamento_nao_muda():
+    texto = "a\nb\nc"
+    assert compactar_texto(texto, max_tokens=100) == (texto, None)
+
+
+def test_perfil_sem_corte_de_largura_ainda_mostra_conteudo():
+    saidas = ArmazemSaidas()
+    observacao = saidas.compactar("x" * 20_000, max_tokens=200, max_caracteres_linha=None)
+    assert observacao.startswith("xxx")
+    assert "saida_1" in observacao
@@ -0,0 +1,134 @@
+# tests/test_sandbox.py
+
+# Testes do pool de processos (sandbox): reinício de um trabalhador enquanto
+# outros contextos esperam por ele, e canal com o trabalhador já encerrado.
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from dataset_cache import CacheDatasets
+from tools.sandbox import PoolSandbox
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    diretorio = tmp_path_factory.mktemp("sandbox")
+    caminho_csv = diretorio / "dados.csv"
+    pd.DataFrame({"a": range(100)}).to_csv(caminho_csv, index=False)
+    cache = CacheDatasets(str(diretorio / "cache"))
+    _, dataset_hash, _ = cache.carregar(str(caminho_csv))
+    return dataset_hash, cache.caminho(dataset_hash)
+
+
+@pytest.fixture
+def pool():
+    pool = PoolSandbox(num_trabalhadores=1, timeout_s=2)
+    yield pool
+    pool.encerrar()
+
+
+def test_contexto_esperando_trabalhador_que_estourou_o_tempo(pool, dataset):
+    dataset_hash, caminho = dataset
+    # C já tem um escopo no trabalhador, que vai se perder quando A estourar o tempo
+    observacao, sucesso, reiniciado, _ = pool.executar("C", dataset_hash, caminho, "x = 1\nprint(x)")
+    assert sucesso and not reiniciado
+
+    resultados = {}
+
+    def executar(contexto_id, codigo):
+        try:
+            resultados[contexto_id] = pool.executar(contexto_id, dataset_hash, caminho, codigo)
+        except Exception as e:  # a exceção não pode escapar para a ferramenta
+            resultados[contexto_id] = e
+
+    lento = threading.Thread(target=executar, args=("A", "import time\ntime.sleep(10)"))
+    lento.start()
+    time.sleep(0.3)
+    esperando = threading.Thread(target=executar, args=("B", "print(df.shape)"))
+    esperando.start()
+    lento.join()
+    esperando.join()
+
+    observacao, sucesso, reiniciado, _ = resultados["A"]
+    assert not sucesso and reiniciado and "TimeoutError" in observacao
+    observacao, sucesso, reiniciado, _ = resultados["B"]
+    assert sucesso and not reiniciado and "(100, 1)" in observacao
+
+    observacao, sucesso, reiniciado, _ = pool.executar("C", dataset_hash, caminho, "print('x' in globals())")
+    assert sucesso and reiniciado and "False" in observacao
+    # O aviso só vale uma vez
+    assert not pool.executar("C", dataset_hash, caminho, "print(1)")[2]
+
+
+def test_trabalhador_encerrado_retorna_erro_formatado(pool, dataset):
+    dataset_hash, caminho = dataset
+    assert pool.executar("A", dataset_hash, caminho, "print(1)")[1]
+    trabalhador = pool._trabalhadores[0]
+    trabalhador.processo.kill()
+    trabalhador.processo.join()
+    trabalhador.conexao.close()
+
+    observacao, sucesso, reiniciado, _ = pool.executar("A", dataset_hash, caminho, "print(1)")
+    assert not sucesso and reiniciado
+    assert observacao.startswith("Erro ao executar o código.")
+    assert pool.executar("A", dataset_hash, caminho, "print(2)")[1]
+
+
+def test_versionar_nao_espera_execucao_longa_de_outro_contexto(pool, dataset):
+    dataset_hash, caminho = dataset
+    pool.timeout_s = 30
+    assert pool.executar("A", dataset_hash, caminho, "df = df[df['a'] > 10]")[1]
+    lento = threading.Thread(target=pool.executar, args=("B", dataset_hash, caminho, "import time\ntime.sleep(8)"))
+    lento.start()
+    time.sleep(0.5)
+    inicio = time.monotonic()
+    with pytest.raises(ValueError, match="ocupado"):
+        pool.versionar("A", "desfazer")
+    assert time.monotonic() - inicio < 7
+    lento.join()
+    assert pool.versionar("A", "desfazer")["atual"] == 0
+
+
+def test_versionar_com_trabalhador_encerrado_levanta_value_error(pool, dataset):
+    dataset_hash, caminho = dataset
+    assert pool.executar("A", dataset_hash, caminho, "df = df[df['a'] > 10]")[1]
+    trabalhador = pool._trabalhadores[0]
+    trabalhador.processo.kill()
+    trabalhador.processo.join()
+    with pytest.raises(ValueError):
+        pool.versionar("A", "desfazer")
+    # O contexto segue no trabalhador substituto, com o `df` original
+    observacao, sucesso, reiniciado, _ = pool.executar("A", dataset_hash, caminho, "print(len(df))")
+    assert sucesso and reiniciado and "100" in observacao
+
+
+def test_escopos_descartados_pelo_trabalhador_saem_da_afinidade(dataset, monkeypatch):
+    dataset_hash, caminho = dataset
+    # O limite é lido pelo processo trabalhador, que herda o ambiente
+    monkeypatch.setenv("EDA_SANDBOX_MAX_ESCOPOS", "2")
+    pool = PoolSandbox(num_trabalhadores=1, timeout_s=5)
+    try:
+        for contexto_id in ("A", "B", "C"):
+            _, sucesso, _, _ = pool.executar(contexto_id, dataset_hash, caminho, f"{contexto_id.lower()} = 1")
+            assert sucesso
+        trabalhador = pool._trabalhadores[0]
+        assert trabalhador.contextos == {"B", "C"}
+        assert set(pool._afinidade) == {"B", "C"}
+        assert pool.resumo_versoes("A") is None
+
+        observacao, sucesso, reiniciado, _ = pool.executar("A", dataset_hash, caminho, "print('a' in globals())")
+        assert sucesso and reiniciado
+        assert "False" in observacao and "AVISO" in observacao
+        assert trabalhador.contextos == {"A", "C"}
+    finally:
+        pool.encerrar()
+
+
+def test_descartar_libera_o_contexto(pool, dataset):
+    dataset_hash, caminho = dataset
+    pool.executar("A", dataset_hash, caminho, "x = 1")
+    pool.descartar("A")
+    assert not pool._trabalhadores[0].contextos
+    assert "A" not in pool._afinidade and pool.resumo_versoes("A") is None
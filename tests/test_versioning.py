@@ -0,0 +1,114 @@
+# tests/test_versioning.py
+
+# Testes do histórico de versões do `df` (cópia na escrita, desfazer/restaurar e
+# descarte das versões antigas pelo limite de versões e de memória).
+import numpy as np
+import pandas as pd
+import pytest
+
+from tools.versioning import VersoesDataset
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"a": np.arange(1000, dtype="int64"), "b": np.arange(1000) * 0.5,
+                         "c": pd.Categorical(["x", "y"] * 500)})
+
+
+def test_visao_sem_alteracao_nao_cria_versao(df):
+    versoes = VersoesDataset(df)
+    assert not versoes.registrar(versoes.visao())
+    assert versoes.resumo()["atual"] == 0
+
+
+@pytest.mark.parametrize("alteracao", [
+    lambda d: d.drop(columns=["b"], inplace=True),
+    lambda d: d.__setitem__("a", d["a"] * 2),
+    lambda d: d.__setitem__("nova", 1),
+    lambda d: d.loc.__setitem__((0, "b"), -1.0),
+])
+def test_alteracoes_no_lugar_viram_versao(df, alteracao):
+    versoes = VersoesDataset(df)
+    visao = versoes.visao()
+    alteracao(visao)
+    assert versoes.registrar(visao, "alteração")
+    assert versoes.resumo()["atual"] == 1
+    # A original não é afetada pela alteração da visão
+    assert list(df.columns) == ["a", "b", "c"] and df.loc[0, "b"] == 0.0 and df["a"].iloc[1] == 1
+
+
+@pytest.mark.parametrize("alteracao", [
+    lambda d: d[d["a"] > 10],
+    lambda d: d.assign(d=d["a"] + 1),
+    lambda d: d.set_axis(d.index + 100),
+    lambda d: d.iloc[::-1].reset_index(drop=True).set_axis(pd.RangeIndex(999, -1, -1)),
+])
+def test_reatribuicoes_viram_versao(df, alteracao):
+    versoes = VersoesDataset(df)
+    assert versoes.registrar(alteracao(versoes.visao()))
+
+
+def test_deslocar_range_index_vira_versao(df):
+    versoes = VersoesDataset(df)
+    visao = versoes.visao()
+    visao.index = visao.index + 100
+    assert versoes.registrar(visao)
+    visao = versoes.visao()
+    visao.index = visao.index[::-1]
+    assert versoes.registrar(visao)
+    assert versoes.resumo()["atual"] == 2
+
+
+def test_desfazer_e_restaurar(df):
+    versoes = VersoesDataset(df)
+    versoes.registrar(versoes.visao().drop(columns=["b"]), "sem b")
+    versoes.registrar(versoes.visao().drop(columns=["c"]), "sem c")
+    assert list(versoes.desfazer().columns) == ["a", "c"]
+    assert list(versoes.desfazer().columns) == ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        versoes.desfazer()
+    assert list(versoes.restaurar(2).columns) == ["a"]
+    with pytest.raises(ValueError):
+        versoes.restaurar(99)
+
+
+def test_desfazer_apos_descartar_a_origem(df):
+    versoes = VersoesDataset(df, max_versoes=3)
+    versoes.registrar(versoes.visao().drop(columns=["b"]))   # 1, origem 0
+    versoes.registrar(versoes.visao().drop(columns=["c"]))   # 2, origem 1
+    versoes.registrar(versoes.visao().assign(z=1))           # 3, origem 2 (descarta a 1)
+    numeros = [v["versao"] for v in versoes.resumo()["versoes"]]
+    assert numeros == [0, 2, 3]
+    # A versão 2 derivava da 1, que foi descartada: passa a derivar da 0
+    assert list(versoes.desfazer().columns) == ["a"]
+    assert list(versoes.desfazer().columns) == ["a", "b", "c"]
+
+
+def test_limite_de_memoria_descarta_as_mais_antigas(df):
+    grande = pd.DataFrame({"v": np.zeros(300_000)})  # ~2,3 MB
+    versoes = VersoesDataset(grande, max_mb=5)
+    for i in range(1, 5):
+        visao = versoes.visao()
+        visao["v"] = float(i)  # coluna nova a cada versão: memória exclusiva
+        versoes.registrar(visao)
+    resumo = versoes.resumo()
+    numeros = [v["versao"] for v in resumo["versoes"]]
+    assert numeros[0] == 0 and numeros[-1] == 4
+    assert len(numeros) == 3
+    assert resumo["mb_extra"] <= 5
+
+
+def test_original_e_atual_nunca_sao_descartadas():
+    grande = pd.DataFrame({"v": np.zeros(300_000)})
+    versoes = VersoesDataset(grande, max_mb=1)
+    visao = versoes.visao()
+    visao["v"] = 1.0
+    versoes.registrar(visao)
+    # A atual sozinha passa do limite, mas continua guardada, assim como a original
+    assert [v["versao"] for v in versoes.resumo()["versoes"]] == [0, 1]
+    visao = versoes.visao()
+    visao["v"] = 2.0
+    versoes.registrar(visao)
+    versoes.restaurar(0)
+    assert [v["versao"] for v in versoes.resumo()["versoes"]] == [0, 2]
+    assert versoes.visao()["v"].iloc[0] == 0.0
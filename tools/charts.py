@@ -0,0 +1,228 @@
+# tools/charts.py
+
+# Gráficos em memória, sem arquivos em disco.
+# Durante a execução do código do agente, `savefig` com um caminho de arquivo
+# grava os bytes em memória (o nome do arquivo vira o nome do gráfico) e as
+# figuras deixadas abertas também são capturadas. Cada sessão guarda os seus
+# gráficos em um `ArmazemGraficos` limitado, então não há colisão de nomes entre
+# sessões nem crescimento de `temp_charts/`. Também define auxiliares de plotagem
+# para datasets grandes (histograma pré-agrupado, hexbin e amostragem declarada).
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+from tools.sampling import MIN_LINHAS_CATEGORIA
+
+MAX_GRAFICOS_POR_SESSAO = int(os.getenv("EDA_GRAFICOS_MAX_POR_SESSAO", "32"))
+MAX_MB_GRAFICOS_POR_SESSAO = int(os.getenv("EDA_GRAFICOS_MAX_MB", "32"))
+# Acima deste número de pontos, os auxiliares agregam (hexbin) ou amostram os dados
+LIMITE_PONTOS = int(os.getenv("EDA_GRAFICOS_LIMITE_PONTOS", "20000"))
+
+# Linhas com muitos pontos são desenhadas em blocos, o que acelera a renderização
+matplotlib.rcParams["agg.path.chunksize"] = 10000
+matplotlib.rcParams["path.simplify_threshold"] = 0.5
+
+
+# --- Captura das figuras em memória ---
+
+_captura = threading.local()
+_savefig_original = Figure.savefig
+
+
+class GraficosCapturados(list):
+    """Lista de gráficos (nome ou None, bytes) com o tempo gasto para renderizá-los em PNG."""
+
+    tempo_renderizacao_s = 0.0
+
+
+def _savefig_em_memoria(self, fname, *args, **kwargs):
+    """`Figure.savefig` que, durante uma captura, grava em memória em vez de no disco."""
+    capturados = getattr(_captura, "graficos", None)
+    if capturados is None or not isinstance(fname, (str, os.PathLike)):
+        return _savefig_original(self, fname, *args, **kwargs)
+    nome = os.path.basename(os.fspath(fname)) or "grafico.png"
+    if "format" not in kwargs and not os.path.splitext(nome)[1]:
+        nome += ".png"
+    inicio = time.perf_counter()
+    buffer = BytesIO()
+    _savefig_original(self, buffer, *args, **kwargs)
+    capturados.append((nome, buffer.getvalue()))
+    capturados.tempo_renderizacao_s += time.perf_counter() - inicio
+    _captura.figuras_salvas.add(id(self))
+
+
+Figure.savefig = _savefig_em_memoria
+
+
+def _figura_para_png(figura) -> bytes:
+    buffer = BytesIO()
+    _savefig_original(figura, buffer, format="png", bbox_inches="tight")
+    return buffer.getvalue()
+
+
+@contextmanager
+def capturar_graficos():
+    """
+    Captura os gráficos gerados na thread atual durante o bloco.
+
+    Gera uma `GraficosCapturados` que, ao final, contém tuplas (nome ou None, bytes): os
+    gráficos salvos com `savefig` e as figuras que ficaram abertas (sem nome). Todas as
+    figuras do pyplot são fechadas ao final; quem chama deve serializar o uso do pyplot.
+    """
+    graficos = GraficosCapturados()
+    _captura.graficos = graficos
+    _captura.figuras_salvas = set()
+    try:
+        yield graficos
+        inicio = time.perf_counter()
+        for numero in plt.get_fignums():
+            figura = plt.figure(numero)
+            if id(figura) not in _captura.figuras_salvas and figura.get_axes():
+                graficos.append((None, _figura_para_png(figura)))
+        graficos.tempo_renderizacao_s += time.perf_counter() - inicio
+    finally:
+        _captura.graficos = None
+        plt.close('all')
+
+
+class ArmazemGraficos:
+    """Gráficos (PNG em memória) de uma sessão, limitados por quantidade e bytes; os mais antigos saem primeiro."""
+
+    def __init__(self, max_graficos: int = MAX_GRAFICOS_POR_SESSAO, max_mb: int = MAX_MB_GRAFICOS_POR_SESSAO):
+        self.max_graficos = max_graficos
+        self.max_bytes = max_mb * 1024 ** 2
+        self._graficos = OrderedDict()
+        self._bytes = 0
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _nome(nome: str) -> str:
+        # O agente pode citar o caminho antigo (ex: temp_charts/x.png); vale o nome do arquivo
+        return os.path.basename(nome.strip().replace("\\", "/"))
+
+    def guardar(self, nome, conteudo: bytes) -> str:
+        """Guarda um gráfico e retorna o nome sob o qual ficou (gerado se `nome` for None)."""
+        with self._lock:
+            if nome is None:
+                self._contador += 1
+                nome = f"grafico_{self._contador}.png"
+            nome = self._nome(nome)
+            if nome in self._graficos:
+                self._bytes -= len(self._graficos.pop(nome))
+            self._graficos[nome] = conteudo
+            self._bytes += len(conteudo)
+            while len(self._graficos) > 1 and (len(self._graficos) > self.max_graficos or self._bytes > self.max_bytes):
+                _, removido = self._graficos.popitem(last=False)
+                self._bytes -= len(removido)
+            return nome
+
+    def obter(self, nome: str):
+        """Retorna os bytes do gráfico, ou None se ele não existe (ou já foi descartado)."""
+        with self._lock:
+            return self._graficos.get(self._nome(nome))
+
+    def nomes(self) -> list:
+        """Nomes dos gráficos guardados, do mais antigo ao mais recente."""
+        with self._lock:
+            return list(self._graficos)
+
+    def __len__(self):
+        return len(self._graficos)
+
+
+# --- Auxiliares de plotagem para datasets grandes (disponíveis no escopo do agente) ---
+
+def _formatar_fracao(n_amostra: int, n_total: int) -> str:
+    return f"amostra de {n_amostra:,} de {n_total:,} linhas ({n_amostra / n_total:.1%})".replace(",", ".")
+
+
+def amostrar(dados, max_linhas: int = LIMITE_PONTOS, coluna_estrato: str = None, random_state: int = 0):
+    """
+    Retorna uma amostra de no máximo `max_linhas` e informa a fração usada.
+    Com `coluna_estrato`, cada grupo entra com pelo menos `MIN_LINHAS_CATEGORIA` linhas
+    (ou todas, se tiver menos), mantendo os grupos raros; o restante das linhas é
+    dividido entre os grupos na proporção do tamanho de cada um.
+    """
+    total = len(dados)
+    if total <= max_linhas:
+        return dados
+    rng = np.random.default_rng(random_state)
+    if coluna_estrato is not None and isinstance(dados, pd.DataFrame):
+        grupos = list(dados.groupby(coluna_estrato, observed=True, dropna=False).indices.values())
+        minimos = [min(len(posicoes), MIN_LINHAS_CATEGORIA) for posicoes in grupos]
+        fracao = max(0, max_linhas - sum(minimos)) / max(1, total - sum(minimos))
+        selecionadas = np.concatenate([
+            rng.choice(posicoes, minimo + int((len(posicoes) - minimo) * fracao), replace=False)
+            for posicoes, minimo in zip(grupos, minimos)
+        ])
+        if len(selecionadas) > max_linhas:
+            # Mais grupos que o limite comporta: nem todos têm o mínimo garantido
+            selecionadas = rng.choice(selecionadas, max_linhas, replace=False)
+    else:
+        selecionadas = rng.choice(total, max_linhas, replace=False)
+    amostra = dados.iloc[np.sort(selecionadas)]
+    print(f"Usando {_formatar_fracao(len(amostra), total)}.")
+    return amostra
+
+
+def histograma(valores, bins: int = 50, ax=None, titulo: str = None, log: bool = False):
+    """
+    Histograma pré-agrupado: as contagens são calculadas com numpy sobre todos os
+    dados e só as barras são desenhadas, então o custo não depende do número de linhas.
+    """
+    serie = pd.Series(valores).dropna()
+    contagens, bordas = np.histogram(serie.to_numpy(dtype="float64"), bins=bins)
+    ax = ax or plt.subplots(figsize=(8, 5))[1]
+    ax.stairs(contagens, bordas, fill=True, alpha=0.8)
+    if log:
+        ax.set_yscale("log")
+    ax.set_xlabel(str(serie.name or "valor"))
+    ax.set_ylabel("contagem")
+    ax.set_title(titulo or f"Distribuição de {serie.name or 'valores'} (n={len(serie):,}, todos os dados)".replace(",", "."))
+    return ax
+
+
+def dispersao(df: pd.DataFrame, x: str, y: str, ax=None, hue: str = None, titulo: str = None,
+              max_pontos: int = LIMITE_PONTOS):
+    """
+    Gráfico de dispersão adequado ao tamanho dos dados: até `max_pontos`, pontos comuns;
+    acima disso, hexbin (densidade 2D sobre todos os dados) ou, com `hue`, uma amostra
+    estratificada cuja fração é informada no título.
+    """
+    ax = ax or plt.subplots(figsize=(8, 6))[1]
+    dados = df[[c for c in (x, y, hue) if c is not None]].dropna()
+    sufixo = f"n={len(dados):,}".replace(",", ".")
+    if len(dados) > max_pontos and hue is None:
+        imagem = ax.hexbin(dados[x], dados[y], gridsize=60, bins="log", mincnt=1, cmap="viridis")
+        plt.colorbar(imagem, ax=ax, label="contagem (log)")
+        sufixo += ", densidade hexbin de todos os dados"
+    else:
+        if len(dados) > max_pontos:
+            dados = amostrar(dados, max_pontos, coluna_estrato=hue)
+            sufixo = _formatar_fracao(len(dados), len(df))
+        grupos = dados.groupby(hue, observed=True) if hue is not None else [(None, dados)]
+        for valor, grupo in grupos:
+            ax.scatter(grupo[x], grupo[y], s=4, alpha=0.5, label=None if hue is None else f"{hue}={valor}",
+                       rasterized=True)
+        if hue is not None:
+            ax.legend()
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.set_title(titulo or f"{y} × {x} ({sufixo})")
+    return ax
+
+
+def auxiliares_graficos() -> dict:
+    """Auxiliares de plotagem colocados no escopo de execução do agente."""
+    return {"amostrar": amostrar, "histograma": histograma, "dispersao": dispersao}
@@ -0,0 +1,180 @@
+# tools/execution_cache.py
+
+# Cache (memoização) dos resultados do `python_code_executor`.
+# A chave combina o código normalizado pela AST, o hash do dataset e a versão
+# do escopo de execução. Só é cacheado o código "puro": que não define nomes
+# nem altera o `df`. Gráficos gerados pelo código são guardados junto ao resultado.
+import ast
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+MAX_ENTRADAS_PADRAO = int(os.getenv("EDA_EXEC_CACHE_MAX_ENTRADAS", "256"))
+MAX_MB_PADRAO = int(os.getenv("EDA_EXEC_CACHE_MAX_MB", "64"))
+
+# Versão do escopo recém-criado (apenas `df` e as bibliotecas). Resultados obtidos
+# nesse estado podem ser compartilhados entre todas as sessões com o mesmo dataset.
+VERSAO_ESCOPO_INICIAL = "inicial"
+
+# Métodos que alteram o objeto em que são chamados, mesmo dentro de expressões
+# (ex: `print(x.pop())`). Outros métodos do pandas só alteram o objeto quando
+# recebem `inplace=True`.
+_METODOS_MUTAVEIS = {"insert", "pop", "update", "append", "extend", "clear", "setdefault",
+                     "remove", "__setitem__", "__delitem__", "setflags", "sort", "reverse", "add",
+                     "discard", "popitem", "appendleft", "extendleft", "popleft", "rotate", "fill",
+                     "shuffle", "seed", "resize", "put", "itemset", "difference_update",
+                     "intersection_update", "symmetric_difference_update", "__setattr__"}
+_FUNCOES_MUTAVEIS = {"exec", "eval", "setattr", "delattr", "globals", "vars"}
+
+# Chamadas que podem aparecer sozinhas numa linha sem alterar o escopo. Qualquer
+# outra chamada usada como instrução (ex: `x.sort()`, `s.add(5)`,
+# `np.random.shuffle(a)`) só faz sentido pelo efeito colateral e conta como
+# alteração. O estado do pyplot (`plt`, `sns`) não conta: as figuras são
+# capturadas e fechadas a cada execução.
+_FUNCOES_PURAS = {"print", "display", "histograma", "dispersao"}
+_METODOS_PUROS = {"describe", "head", "tail", "info", "plot", "hist", "boxplot", "savefig"}
+_MODULOS_GRAFICOS = {"plt", "sns"}
+
+
+def nova_versao_escopo() -> str:
+    """Gera um identificador único para um estado de escopo que foi alterado."""
+    return uuid.uuid4().hex
+
+
+def _altera_estado(arvore: ast.AST) -> bool:
+    """
+    Indica se o código define nomes ou altera objetos existentes (ex: o `df`).
+    Variáveis de compreensões (list/dict comprehension) não contam, pois são locais.
+    Na dúvida, o código é considerado alterador: um resultado não cacheado só custa
+    a reexecução, e um cacheado indevidamente devolve o estado anterior à alteração.
+    """
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.Expr) and isinstance(no.value, ast.Call) and not _chamada_pura(no.value):
+            return True
+        if isinstance(no, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef,
+                           ast.ClassDef, ast.Global, ast.Nonlocal, ast.Delete, ast.AugAssign)):
+            return True
+        if isinstance(no, (ast.Name, ast.Attribute, ast.Subscript)) and isinstance(no.ctx, (ast.Store, ast.Del)):
+            if isinstance(no, ast.Name) and _eh_variavel_de_comprehension(arvore, no):
+                continue
+            return True
+        if isinstance(no, ast.Call):
+            if isinstance(no.func, ast.Attribute) and no.func.attr in _METODOS_MUTAVEIS:
+                return True
+            if isinstance(no.func, ast.Name) and no.func.id in _FUNCOES_MUTAVEIS:
+                return True
+            if any(kw.arg == "inplace" and not (isinstance(kw.value, ast.Constant) and not kw.value.value)
+                   for kw in no.keywords):
+                return True
+    return False
+
+
+def _raiz(no: ast.AST):
+    """Nome na raiz de uma expressão como `np.random.shuffle` ou `df['a'].hist` (ou None)."""
+    while isinstance(no, (ast.Attribute, ast.Subscript, ast.Call)):
+        no = no.func if isinstance(no, ast.Call) else no.value
+    return no.id if isinstance(no, ast.Name) else None
+
+
+def _chamada_pura(chamada: ast.Call) -> bool:
+    """Indica se uma chamada usada como instrução está entre as que não alteram o escopo."""
+    if isinstance(chamada.func, ast.Name):
+        return chamada.func.id in _FUNCOES_PURAS
+    if isinstance(chamada.func, ast.Attribute):
+        return chamada.func.attr in _METODOS_PUROS or _raiz(chamada.func) in _MODULOS_GRAFICOS
+    return False
+
+
+def _eh_variavel_de_comprehension(arvore: ast.AST, nome: ast.Name) -> bool:
+    """Verifica se um nome atribuído é o alvo de um `for` dentro de uma compreensão."""
+    for no in ast.walk(arvore):
+        if isinstance(no, ast.comprehension):
+            for alvo in ast.walk(no.target):
+                if alvo is nome:
+                    return True
+    return False
+
+
+def analisar_codigo(codigo: str):
+    """
+    Normaliza o código pela AST e verifica se o resultado pode ser cacheado.
+
+    Returns:
+        Uma tupla (código canônico ou None, altera_estado). O código canônico é None
+        quando há erro de sintaxe.
+    """
+    try:
+        arvore = ast.parse(codigo)
+    except SyntaxError:
+        return None, False
+    # ast.dump ignora comentários, espaçamento e o tipo de aspas usado
+    return ast.dump(arvore, annotate_fields=False), _altera_estado(arvore)
+
+
+class CacheExecucao:
+    """Cache LRU de resultados de execução, limitado por número de entradas e bytes."""
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS_PADRAO, max_mb: int = MAX_MB_PADRAO):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_mb * 1024 ** 2
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    @staticmethod
+    def chave(codigo_canonico: str, dataset_hash: str, versao_escopo: str) -> str:
+        """Monta a chave do cache a partir do código canônico, do dataset e do escopo."""
+        conteudo = f"{dataset_hash}\0{versao_escopo}\0{codigo_canonico}".encode("utf-8")
+        return hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+
+    def obter(self, chave: str):
+        """Retorna (saída, gráficos) para a chave, ou None em caso de falha."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return entrada[0], entrada[1]
+
+    def guardar(self, chave: str, saida: str, graficos: list):
+        """
+        Guarda o resultado de uma execução.
+
+        Args:
+            chave: Chave gerada por `CacheExecucao.chave`.
+            saida: Observação retornada ao agente.
+            graficos: Lista de tuplas (nome ou None, bytes) com os gráficos gerados pelo código.
+        """
+        tamanho = len(saida.encode("utf-8")) + sum(len(b) for _, b in graficos)
+        if tamanho > self.max_bytes:
+            return
+        with self._lock:
+            if chave in self._entradas:
+                self._bytes -= self._entradas.pop(chave)[2]
+            self._entradas[chave] = (saida, graficos, tamanho)
+            self._bytes += tamanho
+            while self._entradas and (len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes):
+                _, (_, _, tamanho_removido) = self._entradas.popitem(last=False)
+                self._bytes -= tamanho_removido
+
+    def estatisticas(self) -> dict:
+        """Contadores de uso do cache."""
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / total if total else 0.0,
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+            }
+
+
+# Instância única, compartilhada por todas as sessões do processo
+cache_execucao = CacheExecucao()
@@ -0,0 +1,421 @@
+# tools/execution_context.py
+
+# Contextos de execução isolados por sessão/agente.
+# Cada contexto tem o seu próprio escopo (com o seu `df`), a sua versão de
+# escopo para o cache, o seu próprio buffer de saída, os seus gráficos (em memória) e as
+# versões do seu `df` (tools/versioning.py). A captura de `print()`
+# é feita por thread, sem trocar o `sys.stdout` global a cada execução, de modo
+# que várias sessões podem rodar código ao mesmo tempo no mesmo processo.
+import os
+import sys
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager, nullcontext
+from io import StringIO
+
+import pandas as pd
+import matplotlib
+# Define o backend do Matplotlib como 'Agg' para evitar que ele tente abrir uma GUI.
+# Isso é crucial para rodar em ambientes de servidor/não-interativos como o Streamlit.
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from profiling import formatar_secao, SECOES_PERFIL
+from dataset_cache import obter_cache_datasets
+from tools.execution_cache import (
+    cache_execucao, analisar_codigo, nova_versao_escopo, VERSAO_ESCOPO_INICIAL
+)
+from tools.sandbox import PoolSandbox, obter_pool_sandbox, sandbox_habilitado
+from tools.observations import ArmazemSaidas, configurar_exibicao_compacta
+from tools.charts import ArmazemGraficos, capturar_graficos, auxiliares_graficos
+from tools.sql_engine import MotorSQL, duckdb_disponivel
+from tools.sampling import obter_amostra, auxiliares_amostra
+from tools.versioning import VersoesDataset, descrever_alteracao
+
+# DataFrames, Series e arrays impressos pelo agente saem resumidos (início, fim e forma)
+configurar_exibicao_compacta()
+
+# Prefixo das observações servidas pelo cache; a interface o usa para sinalizar acertos
+PREFIXO_CACHE = "(Resultado reaproveitado do cache de execução.)\n"
+
+# O pyplot guarda a "figura atual" em estado global do processo. Qualquer código pode
+# desenhar (inclusive por uma função definida em um passo anterior), então toda execução
+# no processo é serializada por este lock e tem os gráficos capturados; as chamadas ao
+# LLM continuam em paralelo. No sandbox, cada trabalhador tem o seu próprio pyplot.
+_lock_pyplot = threading.RLock()
+
+
+class _RoteadorSaida:
+    """
+    Substituto de `sys.stdout`, instalado uma única vez, que envia cada escrita
+    para o buffer da thread atual (se houver captura ativa) ou para a saída original.
+    """
+
+    def __init__(self, original):
+        self._original = original
+        self._local = threading.local()
+
+    def _destino(self):
+        buffer = getattr(self._local, "buffer", None)
+        return self._original if buffer is None else buffer
+
+    def write(self, texto):
+        return self._destino().write(texto)
+
+    def flush(self):
+        return self._destino().flush()
+
+    def __getattr__(self, nome):
+        # Atributos como `encoding` e `isatty` vêm da saída original
+        return getattr(self._original, nome)
+
+    @contextmanager
+    def capturar(self):
+        """Captura tudo o que a thread atual escrever em `sys.stdout`."""
+        anterior = getattr(self._local, "buffer", None)
+        buffer = StringIO()
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = anterior
+
+
+_roteador_lock = threading.Lock()
+
+
+def _obter_roteador() -> _RoteadorSaida:
+    """Instala o roteador de saída em `sys.stdout` (uma vez) e o retorna."""
+    with _roteador_lock:
+        if not isinstance(sys.stdout, _RoteadorSaida):
+            sys.stdout = _RoteadorSaida(sys.stdout)
+        return sys.stdout
+
+
+def limpar_codigo(code: str) -> str:
+    """
+    Limpa o código de entrada para remover possíveis formatações de markdown
+    que o LLM possa ter incluído, causando um SyntaxError.
+    """
+    cleaned_code = code.strip()
+    if cleaned_code.startswith("```python"):
+        cleaned_code = cleaned_code[9:]
+    elif cleaned_code.startswith("```"):
+        cleaned_code = cleaned_code[3:]
+
+    if cleaned_code.endswith("```"):
+        cleaned_code = cleaned_code[:-3]
+
+    return cleaned_code.strip()
+
+
+class ContextoExecucao:
+    """
+    Escopo de execução de uma sessão (ou de um agente).
+
+    Args:
+        df: O DataFrame disponível para o código na variável `df`.
+        perfil: O perfil pré-calculado do dataset (ver profiling.py).
+        dataset_hash: Hash do conteúdo do dataset, usado como parte da chave do cache.
+        sandbox: Pool de processos onde o código é executado. Se omitido, usa o pool
+            global quando EDA_SANDBOX=1 e, caso contrário, executa no próprio processo.
+        fonte_servidor: Arquivo ou diretório Parquet/CSV do servidor (já validado) de onde
+            o `df` foi amostrado; as consultas SQL leem essa fonte inteira.
+        total_linhas_fonte: Total de linhas da fonte, quando o `df` é apenas uma amostra.
+        amostra: Amostra estratificada exposta como `df_sample` (modo aproximado). Se omitida,
+            é calculada (ou reaproveitada pelo `dataset_hash`); para datasets pequenos, é o próprio `df`.
+    """
+
+    def __init__(self, df: pd.DataFrame, perfil: dict = None, dataset_hash: str = None,
+                 sandbox: PoolSandbox = None, fonte_servidor: str = None, total_linhas_fonte: int = None,
+                 amostra: pd.DataFrame = None):
+        self.id = uuid.uuid4().hex
+        self.perfil = perfil
+        self.dataset_hash = dataset_hash
+        self.fonte_servidor = fonte_servidor
+        self.total_linhas_fonte = total_linhas_fonte
+        self.versao_escopo = VERSAO_ESCOPO_INICIAL
+        self.amostra = amostra if amostra is not None else obter_amostra(df, dataset_hash)
+        # O SQL e o refinamento sempre veem o dataset original, mesmo que o agente reatribua `df`
+        self._df_original = df
+        # O escopo recebe uma visão (cópia na escrita) da versão atual; alterações no `df` viram versões
+        self.versoes = VersoesDataset(df)
+        self.escopo = self._novo_escopo()
+        self._nomes_iniciais = set(self.escopo) | {"__builtins__"}
+        self._motor_sql = None
+        self._lock_motor_sql = threading.Lock()
+        if sandbox is None and sandbox_habilitado():
+            sandbox = obter_pool_sandbox()
+        self.sandbox = sandbox
+        # Saídas completas das observações que foram truncadas para o agente
+        self.saidas = ArmazemSaidas()
+        # Gráficos gerados nesta sessão, exibidos pela interface a partir da tag [CHART_PATH:nome]
+        self.graficos = ArmazemGraficos()
+        # Perguntas simultâneas na mesma sessão não intercalam execuções no mesmo escopo
+        self._lock = threading.Lock()
+        self._cancelamento = threading.Event()
+        # Métricas da última chamada de ferramenta (acerto de cache, gráficos), lidas pela telemetria
+        self.metricas_execucao = {}
+
+    @property
+    def amostra_parcial(self) -> bool:
+        """Indica se `df_sample` é de fato uma amostra (e não o próprio `df`, em datasets pequenos)."""
+        return self.amostra is not self._df_original
+
+    @property
+    def linhas_dataset(self) -> int:
+        """Número de linhas do `df` original (o agente pode reatribuir `df` no escopo)."""
+        return len(self._df_original)
+
+    @property
+    def estado_inicial(self) -> bool:
+        """
+        Indica se o escopo está como foi criado: `df` original e nenhuma variável definida
+        pelo agente. Só nesse estado uma resposta vale para outra sessão com o mesmo arquivo.
+        """
+        if self.versao_escopo != VERSAO_ESCOPO_INICIAL:
+            return False
+        if self._caminho_dataset_sandbox() is not None:
+            # No sandbox, qualquer código que altera o escopo já muda a `versao_escopo`
+            return True
+        return self.versoes.atual == 0 and set(self.escopo) <= self._nomes_iniciais
+
+    def _novo_escopo(self) -> dict:
+        """Escopo inicial de execução, com uma visão do `df` original, a amostra e os auxiliares."""
+        escopo = {
+            'df': self._df_original.copy(deep=False),
+            'df_sample': self.amostra.copy(deep=False),
+            'pd': pd,
+            'plt': plt,
+            'sns': sns,
+            **auxiliares_graficos(),
+        }
+        escopo.update(auxiliares_amostra(escopo))
+        if duckdb_disponivel():
+            escopo['sql'] = self._sql_para_dataframe
+        return escopo
+
+    def cancelar(self):
+        """Interrompe a execução em andamento (no modo sandbox, que pode encerrar o processo, e no SQL)."""
+        self._cancelamento.set()
+        if self._motor_sql is not None:
+            self._motor_sql.interromper()
+
+    def descartar(self):
+        """Libera o escopo desta sessão no sandbox; chamado quando o contexto é substituído por outro."""
+        if self.sandbox is not None:
+            self.sandbox.descartar(self.id)
+
+    def _obter_motor_sql(self) -> MotorSQL:
+        """Abre (uma vez) o motor SQL sobre a fonte do servidor, o arquivo Arrow do cache ou o `df`."""
+        with self._lock_motor_sql:
+            if self._motor_sql is None:
+                caminho_arrow = None
+                if self.dataset_hash is not None:
+                    caminho_arrow = obter_cache_datasets().caminho(self.dataset_hash)
+                    if not os.path.exists(caminho_arrow):
+                        caminho_arrow = None
+                if self.fonte_servidor is not None:
+                    self._motor_sql = MotorSQL(caminho_servidor=self.fonte_servidor)
+                elif caminho_arrow is not None:
+                    self._motor_sql = MotorSQL(caminho_arrow=caminho_arrow)
+                else:
+                    self._motor_sql = MotorSQL(df=self._df_original)
+            return self._motor_sql
+
+    def _sql_para_dataframe(self, consulta: str) -> pd.DataFrame:
+        """Função `sql()` do escopo: executa uma consulta sobre a tabela `dados` e retorna um DataFrame."""
+        return self._obter_motor_sql().dataframe(consulta, cancelamento=self._cancelamento)
+
+    def consultar_sql(self, consulta: str) -> str:
+        """Executa uma consulta SQL (somente leitura) sobre o dataset completo e retorna a observação."""
+        if not duckdb_disponivel():
+            return "O motor SQL (duckdb) não está instalado. Use a ferramenta `python_code_executor`."
+        consulta = limpar_codigo(consulta).strip().strip("`")
+        if consulta.lower().startswith("sql\n"):
+            consulta = consulta[4:]
+        # O SQL só lê os dados originais, então o resultado vale para qualquer estado do escopo
+        chave_cache = None
+        if self.dataset_hash is not None:
+            chave_cache = cache_execucao.chave("sql\0" + " ".join(consulta.split()), self.dataset_hash,
+                                               VERSAO_ESCOPO_INICIAL)
+            resultado_cache = cache_execucao.obter(chave_cache)
+            if resultado_cache is not None:
+                self.metricas_execucao = {"cache": True, "graficos": 0, "graficos_s": 0.0}
+                return PREFIXO_CACHE + self.saidas.compactar(resultado_cache[0])
+
+        self._cancelamento.clear()
+        self.metricas_execucao = {"cache": False, "graficos": 0, "graficos_s": 0.0}
+        observacao = self._obter_motor_sql().consultar(consulta, cancelamento=self._cancelamento)
+        if chave_cache is not None and not observacao.startswith("Erro"):
+            cache_execucao.guardar(chave_cache, observacao, [])
+        return self.saidas.compactar(observacao)
+
+    def _caminho_dataset_sandbox(self):
+        """Arquivo Arrow que o trabalhador mapeia, ou None se o dataset não está no cache em disco."""
+        if self.sandbox is None or self.dataset_hash is None:
+            return None
+        caminho = obter_cache_datasets().caminho(self.dataset_hash)
+        return caminho if os.path.exists(caminho) else None
+
+    def executar(self, code: str) -> str:
+        """
+        Executa o código no escopo deste contexto e retorna a observação para o agente,
+        limitada ao orçamento de tokens (a saída completa fica em `self.saidas`).
+        """
+        cleaned_code = limpar_codigo(code)
+
+        with self._lock:
+            self._cancelamento.clear()
+            # Consulta o cache: só código que não define nomes nem altera o `df` é reaproveitado
+            codigo_canonico, altera_estado = analisar_codigo(cleaned_code)
+            chave_cache = None
+            if self.dataset_hash is not None and codigo_canonico is not None and not altera_estado:
+                chave_cache = cache_execucao.chave(codigo_canonico, self.dataset_hash, self.versao_escopo)
+                resultado_cache = cache_execucao.obter(chave_cache)
+                if resultado_cache is not None:
+                    observacao, graficos = resultado_cache
+                    self.metricas_execucao = {"cache": True, "graficos": len(graficos), "graficos_s": 0.0}
+                    return PREFIXO_CACHE + self._finalizar_observacao(observacao, graficos)
+            elif altera_estado:
+                # O escopo muda: resultados obtidos no estado anterior deixam de valer
+                self.versao_escopo = nova_versao_escopo()
+
+            caminho_dataset = self._caminho_dataset_sandbox()
+            reiniciado = False
+            no_processo = caminho_dataset is None
+            with _lock_pyplot if no_processo else nullcontext():
+                if no_processo:
+                    # Limpa o estado de qualquer gráfico anterior para evitar sobreposição de plots
+                    plt.close('all')
+                if caminho_dataset is not None:
+                    observacao, sucesso, reiniciado, graficos = self.sandbox.executar(
+                        self.id, self.dataset_hash, caminho_dataset, cleaned_code, self._cancelamento
+                    )
+                    if reiniciado:
+                        # O trabalhador recomeça com o `df` original (também quando outra execução o reiniciou)
+                        self.versao_escopo = VERSAO_ESCOPO_INICIAL
+                else:
+                    observacao, sucesso, graficos = self._executar_capturando(cleaned_code)
+                    # O código pode ter alterado o `df` mesmo se falhou depois; a alteração vira uma nova versão
+                    self.versoes.registrar(self.escopo.get('df'), descrever_alteracao(cleaned_code))
+                # Com o escopo reiniciado, o resultado não corresponde à versão da chave
+                if sucesso and chave_cache is not None and not reiniciado:
+                    cache_execucao.guardar(chave_cache, observacao, graficos)
+            self.metricas_execucao = {
+                "cache": False,
+                "graficos": len(graficos),
+                "graficos_s": getattr(graficos, "tempo_renderizacao_s", 0.0),
+            }
+            return self._finalizar_observacao(observacao, graficos)
+
+    def resumo_versoes(self) -> dict:
+        """Versão atual do `df`, versões guardadas e a memória que ocupam (ver VersoesDataset.resumo)."""
+        if self._caminho_dataset_sandbox() is not None:
+            resumo = self.sandbox.resumo_versoes(self.id)
+            return resumo if resumo is not None else VersoesDataset(self._df_original).resumo()
+        return self.versoes.resumo()
+
+    def restaurar_versao(self, versao: int = None, desfazer: bool = False) -> dict:
+        """
+        Volta o `df` do escopo para `versao` (ou, com `desfazer`, para a versão anterior à atual),
+        sem reler o arquivo nem copiar dados. As demais variáveis do escopo são mantidas.
+        Retorna o novo resumo das versões.
+
+        Raises:
+            ValueError: Se a versão não existe (ou foi descartada) ou não há o que desfazer.
+        """
+        with self._lock:
+            # Resultados em cache foram obtidos com o `df` anterior
+            self.versao_escopo = nova_versao_escopo()
+            if self._caminho_dataset_sandbox() is not None:
+                return self.sandbox.versionar(self.id, "desfazer" if desfazer else "restaurar", versao)
+            self.escopo['df'] = self.versoes.desfazer() if desfazer else self.versoes.restaurar(versao)
+            return self.versoes.resumo()
+
+    def reiniciar_escopo(self) -> dict:
+        """
+        Recomeça o escopo com o `df` original, descartando as variáveis definidas pelo agente.
+        O histórico de versões é mantido. Retorna o novo resumo das versões.
+        """
+        with self._lock:
+            # O estado volta a ser o inicial, então os resultados em cache desse estado voltam a valer
+            self.versao_escopo = VERSAO_ESCOPO_INICIAL
+            if self._caminho_dataset_sandbox() is not None:
+                return self.sandbox.versionar(self.id, "reiniciar") or self.resumo_versoes()
+            self.versoes.restaurar(0)
+            self.escopo = self._novo_escopo()
+            return self.versoes.resumo()
+
+    def refinar(self, codigos: list) -> str:
+        """
+        Reexecuta, sobre todos os dados, o código que o agente rodou em `df_sample`.
+
+        O código roda em um escopo separado, com `df_sample` apontando para o `df` completo,
+        então o escopo da sessão não é alterado e novas perguntas não esperam pelo refinamento.
+        Retorna a observação (gráficos com o mesmo nome substituem os da amostra).
+        """
+        codigo = "df_sample = df\n" + "\n".join(limpar_codigo(c) for c in codigos)
+        caminho_dataset = self._caminho_dataset_sandbox()
+        if caminho_dataset is not None:
+            id_refinamento = f"{self.id}:refinamento"
+            try:
+                observacao, _, _, graficos = self.sandbox.executar(
+                    id_refinamento, self.dataset_hash, caminho_dataset, codigo
+                )
+            finally:
+                self.sandbox.descartar(id_refinamento)
+        else:
+            with _lock_pyplot:
+                observacao, _, graficos = self._executar_capturando(codigo, self._novo_escopo())
+        return self._finalizar_observacao(observacao, graficos)
+
+    def _finalizar_observacao(self, observacao: str, graficos: list) -> str:
+        """Compacta a observação e guarda os gráficos, informando ao agente como exibi-los."""
+        observacao = self.saidas.compactar(observacao)
+        if graficos:
+            nomes = [self.graficos.guardar(nome, conteudo) for nome, conteudo in graficos]
+            tags = " ".join(f"[CHART_PATH:{nome}]" for nome in nomes)
+            observacao += f"\nGráficos gerados: {', '.join(nomes)}. Para exibi-los, inclua {tags} na Final Answer."
+        return observacao
+
+    def consultar_perfil(self, secao: str) -> str:
+        """Retorna uma seção do perfil pré-calculado do dataset."""
+        if self.perfil is None:
+            return "O perfil do dataset não está disponível. Use a ferramenta `python_code_executor`."
+        # Remove aspas que o LLM costuma incluir na entrada da ação
+        secao = secao.strip().strip("'\"`")
+        if secao.lower() in SECOES_PERFIL:
+            secao = secao.lower()
+        # Linhas do perfil (ex: médias por classe) são longas, mas não devem ser cortadas
+        return self.saidas.compactar(formatar_secao(self.perfil, secao), max_caracteres_linha=None)
+
+    def consultar_saida(self, consulta: str) -> str:
+        """Retorna um trecho de uma saída que foi truncada (ex: 'saida_2 linhas 40-80')."""
+        return self.saidas.consultar(consulta.strip().strip("'\"`"))
+
+    def _executar_capturando(self, cleaned_code: str, escopo: dict = None):
+        """
+        Executa o código (no escopo da sessão, se `escopo` for omitido) capturando a saída da
+        thread atual e os gráficos gerados. Quem chama deve segurar o lock do pyplot.
+        Retorna (observação, sucesso, gráficos).
+        """
+        with _obter_roteador().capturar() as captured_output:
+            try:
+                with capturar_graficos() as graficos:
+                    exec(cleaned_code, self.escopo if escopo is None else escopo)
+            except Exception:
+                # Captura o traceback completo do erro e o retorna como uma string formatada
+                # Isso é crucial para o agente entender o erro sem quebrar
+                error_trace = traceback.format_exc()
+                return f"Erro ao executar o código. Detalhes:\n```\n{error_trace}\n```", False, []
+
+        output = captured_output.getvalue()
+        if output:
+            return f"Execução bem-sucedida. Saída:\n```\n{output}\n```", True, graficos
+        if graficos:
+            return "O código foi executado com sucesso e gerou gráficos.", True, graficos
+        return "O código foi executado com sucesso, mas não produziu nenhuma saída. Use a função `print()` para ver os resultados.", True, graficos
+
@@ -0,0 +1,153 @@
+# tools/observations.py
+
+# Observações compactas e de tamanho limitado para o agente.
+# Cada observação volta ao prompt em todas as iterações seguintes (scratchpad),
+# então a saída das ferramentas é limitada a um orçamento de tokens: DataFrames,
+# Series e arrays são exibidos de forma resumida, linhas largas são cortadas e,
+# se ainda assim a saída não couber, ficam o início e o final. A saída completa é
+# guardada no contexto e pode ser lida por partes com `consultar_saida_completa`.
+import os
+import re
+import threading
+from collections import OrderedDict
+
+MAX_TOKENS_OBSERVACAO = int(os.getenv("EDA_OBS_MAX_TOKENS", "800"))
+MAX_CARACTERES_LINHA = int(os.getenv("EDA_OBS_MAX_CARACTERES_LINHA", "240"))
+MAX_SAIDAS_GUARDADAS = 32
+
+# Exibição compacta do pandas/numpy: poucas linhas (início e fim), poucas colunas e a forma do objeto
+OPCOES_PANDAS = {
+    "display.max_rows": 20,
+    "display.min_rows": 10,
+    "display.max_columns": 12,
+    "display.width": 200,
+    "display.max_colwidth": 40,
+    "display.show_dimensions": True,
+}
+OPCOES_NUMPY = {"threshold": 50, "edgeitems": 3, "linewidth": 200}
+
+_CARACTERES_POR_TOKEN = 4
+
+
+def configurar_exibicao_compacta():
+    """Aplica as opções de exibição compacta do pandas e do numpy ao processo atual."""
+    import numpy as np
+    import pandas as pd
+    for opcao, valor in OPCOES_PANDAS.items():
+        pd.set_option(opcao, valor)
+    np.set_printoptions(**OPCOES_NUMPY)
+
+
+def _cortar_linhas_largas(linhas: list, max_caracteres: int):
+    """Corta linhas largas (ex: tabelas com muitas colunas). Retorna (linhas, quantas foram cortadas)."""
+    cortadas = 0
+    resultado = []
+    for linha in linhas:
+        if len(linha) > max_caracteres:
+            resultado.append(f"{linha[:max_caracteres]}… (+{len(linha) - max_caracteres} caracteres)")
+            cortadas += 1
+        else:
+            resultado.append(linha)
+    return resultado, cortadas
+
+
+def compactar_texto(texto: str, max_tokens: int = MAX_TOKENS_OBSERVACAO, max_caracteres_linha: int = None):
+    """
+    Limita o texto ao orçamento de tokens, mantendo o início e o final.
+
+    Returns:
+        Uma tupla (texto compacto, descrição do que foi truncado ou None).
+    """
+    linhas = texto.split("\n")
+    avisos = []
+    if max_caracteres_linha:
+        linhas, cortadas = _cortar_linhas_largas(linhas, max_caracteres_linha)
+        if cortadas:
+            avisos.append(f"{cortadas} linhas largas cortadas em {max_caracteres_linha} caracteres")
+
+    orcamento = max_tokens * _CARACTERES_POR_TOKEN
+    # Uma linha maior que o trecho inicial seria omitida inteira; é cortada antes da divisão
+    # (deixa espaço para a marca do corte)
+    limite_linha = max(1, orcamento * 2 // 3 - 32)
+    linhas, cortadas = _cortar_linhas_largas(linhas, limite_linha)
+    if cortadas:
+        avisos.append(f"{cortadas} linhas maiores que o orçamento cortadas em {limite_linha} caracteres")
+    if sum(len(l) + 1 for l in linhas) > orcamento:
+        # 2/3 do orçamento para o início e 1/3 para o final (onde ficam totais e mensagens de erro)
+        inicio, usado = [], 0
+        for linha in linhas:
+            if usado + len(linha) + 1 > orcamento * 2 // 3:
+                break
+            inicio.append(linha)
+            usado += len(linha) + 1
+        final, usado = [], 0
+        for linha in reversed(linhas[len(inicio):]):
+            if usado + len(linha) + 1 > orcamento // 3:
+                break
+            final.insert(0, linha)
+            usado += len(linha) + 1
+        omitidas = len(linhas) - len(inicio) - len(final)
+        avisos.insert(0, f"{len(inicio) + len(final)} de {len(linhas)} linhas exibidas")
+        linhas = inicio + [f"... [{omitidas} linhas omitidas] ..."] + final
+
+    if not avisos:
+        return texto, None
+    return "\n".join(linhas), "; ".join(avisos)
+
+
+class ArmazemSaidas:
+    """Saídas completas das ferramentas, por contexto, identificadas como `saida_N` (LRU limitado)."""
+
+    def __init__(self, max_saidas: int = MAX_SAIDAS_GUARDADAS):
+        self.max_saidas = max_saidas
+        self._saidas = OrderedDict()
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    def guardar(self, texto: str) -> str:
+        with self._lock:
+            self._contador += 1
+            identificador = f"saida_{self._contador}"
+            self._saidas[identificador] = texto
+            while len(self._saidas) > self.max_saidas:
+                self._saidas.popitem(last=False)
+            return identificador
+
+    def obter(self, identificador: str):
+        with self._lock:
+            return self._saidas.get(identificador)
+
+    def compactar(self, observacao: str, max_tokens: int = MAX_TOKENS_OBSERVACAO,
+                  max_caracteres_linha: int = MAX_CARACTERES_LINHA) -> str:
+        """Compacta uma observação; se algo foi truncado, guarda a original e avisa como lê-la."""
+        compacta, truncado = compactar_texto(observacao, max_tokens, max_caracteres_linha)
+        if truncado is None:
+            return observacao
+        identificador = self.guardar(observacao)
+        return (f"{compacta}\n(Saída truncada: {truncado}. A saída completa foi guardada como `{identificador}`; "
+                f"para ler um trecho, use `consultar_saida_completa` com '{identificador} linhas 1-50'. "
+                "Prefira agregar ou filtrar os dados em vez de imprimir tabelas inteiras.)")
+
+    def consultar(self, consulta: str, max_tokens: int = MAX_TOKENS_OBSERVACAO) -> str:
+        """
+        Retorna um trecho de uma saída guardada. A consulta tem o formato
+        'saida_N' ou 'saida_N linhas INICIO-FIM' (linhas numeradas a partir de 1).
+        """
+        correspondencia = re.search(r"(saida_\d+)(?:\D+(\d+)\s*-\s*(\d+))?", consulta)
+        if correspondencia is None:
+            return "Consulta inválida. Use o formato 'saida_N' ou 'saida_N linhas 1-50'."
+        identificador = correspondencia.group(1)
+        texto = self.obter(identificador)
+        if texto is None:
+            return f"A saída `{identificador}` não existe ou já foi descartada. Execute o código novamente."
+
+        linhas = texto.split("\n")
+        inicio = int(correspondencia.group(2) or 1)
+        fim = int(correspondencia.group(3) or len(linhas))
+        inicio, fim = max(inicio, 1), min(fim, len(linhas))
+        trecho = "\n".join(linhas[inicio - 1:fim])
+        compacto, truncado = compactar_texto(trecho, max_tokens, MAX_CARACTERES_LINHA)
+        cabecalho = f"`{identificador}`, linhas {inicio}-{fim} de {len(linhas)}:"
+        if truncado:
+            cabecalho += f" (trecho ainda truncado: {truncado}; peça um intervalo menor)"
+        return f"{cabecalho}\n{compacto}"
@@ -0,0 +1,163 @@
+# tools/sampling.py
+
+# Amostra estratificada do dataset para o modo aproximado.
+# A amostra é calculada uma vez por dataset, ao carregar os dados, e fica no
+# escopo do agente como `df_sample`. A coluna alvo (ex: 'Class') é amostrada na
+# mesma proporção em cada classe, de modo que a razão entre as classes se mantém,
+# e categorias raras das colunas categóricas não desaparecem da amostra. O
+# auxiliar `estimar` informa a fração amostral e o intervalo de confiança.
+import math
+import os
+import threading
+from collections import OrderedDict
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from profiling import detectar_coluna_alvo
+
+LINHAS_AMOSTRA = int(os.getenv("EDA_AMOSTRA_LINHAS", "50000"))
+# Mínimo de linhas de cada classe ou categoria rara (ou todas, se houver menos)
+MIN_LINHAS_CATEGORIA = int(os.getenv("EDA_AMOSTRA_MIN_CATEGORIA", "5"))
+# Colunas categóricas com mais valores distintos que isso não têm as categorias raras garantidas
+MAX_CATEGORIAS = 200
+MAX_AMOSTRAS_GUARDADAS = 8
+
+_amostras = OrderedDict()
+_amostras_lock = threading.Lock()
+
+
+def _formatar_inteiro(valor: int) -> str:
+    return f"{valor:,}".replace(",", ".")
+
+
+def _colunas_categoricas(df: pd.DataFrame, exceto=None) -> list:
+    colunas = []
+    for coluna in df.columns:
+        if coluna == exceto:
+            continue
+        tipo = df[coluna].dtype
+        if isinstance(tipo, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(tipo) \
+                or pd.api.types.is_object_dtype(tipo) or pd.api.types.is_string_dtype(tipo):
+            if df[coluna].nunique(dropna=True) <= MAX_CATEGORIAS:
+                colunas.append(coluna)
+    return colunas
+
+
+def amostra_estratificada(df: pd.DataFrame, max_linhas: int = LINHAS_AMOSTRA, coluna_estrato: str = None,
+                          random_state: int = 0) -> pd.DataFrame:
+    """
+    Retorna uma amostra de cerca de `max_linhas` linhas (ou o próprio `df`, se ele for menor).
+
+    Cada classe de `coluna_estrato` (por padrão, a coluna alvo detectada, ex: 'Class')
+    recebe a mesma fração das suas linhas, mantendo a proporção entre as classes. Classes
+    e categorias raras entram com pelo menos `MIN_LINHAS_CATEGORIA` linhas. As linhas
+    mantêm a ordem e o índice originais.
+    """
+    total = len(df)
+    if total <= max_linhas:
+        return df
+    if coluna_estrato is None:
+        coluna_estrato = detectar_coluna_alvo(df)
+    fracao = max_linhas / total
+    rng = np.random.default_rng(random_state)
+
+    if coluna_estrato is not None:
+        partes = []
+        for posicoes in df.groupby(coluna_estrato, observed=True, dropna=False).indices.values():
+            quantidade = max(round(len(posicoes) * fracao), min(len(posicoes), MIN_LINHAS_CATEGORIA))
+            partes.append(rng.choice(posicoes, quantidade, replace=False))
+        selecionadas = np.concatenate(partes)
+    else:
+        selecionadas = rng.choice(total, max_linhas, replace=False)
+
+    # Categorias raras das demais colunas categóricas que ficaram de fora (ou quase) da amostra
+    extras = []
+    for coluna in _colunas_categoricas(df, exceto=coluna_estrato):
+        presentes = df[coluna].iloc[selecionadas].value_counts()
+        for categoria, posicoes in df.groupby(coluna, observed=True).indices.items():
+            faltam = min(len(posicoes), MIN_LINHAS_CATEGORIA) - int(presentes.get(categoria, 0))
+            if faltam > 0:
+                candidatas = np.setdiff1d(posicoes, selecionadas, assume_unique=True)
+                extras.append(rng.choice(candidatas, min(faltam, len(candidatas)), replace=False))
+    if extras:
+        selecionadas = np.concatenate([selecionadas, *extras])
+    return df.iloc[np.unique(selecionadas)]
+
+
+def obter_amostra(df: pd.DataFrame, dataset_hash: str = None) -> pd.DataFrame:
+    """Amostra estratificada do dataset, reaproveitada entre as sessões com o mesmo `dataset_hash`."""
+    if len(df) <= LINHAS_AMOSTRA:
+        return df
+    if dataset_hash is None:
+        return amostra_estratificada(df)
+    with _amostras_lock:
+        amostra = _amostras.get(dataset_hash)
+        if amostra is not None:
+            _amostras.move_to_end(dataset_hash)
+            return amostra
+    amostra = amostra_estratificada(df)
+    with _amostras_lock:
+        _amostras[dataset_hash] = amostra
+        while len(_amostras) > MAX_AMOSTRAS_GUARDADAS:
+            _amostras.popitem(last=False)
+    return amostra
+
+
+def descrever_amostra(amostra: pd.DataFrame, total_linhas: int) -> str:
+    """Ex: 'amostra estratificada de 50.000 de 284.807 linhas (17,6%)'."""
+    fracao = f"{len(amostra) / total_linhas:.1%}".replace(".", ",")
+    return (f"amostra estratificada de {_formatar_inteiro(len(amostra))} de "
+            f"{_formatar_inteiro(total_linhas)} linhas ({fracao})")
+
+
+def auxiliares_amostra(escopo: dict) -> dict:
+    """
+    Auxiliares do modo aproximado colocados no escopo de execução do agente.
+
+    `estimar` consulta o escopo a cada chamada: se `df_sample` for o próprio `df`
+    (ex: no refinamento sobre todos os dados), o resultado é exato e sem intervalo.
+    """
+
+    def estimar(valores, estatistica: str = "media", confianca: float = 0.95) -> str:
+        """
+        Estimativa a partir de `df_sample`, com intervalo de confiança e a fração amostral.
+
+        Args:
+            valores: Coluna (ou filtro) calculada sobre `df_sample`. Para 'proporcao', uma
+                máscara booleana; para 'contagem', as linhas (ou valores) que atendem ao filtro.
+            estatistica: 'media', 'proporcao', 'total' (soma extrapolada) ou 'contagem'.
+            confianca: Nível de confiança do intervalo.
+        """
+        df, amostra = escopo["df"], escopo.get("df_sample")
+        exato = amostra is None or amostra is df or len(amostra) >= len(df)
+        fator = 1 if exato else len(df) / len(amostra)
+        if estatistica == "contagem":
+            # Aceita uma máscara booleana ou as linhas filtradas (só o número de linhas importa)
+            eh_mascara = isinstance(valores, pd.Series) and pd.api.types.is_bool_dtype(valores.dtype)
+            quantidade = int(valores.sum()) if eh_mascara else len(valores)
+            valor = quantidade * fator
+            p = quantidade / len(amostra) if not exato else 1.0
+            erro = len(df) * math.sqrt(p * (1 - p) / len(amostra)) if not exato else 0.0
+        else:
+            serie = pd.Series(valores).dropna()
+            if estatistica == "proporcao":
+                serie = serie.astype(bool).astype("float64")
+            elif estatistica not in ("media", "total"):
+                raise ValueError("`estatistica` deve ser 'media', 'proporcao', 'total' ou 'contagem'.")
+            n = len(serie)
+            media = float(serie.mean()) if n else float("nan")
+            erro = float(serie.std(ddof=1)) / math.sqrt(n) if n > 1 and not exato else 0.0
+            valor = media
+            if estatistica == "total":
+                valor, erro = float(serie.sum()) * fator, erro * n * fator
+        if exato:
+            return f"{estatistica} = {valor:.6g} (todos os dados, {_formatar_inteiro(len(df))} linhas)"
+        # Correção para população finita: a amostra é uma fração conhecida do dataset
+        erro *= math.sqrt(1 - len(amostra) / len(df))
+        margem = NormalDist().inv_cdf(0.5 + confianca / 2) * erro
+        return (f"{estatistica} ≈ {valor:.6g} ± {margem:.3g} (IC {confianca:.0%}; "
+                f"{descrever_amostra(amostra, len(df))})")
+
+    return {"estimar": estimar}
@@ -0,0 +1,443 @@
+# tools/sandbox.py
+
+# Pool de processos para executar o código gerado pelo agente fora do servidor.
+# Cada processo trabalhador fica "aquecido" (pandas/matplotlib já importados) e
+# abre o dataset via memory-map do arquivo Arrow do cache (dataset_cache.py), sem
+# copiar nem serializar o DataFrame a cada chamada. Cada execução tem limite de
+# tempo, limite de memória (RSS) e pode ser cancelada; nesses casos o processo é
+# encerrado e substituído por um novo. Os gráficos voltam como bytes (PNG) junto
+# com a observação; o trabalhador não grava arquivos. As versões do `df` de cada
+# escopo (tools/versioning.py) também ficam no trabalhador.
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from io import StringIO
+
+NUM_TRABALHADORES_PADRAO = int(os.getenv("EDA_SANDBOX_WORKERS", str(max(2, (os.cpu_count() or 2) // 2))))
+TIMEOUT_PADRAO_S = float(os.getenv("EDA_SANDBOX_TIMEOUT_S", "60"))
+LIMITE_MEMORIA_PADRAO_MB = int(os.getenv("EDA_SANDBOX_MAX_MB", "2048"))
+
+# Quantos escopos de sessão cada trabalhador mantém antes de descartar o mais antigo
+MAX_ESCOPOS_POR_TRABALHADOR = int(os.getenv("EDA_SANDBOX_MAX_ESCOPOS", "64"))
+_INTERVALO_MONITORAMENTO_S = 0.05
+# Espera máxima de uma troca de versão do `df` (pelo trabalhador ocupado e pela resposta dele)
+_TIMEOUT_VERSOES_S = 5.0
+
+
+def sandbox_habilitado() -> bool:
+    """Indica se a execução isolada em processos foi ativada (variável EDA_SANDBOX=1)."""
+    return os.getenv("EDA_SANDBOX", "0").lower() in ("1", "true", "sim")
+
+
+def formatar_erro(detalhes: str) -> str:
+    """Mesmo formato de erro do `python_code_executor` em processo."""
+    return f"Erro ao executar o código. Detalhes:\n```\n{detalhes}\n```"
+
+
+# --- Lado do processo trabalhador ---
+
+def _abrir_dataset(caminho: str):
+    """Abre o arquivo Arrow do cache via memory-map (colunas numéricas sem cópia)."""
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all().to_pandas(split_blocks=True)
+
+
+_motores_sql = {}
+
+
+def _funcao_sql(caminho: str):
+    """Função `sql()` do escopo no trabalhador, com um motor DuckDB por arquivo Arrow."""
+    def sql(consulta: str):
+        from tools.sql_engine import MotorSQL
+        if caminho not in _motores_sql:
+            _motores_sql[caminho] = MotorSQL(caminho_arrow=caminho)
+        return _motores_sql[caminho].dataframe(consulta)
+    return sql
+
+
+def _novo_escopo(df, caminho: str, dataset_hash: str):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from tools.charts import auxiliares_graficos
+    from tools.sampling import obter_amostra, auxiliares_amostra
+    from tools.sql_engine import duckdb_disponivel
+    escopo = {'df': df.copy(deep=False), 'df_sample': obter_amostra(df, dataset_hash).copy(deep=False), 'pd': pd, 'plt': plt,
+              'sns': sns, **auxiliares_graficos()}
+    escopo.update(auxiliares_amostra(escopo))
+    if duckdb_disponivel():
+        escopo['sql'] = _funcao_sql(caminho)
+    return escopo
+
+
+def _laco_trabalhador(conexao):
+    """Laço principal do trabalhador: recebe código, executa e devolve a observação e os gráficos."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from tools.charts import capturar_graficos
+    # Importa as bibliotecas pesadas antes da primeira chamada e avisa que está pronto
+    import pandas  # noqa: F401
+    import pyarrow  # noqa: F401
+    import seaborn  # noqa: F401
+    from tools.observations import configurar_exibicao_compacta
+    from tools.versioning import VersoesDataset, ativar_copia_na_escrita, descrever_alteracao
+    configurar_exibicao_compacta()
+    ativar_copia_na_escrita()
+    conexao.send(("pronto",))
+
+    datasets = {}
+    escopos = OrderedDict()
+    versoes = {}
+    while True:
+        try:
+            mensagem = conexao.recv()
+        except EOFError:
+            return
+        comando = mensagem[0]
+        if comando == "encerrar":
+            return
+        if comando == "descartar":
+            escopos.pop(mensagem[1], None)
+            versoes.pop(mensagem[1], None)
+            continue
+        if comando == "versoes":
+            _, contexto_id, operacao, versao = mensagem
+            historico = versoes.get(contexto_id)
+            try:
+                if operacao == "reiniciar":
+                    # O escopo é recriado na próxima execução, com a versão original e o histórico mantido
+                    escopos.pop(contexto_id, None)
+                    if historico is not None:
+                        historico.restaurar(0)
+                elif historico is None or contexto_id not in escopos:
+                    raise ValueError("O `df` ainda não foi alterado nesta sessão.")
+                elif operacao == "desfazer":
+                    escopos[contexto_id]["df"] = historico.desfazer()
+                else:
+                    escopos[contexto_id]["df"] = historico.restaurar(versao)
+                conexao.send((True, historico.resumo() if historico is not None else None))
+            except ValueError as e:
+                conexao.send((False, str(e)))
+            continue
+
+        _, contexto_id, dataset_hash, caminho_dataset, codigo = mensagem
+        # Escopos mais antigos descartados para abrir espaço; o servidor os remove da afinidade
+        descartados = []
+        try:
+            escopo = escopos.get(contexto_id)
+            if escopo is None:
+                if dataset_hash not in datasets:
+                    datasets[dataset_hash] = _abrir_dataset(caminho_dataset)
+                escopo = escopos[contexto_id] = _novo_escopo(datasets[dataset_hash], caminho_dataset, dataset_hash)
+                if contexto_id not in versoes:
+                    versoes[contexto_id] = VersoesDataset(datasets[dataset_hash])
+                escopo['df'] = versoes[contexto_id].visao()
+                while len(escopos) > MAX_ESCOPOS_POR_TRABALHADOR:
+                    antigo = escopos.popitem(last=False)[0]
+                    versoes.pop(antigo, None)
+                    descartados.append(antigo)
+            escopos.move_to_end(contexto_id)
+        except Exception:
+            conexao.send((formatar_erro(traceback.format_exc()), False, [], None, descartados))
+            continue
+
+        plt.close('all')
+        # O trabalhador executa uma chamada por vez, então pode trocar o stdout
+        old_stdout = sys.stdout
+        sys.stdout = captured_output = StringIO()
+        try:
+            with capturar_graficos() as graficos:
+                exec(codigo, escopo)
+            sys.stdout = old_stdout
+            output = captured_output.getvalue()
+            if output:
+                resposta = (f"Execução bem-sucedida. Saída:\n```\n{output}\n```", True, graficos)
+            elif graficos:
+                resposta = ("O código foi executado com sucesso e gerou gráficos.", True, graficos)
+            else:
+                resposta = ("O código foi executado com sucesso, mas não produziu nenhuma saída. Use a função `print()` para ver os resultados.", True, [])
+        except BaseException:
+            sys.stdout = old_stdout
+            resposta = (formatar_erro(traceback.format_exc()), False, [])
+        # O código pode ter alterado o `df` mesmo se falhou depois; a alteração vira uma nova versão
+        historico = versoes[contexto_id]
+        historico.registrar(escopo.get('df'), descrever_alteracao(codigo))
+        conexao.send(resposta + (historico.resumo(), descartados))
+
+
+# --- Lado do servidor ---
+
+def memoria_rss_mb(pid: int):
+    """Memória residente do processo em MB, ou None se não for possível medir."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 1024 ** 2
+    except Exception:
+        return None
+
+
+class _Trabalhador:
+    """Um processo trabalhador e o canal de comunicação com ele."""
+
+    def __init__(self, mp_contexto):
+        self.conexao, conexao_filho = mp_contexto.Pipe()
+        self.processo = mp_contexto.Process(target=_laco_trabalhador, args=(conexao_filho,), daemon=True)
+        self.processo.start()
+        conexao_filho.close()
+        self.lock = threading.Lock()
+        self.contextos = set()
+        self.pronto = False
+        # Marcado (com o `lock` do trabalhador) quando ele é encerrado e substituído por outro
+        self.substituido = False
+
+    def aguardar_pronto(self, timeout_s: float = 120):
+        """Aguarda o aviso de inicialização, para que o tempo de importação não conte no timeout."""
+        if not self.pronto and self.conexao.poll(timeout_s):
+            self.conexao.recv()
+            self.pronto = True
+
+    def encerrar(self):
+        if self.processo.is_alive():
+            self.processo.kill()
+        self.processo.join(timeout=5)
+        self.conexao.close()
+
+
+class PoolSandbox:
+    """
+    Pool de processos trabalhadores com afinidade por contexto.
+
+    Cada contexto de execução é atribuído ao trabalhador menos ocupado na primeira
+    chamada e permanece nele, pois é lá que as variáveis que o agente define ficam.
+    """
+
+    def __init__(self, num_trabalhadores: int = NUM_TRABALHADORES_PADRAO, timeout_s: float = TIMEOUT_PADRAO_S,
+                 limite_memoria_mb: int = LIMITE_MEMORIA_PADRAO_MB):
+        self.timeout_s = timeout_s
+        self.limite_memoria_mb = limite_memoria_mb
+        # 'spawn' evita herdar locks e threads do servidor Streamlit via fork
+        self._mp = multiprocessing.get_context("spawn")
+        self._trabalhadores = [_Trabalhador(self._mp) for _ in range(num_trabalhadores)]
+        self._afinidade = {}
+        # Resumo das versões do `df` de cada contexto, atualizado a cada execução
+        self._versoes = {}
+        # Contextos cujo escopo se perdeu (trabalhador reiniciado por outra execução ou escopo descartado por ele)
+        self._escopos_perdidos = set()
+        self._lock = threading.Lock()
+
+    def _trabalhador_de(self, contexto_id: str) -> _Trabalhador:
+        with self._lock:
+            trabalhador = self._afinidade.get(contexto_id)
+            if trabalhador is None:
+                trabalhador = min(self._trabalhadores, key=lambda t: len(t.contextos))
+                trabalhador.contextos.add(contexto_id)
+                self._afinidade[contexto_id] = trabalhador
+            return trabalhador
+
+    def _reiniciar(self, trabalhador: _Trabalhador, causador: str = None):
+        """
+        Substitui um trabalhador encerrado; os contextos dele perdem as variáveis e passam
+        para o substituto na próxima chamada. Deve ser chamado com `trabalhador.lock`; se o
+        trabalhador já foi substituído, não faz nada.
+        """
+        if trabalhador.substituido:
+            return
+        trabalhador.encerrar()
+        novo = _Trabalhador(self._mp)
+        with self._lock:
+            indice = self._trabalhadores.index(trabalhador)
+            self._trabalhadores[indice] = novo
+            trabalhador.substituido = True
+            for contexto_id in trabalhador.contextos:
+                self._afinidade.pop(contexto_id, None)
+                # Só quem já executou código (e tem resumo de versões) tinha um escopo no trabalhador
+                if self._versoes.pop(contexto_id, None) is not None and contexto_id != causador:
+                    self._escopos_perdidos.add(contexto_id)
+
+    def _esquecer_descartados(self, trabalhador: _Trabalhador, descartados: list):
+        """
+        Remove da afinidade os contextos cujo escopo o trabalhador descartou (o mais antigo sai
+        quando ele passa de `MAX_ESCOPOS_POR_TRABALHADOR`). Na próxima chamada, eles vão para o
+        trabalhador menos ocupado, com um escopo novo. Deve ser chamado com `self._lock`.
+        """
+        for contexto_id in descartados:
+            trabalhador.contextos.discard(contexto_id)
+            if self._afinidade.get(contexto_id) is trabalhador:
+                del self._afinidade[contexto_id]
+            if self._versoes.pop(contexto_id, None) is not None:
+                self._escopos_perdidos.add(contexto_id)
+
+    def _trabalhador_travado(self, contexto_id: str) -> _Trabalhador:
+        """Trabalhador do contexto com o `lock` dele adquirido (resolvido de novo se foi substituído na espera)."""
+        while True:
+            trabalhador = self._trabalhador_de(contexto_id)
+            trabalhador.lock.acquire()
+            if not trabalhador.substituido:
+                return trabalhador
+            trabalhador.lock.release()
+
+    def executar(self, contexto_id: str, dataset_hash: str, caminho_dataset: str, codigo: str,
+                 cancelamento: threading.Event = None):
+        """
+        Executa o código no trabalhador do contexto.
+
+        Returns:
+            Uma tupla (observação, sucesso, escopo_reiniciado, gráficos). `escopo_reiniciado`
+            indica que o trabalhador foi encerrado (nesta execução ou em outra que rodava nele)
+            e as variáveis do contexto se perderam; `gráficos` é uma lista de tuplas
+            (nome ou None, bytes PNG).
+        """
+        trabalhador = self._trabalhador_travado(contexto_id)
+        try:
+            with self._lock:
+                perdido = contexto_id in self._escopos_perdidos
+                self._escopos_perdidos.discard(contexto_id)
+            try:
+                trabalhador.aguardar_pronto()
+                trabalhador.conexao.send(("executar", contexto_id, dataset_hash, caminho_dataset, codigo))
+            except (EOFError, OSError):
+                motivo = "O processo de execução foi encerrado inesperadamente."
+            else:
+                resposta, motivo = self._aguardar_resposta(trabalhador, cancelamento)
+                if resposta is not None:
+                    observacao, sucesso, graficos, versoes, descartados = resposta
+                    with self._lock:
+                        if versoes is not None:
+                            self._versoes[contexto_id] = versoes
+                        self._esquecer_descartados(trabalhador, descartados)
+                    if perdido:
+                        observacao += ("\nAVISO: o escopo foi reiniciado antes desta execução (outra execução no "
+                                       "mesmo processo foi interrompida, ou o escopo ficou muito tempo sem uso): "
+                                       "variáveis definidas antes se perderam.")
+                    return observacao, sucesso, perdido, graficos
+            self._reiniciar(trabalhador, causador=contexto_id)
+        finally:
+            trabalhador.lock.release()
+        motivo += "\nO escopo foi reiniciado: variáveis definidas antes se perderam, mas o `df` original continua disponível."
+        return formatar_erro(motivo), False, True, []
+
+    def _aguardar_resposta(self, trabalhador: _Trabalhador, cancelamento: threading.Event = None):
+        """
+        Aguarda a resposta do trabalhador, monitorando tempo, memória e cancelamento.
+
+        Returns:
+            Uma tupla (resposta, None) ou, se o trabalhador precisa ser encerrado, (None, motivo).
+        """
+        inicio = time.monotonic()
+        while True:
+            if trabalhador.conexao.poll(_INTERVALO_MONITORAMENTO_S):
+                try:
+                    return trabalhador.conexao.recv(), None
+                except (EOFError, OSError):
+                    return None, "O processo de execução foi encerrado inesperadamente."
+            if time.monotonic() - inicio > self.timeout_s:
+                return None, (f"TimeoutError: a execução excedeu o limite de {self.timeout_s:.0f}s e foi interrompida. "
+                              "Tente uma abordagem mais leve (ex: agregar antes de plotar, usar uma amostra).")
+            memoria = memoria_rss_mb(trabalhador.processo.pid)
+            if memoria is not None and memoria > self.limite_memoria_mb:
+                return None, (f"MemoryError: a execução ultrapassou o limite de {self.limite_memoria_mb} MB "
+                              f"({memoria:.0f} MB) e foi interrompida.")
+            if cancelamento is not None and cancelamento.is_set():
+                return None, "A execução foi cancelada pelo usuário."
+            if not trabalhador.processo.is_alive():
+                return None, "O processo de execução foi encerrado inesperadamente."
+
+    def resumo_versoes(self, contexto_id: str):
+        """Resumo das versões do `df` do contexto após a última execução (ver VersoesDataset), ou None."""
+        with self._lock:
+            return self._versoes.get(contexto_id)
+
+    def versionar(self, contexto_id: str, operacao: str, versao: int = None):
+        """
+        Troca a versão do `df` no escopo do contexto, no trabalhador, sem copiar dados.
+
+        Args:
+            operacao: 'restaurar' (para `versao`), 'desfazer' ou 'reiniciar' (escopo novo, com o
+                `df` original; as variáveis definidas pelo agente se perdem).
+
+        Returns:
+            O novo resumo das versões (ou None se o contexto ainda não executou código).
+
+        Raises:
+            ValueError: Se a versão não existe (ou foi descartada), não há o que desfazer, o
+                trabalhador está ocupado com outra execução ou foi encerrado.
+        """
+        with self._lock:
+            trabalhador = self._afinidade.get(contexto_id)
+        if trabalhador is None:
+            if operacao == "reiniciar":
+                return None
+            raise ValueError("O `df` ainda não foi alterado nesta sessão.")
+        # Não espera por uma execução longa de outra sessão no mesmo trabalhador
+        if not trabalhador.lock.acquire(timeout=_TIMEOUT_VERSOES_S):
+            raise ValueError("O processo de execução está ocupado com outra análise. Tente novamente em instantes.")
+        try:
+            if trabalhador.substituido:
+                if operacao == "reiniciar":
+                    return None
+                raise ValueError("O processo de execução foi reiniciado e o `df` voltou à versão original.")
+            try:
+                trabalhador.aguardar_pronto()
+                trabalhador.conexao.send(("versoes", contexto_id, operacao, versao))
+                if not trabalhador.conexao.poll(_TIMEOUT_VERSOES_S):
+                    raise TimeoutError
+                sucesso, resultado = trabalhador.conexao.recv()
+            except (EOFError, OSError):
+                # Inclui o TimeoutError: trocar de versão é instantâneo, então o trabalhador travou
+                self._reiniciar(trabalhador)
+                raise ValueError("O processo de execução foi encerrado e reiniciado; o `df` voltou à versão "
+                                 "original e as variáveis definidas antes se perderam.")
+        finally:
+            trabalhador.lock.release()
+        if not sucesso:
+            raise ValueError(resultado)
+        with self._lock:
+            self._versoes[contexto_id] = resultado
+        return resultado
+
+    def descartar(self, contexto_id: str):
+        """Libera o escopo de um contexto que não será mais usado."""
+        with self._lock:
+            self._versoes.pop(contexto_id, None)
+            self._escopos_perdidos.discard(contexto_id)
+            trabalhador = self._afinidade.pop(contexto_id, None)
+            if trabalhador is not None:
+                trabalhador.contextos.discard(contexto_id)
+        if trabalhador is not None:
+            with trabalhador.lock:
+                if trabalhador.substituido:
+                    return
+                try:
+                    trabalhador.conexao.send(("descartar", contexto_id))
+                except OSError:
+                    pass
+
+    def encerrar(self):
+        """Encerra todos os trabalhadores."""
+        for trabalhador in self._trabalhadores:
+            trabalhador.encerrar()
+
+
+_pool_global = None
+_pool_global_lock = threading.Lock()
+
+
+def obter_pool_sandbox() -> PoolSandbox:
+    """Retorna o pool compartilhado por todas as sessões do processo (criado sob demanda)."""
+    global _pool_global
+    with _pool_global_lock:
+        if _pool_global is None:
+            _pool_global = PoolSandbox()
+        return _pool_global
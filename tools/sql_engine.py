@@ -0,0 +1,254 @@
+# tools/sql_engine.py
+
+# Motor SQL colunar (DuckDB) para consultas sobre o dataset inteiro.
+# O DuckDB lê o arquivo Arrow do cache (via memory-map, sem cópia) ou arquivos
+# Parquet/CSV do servidor diretamente, em streaming, com várias threads e com
+# filtros e projeções aplicados na leitura. Assim agregações e group-bys não
+# dependem do `df` em memória e funcionam em extrações maiores que a RAM
+# (o excedente vai para disco). Só consultas de leitura (SELECT) são aceitas.
+import hashlib
+import os
+import threading
+import time
+
+import pandas as pd
+
+from ingestion import RelatorioIngestao, otimizar_tipos
+
+try:
+    import duckdb
+except ImportError:  # O motor SQL é opcional; sem ele o agente usa apenas o pandas
+    duckdb = None
+
+NOME_TABELA = "dados"
+MAX_LINHAS_RESULTADO = int(os.getenv("EDA_SQL_MAX_LINHAS", "50"))
+# Limite de linhas que `sql()` devolve ao pandas no python_code_executor
+MAX_LINHAS_DATAFRAME = int(os.getenv("EDA_SQL_MAX_LINHAS_DF", "1000000"))
+TIMEOUT_PADRAO_S = float(os.getenv("EDA_SQL_TIMEOUT_S", "120"))
+LIMITE_MEMORIA_MB = int(os.getenv("EDA_SQL_MAX_MB", "2048"))
+DIRETORIO_TEMPORARIO = os.getenv("EDA_SQL_TEMP_DIR", os.path.join(".cache", "duckdb"))
+# Amostra carregada no `df` quando a fonte é um caminho do servidor
+LINHAS_AMOSTRA_SERVIDOR = int(os.getenv("EDA_SQL_AMOSTRA_LINHAS", "200000"))
+
+_EXTENSOES_PARQUET = (".parquet", ".pq")
+_EXTENSOES_CSV = (".csv", ".tsv", ".txt", ".csv.gz", ".tsv.gz")
+
+
+def duckdb_disponivel() -> bool:
+    return duckdb is not None
+
+
+def diretorios_permitidos() -> list:
+    """Diretórios do servidor que podem ser analisados (EDA_SQL_DIRETORIOS, separados por os.pathsep)."""
+    valor = os.getenv("EDA_SQL_DIRETORIOS", "")
+    return [os.path.realpath(d) for d in valor.split(os.pathsep) if d.strip()]
+
+
+def validar_caminho_servidor(caminho: str) -> str:
+    """
+    Valida um arquivo ou diretório do servidor e retorna o seu caminho real.
+    Levanta ValueError se ele não existe ou está fora dos diretórios permitidos.
+    """
+    real = os.path.realpath(os.path.expanduser(caminho.strip()))
+    permitidos = diretorios_permitidos()
+    if not any(real == d or real.startswith(d + os.sep) for d in permitidos):
+        raise ValueError("O caminho está fora dos diretórios permitidos (EDA_SQL_DIRETORIOS).")
+    if not os.path.exists(real):
+        raise ValueError(f"O caminho '{caminho}' não existe.")
+    return real
+
+
+def _arquivos_da_fonte(caminho: str) -> list:
+    if os.path.isfile(caminho):
+        return [caminho]
+    arquivos = []
+    for raiz, _, nomes in os.walk(caminho):
+        arquivos += [os.path.join(raiz, n) for n in nomes if n.lower().endswith(_EXTENSOES_PARQUET + _EXTENSOES_CSV)]
+    return sorted(arquivos)
+
+
+def _expressao_leitura(caminho: str) -> str:
+    """Função de leitura do DuckDB para um arquivo ou diretório de Parquet/CSV."""
+    arquivos = _arquivos_da_fonte(caminho)
+    if not arquivos:
+        raise ValueError(f"Nenhum arquivo Parquet ou CSV encontrado em '{caminho}'.")
+    eh_parquet = arquivos[0].lower().endswith(_EXTENSOES_PARQUET)
+    if os.path.isdir(caminho):
+        extensoes = _EXTENSOES_PARQUET if eh_parquet else _EXTENSOES_CSV
+        padroes = sorted({f"{caminho}/**/*{ext}" for arq in arquivos for ext in extensoes if arq.lower().endswith(ext)})
+        alvo = "[" + ", ".join(f"'{p}'" for p in padroes) + "]"
+    else:
+        alvo = f"'{caminho}'"
+    alvo = alvo.replace("\\", "/")
+    if eh_parquet:
+        return f"read_parquet({alvo}, union_by_name = true)"
+    return f"read_csv({alvo}, union_by_name = true)"
+
+
+def hash_fonte_servidor(caminho: str) -> str:
+    """Identifica uma fonte do servidor pelo caminho, tamanho e data de modificação dos arquivos."""
+    h = hashlib.blake2b(caminho.encode("utf-8"), digest_size=16)
+    for arquivo in _arquivos_da_fonte(caminho):
+        estado = os.stat(arquivo)
+        h.update(f"\0{arquivo}\0{estado.st_size}\0{estado.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class MotorSQL:
+    """
+    Conexão DuckDB com a tabela `dados` apontando para o dataset.
+
+    Args:
+        caminho_arrow: Arquivo Arrow IPC do cache de datasets (lido via memory-map).
+        caminho_servidor: Arquivo ou diretório de Parquet/CSV do servidor (já validado).
+        df: DataFrame usado quando não há arquivo (o DuckDB o lê sem copiar).
+    """
+
+    def __init__(self, caminho_arrow: str = None, caminho_servidor: str = None, df: pd.DataFrame = None):
+        if duckdb is None:
+            raise ImportError("O pacote duckdb não está instalado.")
+        os.makedirs(DIRETORIO_TEMPORARIO, exist_ok=True)
+        self._conexao = duckdb.connect(config={
+            "threads": os.cpu_count() or 1,
+            "memory_limit": f"{LIMITE_MEMORIA_MB}MB",
+            "temp_directory": DIRETORIO_TEMPORARIO,
+        })
+        self._lock = threading.Lock()
+
+        permitidos = [os.path.realpath(DIRETORIO_TEMPORARIO)]
+        if caminho_servidor is not None:
+            self._conexao.execute(f"CREATE VIEW {NOME_TABELA} AS SELECT * FROM {_expressao_leitura(caminho_servidor)}")
+            permitidos.append(caminho_servidor if os.path.isdir(caminho_servidor) else os.path.dirname(caminho_servidor))
+        elif caminho_arrow is not None:
+            import pyarrow as pa
+            tabela = pa.ipc.open_file(pa.memory_map(caminho_arrow, "r")).read_all()
+            self._conexao.register(NOME_TABELA, tabela)
+        elif df is not None:
+            self._conexao.register(NOME_TABELA, df)
+        else:
+            raise ValueError("Informe o arquivo Arrow, o caminho no servidor ou o DataFrame.")
+
+        # Depois de criada a tabela, o SQL do agente não acessa outros arquivos nem altera a configuração
+        lista = ", ".join("'" + (d.rstrip(os.sep) + os.sep).replace("\\", "/") + "'" for d in permitidos)
+        self._conexao.execute(f"SET allowed_directories = [{lista}]")
+        self._conexao.execute("SET enable_external_access = false")
+        self._conexao.execute("SET lock_configuration = true")
+
+    def _relacao(self, consulta: str):
+        """Valida que a consulta é um único SELECT (ou EXPLAIN) e retorna a relação do DuckDB."""
+        consulta = consulta.strip().rstrip(";").strip()
+        instrucoes = self._conexao.extract_statements(consulta)
+        if len(instrucoes) != 1:
+            raise ValueError("Envie exatamente uma consulta SQL por vez.")
+        if instrucoes[0].type not in (duckdb.StatementType.SELECT, duckdb.StatementType.EXPLAIN):
+            raise ValueError("Apenas consultas de leitura (SELECT) são permitidas.")
+        return self._conexao.sql(consulta)
+
+    def _executar_com_timeout(self, funcao, timeout_s: float, cancelamento: threading.Event = None):
+        """Executa `funcao` interrompendo a consulta após o timeout ou se o cancelamento for sinalizado."""
+        concluida = threading.Event()
+
+        def monitorar():
+            inicio = time.monotonic()
+            while not concluida.wait(0.1):
+                if time.monotonic() - inicio > timeout_s or (cancelamento is not None and cancelamento.is_set()):
+                    self._conexao.interrupt()
+                    return
+
+        with self._lock:
+            monitor = threading.Thread(target=monitorar, daemon=True)
+            monitor.start()
+            try:
+                return funcao()
+            finally:
+                concluida.set()
+                monitor.join()
+
+    def dataframe(self, consulta: str, max_linhas: int = MAX_LINHAS_DATAFRAME, timeout_s: float = TIMEOUT_PADRAO_S,
+                  cancelamento: threading.Event = None) -> pd.DataFrame:
+        """Executa a consulta e retorna o resultado (até `max_linhas`) como DataFrame do pandas."""
+        def executar():
+            resultado = self._relacao(consulta).limit(max_linhas + 1).df()
+            if len(resultado) > max_linhas:
+                print(f"AVISO: o resultado foi limitado às primeiras {max_linhas} linhas. Agregue ou filtre mais no SQL.")
+                resultado = resultado.iloc[:max_linhas]
+            return resultado
+        return self._executar_com_timeout(executar, timeout_s, cancelamento)
+
+    def consultar(self, consulta: str, max_linhas: int = MAX_LINHAS_RESULTADO, timeout_s: float = TIMEOUT_PADRAO_S,
+                  cancelamento: threading.Event = None) -> str:
+        """Executa a consulta e retorna o resultado formatado como observação para o agente."""
+        inicio = time.perf_counter()
+        try:
+            resultado = self._executar_com_timeout(
+                lambda: self._relacao(consulta).limit(max_linhas + 1).df(), timeout_s, cancelamento
+            )
+        except Exception as e:
+            if isinstance(e, duckdb.InterruptException):
+                return (f"Erro na consulta SQL: a consulta foi interrompida (limite de {timeout_s:.0f}s ou cancelamento). "
+                        "Tente filtrar ou agregar mais.")
+            return f"Erro na consulta SQL:\n```\n{type(e).__name__}: {e}\n```"
+        duracao = time.perf_counter() - inicio
+
+        aviso = ""
+        if len(resultado) > max_linhas:
+            resultado = resultado.iloc[:max_linhas]
+            aviso = f"\n(Mostrando apenas as primeiras {max_linhas} linhas; agregue, filtre ou use LIMIT.)"
+        with pd.option_context("display.max_rows", max_linhas, "display.max_columns", 30, "display.width", 200):
+            tabela = resultado.to_string(index=False) if len(resultado) else "(nenhuma linha)"
+        return f"Consulta executada em {duracao:.2f}s. Resultado:\n```\n{tabela}\n```{aviso}"
+
+    def contar_linhas(self) -> int:
+        return self._executar_com_timeout(
+            lambda: self._conexao.sql(f"SELECT count(*) FROM {NOME_TABELA}").fetchone()[0], TIMEOUT_PADRAO_S
+        )
+
+    def amostra(self, max_linhas: int) -> pd.DataFrame:
+        """Amostra aleatória (reprodutível) de até `max_linhas` linhas, lida em streaming."""
+        return self._executar_com_timeout(
+            lambda: self._conexao.sql(
+                f"SELECT * FROM {NOME_TABELA} USING SAMPLE reservoir({int(max_linhas)} ROWS) REPEATABLE (0)"
+            ).df(),
+            TIMEOUT_PADRAO_S,
+        )
+
+    def interromper(self):
+        self._conexao.interrupt()
+
+    def fechar(self):
+        self._conexao.close()
+
+
+def carregar_fonte_servidor(caminho: str, max_linhas: int = LINHAS_AMOSTRA_SERVIDOR):
+    """
+    Abre uma fonte Parquet/CSV do servidor para análise.
+
+    Returns:
+        Uma tupla (DataFrame, hash da fonte, RelatorioIngestao, total de linhas). O
+        DataFrame é o dataset inteiro, se couber em `max_linhas`, ou uma amostra aleatória;
+        as consultas SQL continuam vendo todos os dados.
+    """
+    caminho = validar_caminho_servidor(caminho)
+    inicio = time.perf_counter()
+    motor = MotorSQL(caminho_servidor=caminho)
+    try:
+        total = motor.contar_linhas()
+        df = motor.amostra(max_linhas) if total > max_linhas else motor.dataframe(f"SELECT * FROM {NOME_TABELA}")
+    finally:
+        motor.fechar()
+    tempo_parse = time.perf_counter() - inicio
+
+    memoria_original = int(df.memory_usage(deep=True).sum())
+    inicio = time.perf_counter()
+    df = otimizar_tipos(df)
+    relatorio = RelatorioIngestao(
+        nome_arquivo=os.path.basename(caminho) or caminho,
+        motor="duckdb" if total <= max_linhas else f"duckdb (amostra de {len(df):,} de {total:,} linhas)",
+        linhas=len(df),
+        colunas=df.shape[1],
+        tempo_parse_s=tempo_parse,
+        tempo_otimizacao_s=time.perf_counter() - inicio,
+        memoria_original_bytes=memoria_original,
+        memoria_final_bytes=int(df.memory_usage(deep=True).sum()),
+    )
+    return df, hash_fonte_servidor(caminho), relatorio, total
@@ -0,0 +1,214 @@
+# tools/versioning.py
+
+# Versões do `df` de um escopo de execução, com cópia na escrita (copy-on-write).
+# O código do agente recebe uma visão do dataset que compartilha a memória da
+# versão de origem; quando o código altera o `df` (remove colunas, filtra linhas,
+# atribui valores), só os blocos alterados são copiados, e o estado resultante
+# vira uma nova versão. Voltar a qualquer versão (inclusive a original) só troca
+# a referência do `df` no escopo, sem reler o arquivo nem copiar dados. As
+# versões antigas são descartadas quando a memória exclusiva delas passa do limite.
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+MAX_VERSOES = int(os.getenv("EDA_VERSOES_MAX", "20"))
+# Memória das versões além da original (só os blocos que não são compartilhados com ela)
+MAX_MB_VERSOES = int(os.getenv("EDA_VERSOES_MAX_MB", "1024"))
+
+
+def ativar_copia_na_escrita():
+    """
+    Ativa a cópia na escrita (copy-on-write) do pandas no processo. Com ela, cada sessão
+    recebe uma cópia rasa do DataFrame compartilhado e pode alterá-la sem copiar o dataset
+    inteiro, e as versões do `df` compartilham os blocos não alterados. A partir do pandas
+    3.0 ela é sempre ativa; no 2.x é opcional e muda a semântica do pandas no processo
+    inteiro, então é ativada só na inicialização da aplicação, do batch e dos trabalhadores.
+    """
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+
+
+def _endereco(array: np.ndarray):
+    return array.__array_interface__["data"][0], array.nbytes
+
+
+def _buffers_array(valores):
+    """Endereços e tamanhos dos buffers de um array do pandas, sem copiá-lo."""
+    if isinstance(valores, pd.arrays.ArrowExtensionArray):
+        for pedaco in valores.__arrow_array__().chunks:
+            for buffer in pedaco.buffers():
+                if buffer is not None:
+                    yield buffer.address, buffer.size
+    elif isinstance(valores, pd.Categorical):
+        yield _endereco(valores.codes)
+    elif isinstance(valores, pd.arrays.IntervalArray):
+        for limites in (valores.left, valores.right):
+            yield from _buffers_array(limites.array)
+    elif hasattr(valores, "asi8"):
+        # Datas (inclusive com fuso horário), intervalos de tempo e períodos
+        yield _endereco(valores.asi8)
+    elif isinstance(valores, pd.arrays.NumpyExtensionArray) or isinstance(valores.dtype, np.dtype):
+        # Arrays NumPy: visão do bloco, então o endereço identifica a memória compartilhada
+        yield _endereco(np.asarray(valores))
+    else:
+        # Inteiros, decimais e booleanos com máscara (`Int64`, `Float32`, `boolean`...)
+        internos = [getattr(valores, nome, None) for nome in ("_data", "_mask")]
+        if all(isinstance(interno, np.ndarray) for interno in internos):
+            for interno in internos:
+                yield _endereco(interno)
+        else:
+            yield ("id", id(valores)), valores.nbytes
+
+
+def _buffers(df: pd.DataFrame) -> dict:
+    """Buffers das colunas e do índice do DataFrame: {identificador: bytes}."""
+    buffers = {}
+    for _, serie in df.items():
+        buffers.update(_buffers_array(serie.array))
+    if not isinstance(df.index, pd.RangeIndex):
+        buffers.update(_buffers_array(df.index.array))
+    return buffers
+
+
+def _assinatura(df: pd.DataFrame, buffers: dict) -> tuple:
+    """Muda quando o `df` é alterado: sob cópia na escrita, dados alterados ocupam buffers novos."""
+    # Um RangeIndex não tem buffer: o que o identifica é o intervalo (ex: `df.index + 100`, invertido)
+    indice = df.index
+    intervalo = (indice.start, indice.stop, indice.step) if isinstance(indice, pd.RangeIndex) else None
+    return tuple(df.columns), df.shape, tuple(buffers), intervalo, tuple(indice.names)
+
+
+class _Versao:
+    def __init__(self, numero: int, df: pd.DataFrame, origem, descricao: str):
+        self.numero = numero
+        self.df = df
+        self.origem = origem
+        self.descricao = descricao
+        self.buffers = _buffers(df)
+        self.assinatura = _assinatura(df, self.buffers)
+
+
+class VersoesDataset:
+    """
+    Histórico de versões do `df` de um escopo de execução.
+
+    A versão 0 é o dataset original e nunca é descartada. Cada versão guarda uma
+    cópia rasa do DataFrame; com a cópia na escrita do pandas, a cópia rasa não
+    duplica dados e não é afetada por alterações posteriores no `df` do escopo.
+
+    Args:
+        df: O dataset original (versão 0).
+        max_versoes: Número máximo de versões guardadas, incluindo a original.
+        max_mb: Memória máxima das versões além da original; as mais antigas são descartadas.
+    """
+
+    def __init__(self, df: pd.DataFrame, max_versoes: int = MAX_VERSOES, max_mb: int = MAX_MB_VERSOES):
+        self.max_versoes = max(max_versoes, 2)
+        self.max_bytes = max_mb * 1024 ** 2
+        self._versoes = {0: _Versao(0, df, None, "dados originais")}
+        self._proximo_numero = 1
+        self.atual = 0
+        self._lock = threading.Lock()
+
+    def visao(self, versao: int = None) -> pd.DataFrame:
+        """Visão de uma versão (por padrão, a atual) para o escopo; alterações nela não afetam a versão."""
+        with self._lock:
+            return self._obter(self.atual if versao is None else versao).df.copy(deep=False)
+
+    def _obter(self, versao: int) -> _Versao:
+        if versao not in self._versoes:
+            raise ValueError(f"A versão {versao} do `df` não existe ou foi descartada para liberar memória.")
+        return self._versoes[versao]
+
+    def registrar(self, df, descricao: str = "") -> bool:
+        """
+        Registra o `df` do escopo após uma execução. Se ele mudou em relação à versão atual,
+        cria uma nova versão (sem copiar dados) e retorna True.
+        """
+        if not isinstance(df, pd.DataFrame):
+            return False
+        buffers = _buffers(df)
+        with self._lock:
+            if _assinatura(df, buffers) == self._versoes[self.atual].assinatura:
+                return False
+            versao = _Versao(self._proximo_numero, df.copy(deep=False), self.atual, descricao)
+            self._versoes[versao.numero] = versao
+            self._proximo_numero += 1
+            self.atual = versao.numero
+            self._descartar_excedentes()
+            return True
+
+    def restaurar(self, versao: int) -> pd.DataFrame:
+        """Torna `versao` a versão atual e retorna a visão dela para o escopo. Não copia dados."""
+        with self._lock:
+            escolhida = self._obter(versao)
+            self.atual = escolhida.numero
+            return escolhida.df.copy(deep=False)
+
+    def desfazer(self) -> pd.DataFrame:
+        """Volta à versão de onde a atual foi derivada (a ancestral mais próxima ainda guardada)."""
+        with self._lock:
+            if self.atual == 0:
+                raise ValueError("O `df` já está na versão original; não há alteração para desfazer.")
+            origem = self._versoes[self.atual].origem
+            self.atual = origem
+            return self._versoes[origem].df.copy(deep=False)
+
+    def _bytes_exclusivos(self, versoes) -> dict:
+        """Bytes de cada versão que não são compartilhados com a original nem com versões anteriores."""
+        vistos = dict(self._versoes[0].buffers)
+        exclusivos = {}
+        for versao in versoes:
+            novos = {chave: tamanho for chave, tamanho in versao.buffers.items() if chave not in vistos}
+            exclusivos[versao.numero] = sum(novos.values())
+            vistos.update(novos)
+        return exclusivos
+
+    def _descartar_excedentes(self):
+        """Descarta as versões mais antigas (exceto a original e a atual) acima dos limites."""
+        while True:
+            antigas = [self._versoes[n] for n in sorted(self._versoes) if n != 0]
+            total = sum(self._bytes_exclusivos(antigas).values())
+            if len(self._versoes) <= self.max_versoes and total <= self.max_bytes:
+                return
+            candidatas = [versao for versao in antigas if versao.numero != self.atual]
+            if not candidatas:
+                return
+            descartada = self._versoes.pop(candidatas[0].numero)
+            # As versões derivadas da descartada passam a derivar da origem dela
+            for versao in self._versoes.values():
+                if versao.origem == descartada.numero:
+                    versao.origem = descartada.origem
+
+    def resumo(self) -> dict:
+        """Versão atual, versões guardadas e a memória além da original (serializável, para a interface)."""
+        with self._lock:
+            versoes = [self._versoes[n] for n in sorted(self._versoes)]
+            exclusivos = self._bytes_exclusivos(versoes[1:])
+            return {
+                "atual": self.atual,
+                "mb_extra": sum(exclusivos.values()) / 1024 ** 2,
+                "versoes": [
+                    {
+                        "versao": versao.numero,
+                        "origem": versao.origem,
+                        "descricao": versao.descricao,
+                        "linhas": versao.df.shape[0],
+                        "colunas": versao.df.shape[1],
+                        "mb_exclusivos": exclusivos.get(versao.numero, 0) / 1024 ** 2,
+                    }
+                    for versao in versoes
+                ],
+            }
+
+
+def descrever_alteracao(codigo: str, limite: int = 80) -> str:
+    """Descrição curta de uma versão: a primeira linha do código que a gerou."""
+    linhas = [linha.strip() for linha in codigo.splitlines()
+              if linha.strip() and not linha.strip().startswith(("#", "import ", "from "))]
+    descricao = linhas[0] if linhas else codigo.strip()
+    if len(linhas) > 1:
+        descricao += " ..."
+    return descricao if len(descricao) <= limite else descricao[:limite - 3] + "..."
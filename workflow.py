@@ -1,25 +1,128 @@
 # workflow.py
 
-# Importa as bibliotecas e módulos necessários
+# Importa as bibliotecas e módulos necessários.
+# As integrações dos provedores (Gemini, OpenAI, Groq, Anthropic) são importadas
+# apenas em `_get_llm_instance`, quando o provedor é de fato escolhido.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
 import pandas as pd
-from langchain import hub
 from langchain.agents import AgentExecutor, create_react_agent
-# from langchain_core.agents import AgentFinish # Correção: Importado de 'langchain_core'
-# from langchain.schema import OutputParserException
-from langchain_google_genai import ChatGoogleGenerativeAI # Correção: 'GenerativeAI'
-from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
-import os
-from langchain_anthropic import ChatAnthropic
+from langchain_core.prompts import PromptTemplate
 
 # Importa as ferramentas personalizadas do nosso módulo
 from tools.custom_tools import criar_ferramentas_analise
+from tools.execution_context import ContextoExecucao
+from profiling import obter_perfil, resumo_para_prompt
+from tools.sql_engine import NOME_TABELA
+from tools.sampling import descrever_amostra
+from llm_cache import envolver_com_cache, cache_llm_habilitado
+from llm_limits import limitar_concorrencia
+from llm_gateway import (TIMEOUT_S, chave_ambiente, cliente_http, envolver_com_gateway, provedor_alternativo,
+                         url_base)
+
+# Prompt ReAct do agente, montado localmente. O perfil do dataset entra como variável parcial;
+# `modo_analise` é informado a cada pergunta (ver `instrucoes_modo_analise`).
+PROMPT_REACT = PromptTemplate.from_template("""
+Você é um analista de dados experiente e domina a linguagem de programação Python. Sua tarefa é responder à pergunta do usuário sobre um conjunto de dados. Seu pensamento e sua resposta final devem ser sempre em português.
+
+**REGRAS IMPORTANTES:**
+1.  Para perguntas sobre os dados, **SEMPRE** use as ferramentas para inspecionar o dataframe `df`. NÃO tente responder com base no seu conhecimento prévio.
+    - O perfil do dataset abaixo já foi calculado. NÃO gaste passos com `df.info()`, `df.describe()`, `df.shape` ou contagem de classes: use o perfil.
+    - Para detalhes do perfil (estatísticas por coluna, médias por classe, correlações), use `consultar_perfil_dataset`, que responde instantaneamente.
+    - Use `python_code_executor` para cálculos que o perfil não cobre e para gerar gráficos.
+2.  Se a pergunta do usuário não for sobre os dados (ex: uma saudação como "oi"), responda diretamente sem usar ferramentas, usando o formato "Final Answer".
+3.  O DataFrame pandas com os dados já está carregado e disponível na variável `df`.
+4.  O código que você escreve para a ferramenta DEVE usar `print()` para que o resultado seja visível.
+    - Saídas longas são truncadas. Imprima resultados agregados (ex: `value_counts().head(10)`, `describe()` de poucas colunas) em vez de tabelas inteiras.
+5.  Você tem um limite de 5 passos (Pensamento/Ação). Se você não conseguir a resposta final em 5 passos, resuma suas descobertas na "Final Answer".
+
+6.  **PARA GERAR GRÁFICOS:**
+    - Use a biblioteca `matplotlib.pyplot` (disponível como `plt`) ou `seaborn` (disponível como `sns`).
+    - Os gráficos são capturados automaticamente em memória. Para dar um nome descritivo, use `plt.savefig('nome_do_grafico.png')` (sem pasta).
+    - **NUNCA** use `plt.show()`, pois isso causará um erro no ambiente de execução.
+    - Em datasets grandes (dezenas de milhares de linhas ou mais), NÃO desenhe ponto a ponto com `sns.scatterplot`, `sns.pairplot` ou `sns.kdeplot`. Use os auxiliares disponíveis:
+      `histograma(df['coluna'])` (contagens pré-agrupadas de todos os dados), `dispersao(df, 'x', 'y')` (hexbin de densidade; com `hue='Class'` usa uma amostra estratificada) e `amostrar(df, coluna_estrato='Class')` (informa a fração usada).
+    - A observação informa o nome de cada gráfico gerado. Inclua a tag especial `[CHART_PATH:nome_do_grafico.png]` na sua "Final Answer" para que o gráfico possa ser exibido. Exemplo: `Final Answer: Aqui está o gráfico de barras solicitado. [CHART_PATH:fraudes_por_classe.png]`
+{instrucoes_sql}{modo_analise}
+
+**PERFIL DO DATASET (pré-calculado):**
+{perfil_dataset}
+
+Ferramentas disponíveis:
+{tools}
+
+Use o seguinte formato. As palavras-chave do formato (Question, Thought, Action, Action Input, Final Answer) DEVEM ser em inglês:
+
+Question: a pergunta de entrada que você deve responder
+Thought: você deve sempre pensar sobre o que fazer. O seu pensamento deve ser em português.
+Action: a ação a ser tomada, deve ser uma das [{tool_names}]
+Action Input: o código Python puro para a ação. **IMPORTANTE**: NÃO inclua formatação de markdown como ```python ou ```.
+Observation: o resultado da ação
+... (este Thought/Action/Action Input/Observation pode se repetir N vezes)
+Thought: Agora eu sei a resposta final.
+Final Answer: a resposta final para a pergunta original, em português.
+
+Comece!
+
+Histórico do Chat:
+{chat_history}
+
+Question: {input}
+Thought:{agent_scratchpad}
+""")
+
+# Regra do prompt incluída quando a ferramenta `consultar_sql` (DuckDB) está disponível
+INSTRUCOES_SQL = """
+7.  **CONSULTAS SQL (DuckDB):** a ferramenta `consultar_sql` executa SQL sobre a tabela `{tabela}`, que contém o dataset completo, em várias threads e sem carregar tudo na memória.
+    - Prefira `consultar_sql` para contagens, somas, médias, percentis, filtros e GROUP BY. Exemplo: `SELECT Class, count(*) AS n, avg(Amount) AS media FROM {tabela} GROUP BY Class`
+    - Use o pandas (`df`) para resultados pequenos e para gráficos. No `python_code_executor`, `sql('SELECT ...')` retorna o resultado de uma consulta como DataFrame (ex: para plotar uma agregação).
+"""
+AVISO_AMOSTRA = """    - ATENÇÃO: `df` é uma amostra de {linhas} de {total} linhas (e o perfil acima também). Totais, contagens e médias exatas DEVEM vir de `consultar_sql`.
+"""
+
+# Regra do prompt incluída nas perguntas feitas no modo aproximado
+INSTRUCOES_MODO_APROXIMADO = """
+8.  **MODO APROXIMADO ATIVO:** `df_sample` é uma {descricao}, com a proporção de `{coluna}` preservada. Responda rapidamente usando a amostra:
+    - Em todo o código, use `df_sample` no lugar de `df`. Gráficos também devem usar `df_sample`.
+    - Para médias, proporções, totais e contagens, use `print(estimar(df_sample['coluna']))` (ou `estatistica='proporcao'`, `'total'`, `'contagem'`), que informa o intervalo de confiança. Totais e contagens da amostra NÃO são os do dataset: extrapole com `estimar`.
+    - Na "Final Answer", deixe claro que os valores são aproximados e cite a fração amostral. O mesmo código será reexecutado depois sobre todos os dados para atualizar a resposta.
+"""
+
+# Caches de clientes LLM e de agentes montados, compartilhados entre as sessões
+MAX_ITENS_CACHE = 32
+_cache_llms = OrderedDict()
+_cache_agentes = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _hash_chave(api_key: str) -> str:
+    """Resumo da chave de API, para usá-la em chaves de cache sem guardá-la em claro."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+def _obter_do_cache(cache: OrderedDict, chave):
+    with _cache_lock:
+        valor = cache.get(chave)
+        if valor is not None:
+            cache.move_to_end(chave)
+        return valor
+
+def _guardar_no_cache(cache: OrderedDict, chave, valor):
+    with _cache_lock:
+        cache[chave] = valor
+        cache.move_to_end(chave)
+        while len(cache) > MAX_ITENS_CACHE:
+            cache.popitem(last=False)
 
 def _get_llm_instance(llm_provider: str, api_key: str, model_name: str):
     """
     Função fábrica para instanciar e retornar o modelo de linguagem (LLM) correto.
+    Os clientes não fazem retentativas próprias (ver llm_gateway.py) e, quando o SDK
+    permite, usam o pool HTTP compartilhado do provedor.
     """
     if llm_provider == "Gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
         try:
             from google.generativeai.types import HarmCategory, HarmBlockThreshold
             safety_settings = { HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE }
@@ -31,7 +134,9 @@ def _get_llm_instance(llm_provider: str, api_key: str, model_name: str):
             google_api_key=api_key,
             temperature=0,
             convert_system_message_to_human=True,
-            safety_settings=safety_settings
+            safety_settings=safety_settings,
+            max_retries=1,
+            timeout=TIMEOUT_S
         )
     
     elif llm_provider == "LLM de Teste (Gemini)":
@@ -41,6 +146,7 @@ def _get_llm_instance(llm_provider: str, api_key: str, model_name: str):
             # Levanta uma exceção que será capturada na função principal
             raise ValueError("As variáveis TEST_GEMINI_API_KEY e TEST_GEMINI_MODEL_NAME não foram encontradas.")
         
+        from langchain_google_genai import ChatGoogleGenerativeAI
         try:
             from google.generativeai.types import HarmCategory, HarmBlockThreshold
             safety_settings = { HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE }
@@ -52,22 +158,77 @@ def _get_llm_instance(llm_provider: str, api_key: str, model_name: str):
             google_api_key=test_api_key,
             temperature=0,
             convert_system_message_to_human=True,
-            safety_settings=safety_settings
+            safety_settings=safety_settings,
+            max_retries=1,
+            timeout=TIMEOUT_S
         )
 
     elif llm_provider == "OpenAI":
-        return ChatOpenAI(model=model_name, openai_api_key=api_key, temperature=0)
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model_name, openai_api_key=api_key, temperature=0, max_retries=0,
+                          request_timeout=TIMEOUT_S, openai_api_base=url_base(llm_provider),
+                          http_client=cliente_http(llm_provider))
     
     elif llm_provider == "Groq":
-        return ChatGroq(model_name=model_name, groq_api_key=api_key, temperature=0)
+        from langchain_groq import ChatGroq
+        return ChatGroq(model_name=model_name, groq_api_key=api_key, temperature=0, max_retries=0,
+                        request_timeout=TIMEOUT_S, groq_api_base=url_base(llm_provider),
+                        http_client=cliente_http(llm_provider))
     
     elif llm_provider == "Anthropic":
-        return ChatAnthropic(model=model_name, anthropic_api_key=api_key, temperature=0)
+        from langchain_anthropic import ChatAnthropic
+        return ChatAnthropic(model=model_name, anthropic_api_key=api_key, temperature=0, max_retries=0,
+                             default_request_timeout=TIMEOUT_S,
+                             **({"anthropic_api_url": url_base(llm_provider)} if url_base(llm_provider) else {}))
     
     else:
         raise ValueError(f"Provedor de LLM desconhecido: {llm_provider}")
 
-def criar_fluxo_agente(df: pd.DataFrame, llm_provider: str, api_key: str, model_name: str):
+def _obter_cliente_limitado(llm_provider: str, api_key: str, model_name: str):
+    """Cliente do provedor (reaproveitado para a mesma chave) com o limite de chamadas simultâneas."""
+    chave_llm = (llm_provider, model_name, _hash_chave(api_key))
+    llm = _obter_do_cache(_cache_llms, chave_llm)
+    if llm is None:
+        llm = _get_llm_instance(llm_provider, api_key, model_name)
+        _guardar_no_cache(_cache_llms, chave_llm, llm)
+    # Limite de chamadas simultâneas ao provedor (EDA_LLM_LIMITES), abaixo do cache
+    return limitar_concorrencia(llm, llm_provider)
+
+def obter_llm(llm_provider: str, api_key: str, model_name: str, dataset_hash: str = None):
+    """
+    Retorna o LLM do provedor e modelo escolhidos, reaproveitando o cliente já criado
+    para a mesma chave de API. As chamadas passam pela camada de resiliência (limite de
+    taxa, retentativas e o alternativo de EDA_LLM_FALLBACK), e as respostas, pelo cache
+    persistente do LLM, separado por dataset. Levanta exceção se o provedor não puder
+    ser instanciado.
+    """
+    llm = _obter_cliente_limitado(llm_provider, api_key, model_name)
+    alternativo, provedor_alt, chave_alt = None, "", ""
+    configurado = provedor_alternativo(llm_provider)
+    if configurado is not None:
+        provedor_alt, modelo_alt = configurado
+        chave_alt = api_key if provedor_alt == llm_provider else chave_ambiente(provedor_alt)
+        try:
+            alternativo = _obter_cliente_limitado(provedor_alt, chave_alt, modelo_alt or model_name)
+        except Exception as e:
+            print(f"AVISO: o LLM alternativo {provedor_alt} não pôde ser criado e será ignorado: {e}")
+    llm = envolver_com_gateway(llm, llm_provider, _hash_chave(api_key), alternativo, provedor_alt,
+                               _hash_chave(chave_alt))
+    if cache_llm_habilitado():
+        llm = envolver_com_cache(llm, llm_provider, dataset_hash)
+    return llm
+
+def instrucoes_modo_analise(contexto: ContextoExecucao, modo_aproximado: bool) -> str:
+    """Texto da variável `modo_analise` do prompt: as regras do modo aproximado, quando ativo e útil."""
+    if not modo_aproximado or contexto is None or not contexto.amostra_parcial:
+        return ""
+    coluna = (contexto.perfil or {}).get("coluna_alvo") or "todas as classes"
+    return INSTRUCOES_MODO_APROXIMADO.format(
+        descricao=descrever_amostra(contexto.amostra, contexto.linhas_dataset), coluna=coluna
+    )
+
+def criar_fluxo_agente(df: pd.DataFrame, llm_provider: str, api_key: str, model_name: str, dataset_hash: str = None,
+                       contexto: ContextoExecucao = None):
     """
     Cria e compila o workflow do agente ReAct para análise de dados.
 
@@ -76,14 +237,17 @@ def criar_fluxo_agente(df: pd.DataFrame, llm_provider: str, api_key: str, model_
         llm_provider: O provedor de LLM selecionado (Gemini, OpenAI, Groq, Anthropic).
         api_key: A chave de API para o provedor selecionado.
         model_name: O nome do modelo a ser usado.
+        dataset_hash: Hash do conteúdo do dataset, usado para reaproveitar o perfil já calculado.
+        contexto: Contexto de execução a ser usado pelas ferramentas. Se omitido, o agente
+            recebe um contexto novo e isolado (um por sessão).
 
     Returns:
         Um AgentExecutor configurado e pronto para ser usado, ou uma exceção em caso de erro.
     """
-    # 1. Instância do modelo de linguagem com base na seleção do usuário
+    # 1. Instância do modelo de linguagem com base na seleção do usuário (reaproveitada entre sessões)
     llm = None
     try:
-        llm = _get_llm_instance(llm_provider, api_key, model_name)
+        llm = obter_llm(llm_provider, api_key, model_name, dataset_hash)
     except Exception as e:
         # Imprime o erro completo no console para depuração
         print(f"ERRO ao instanciar o LLM: {e}")
@@ -92,53 +256,31 @@ def criar_fluxo_agente(df: pd.DataFrame, llm_provider: str, api_key: str, model_
             return f"Erro de configuração: {e}"
         return "Falha ao criar o agente. Verifique se sua chave de API e o nome do modelo estão corretos e válidos."
 
-    # 2. Cria a lista de ferramentas que o agente pode usar
-    ferramentas = criar_ferramentas_analise(df)
+    # 2. Calcula (ou recupera do cache) o perfil do dataset e cria as ferramentas do agente
+    perfil = obter_perfil(df, dataset_hash)
+    if contexto is not None and contexto.perfil is None:
+        contexto.perfil = perfil
+    ferramentas = criar_ferramentas_analise(df, perfil, dataset_hash, contexto)
 
-    # 3. Puxa o prompt base para um agente ReAct que funciona com chat
-    prompt = hub.pull("hwchase17/react-chat")
-
-    # 4. Adiciona instruções específicas ao prompt para o nosso caso de uso
-    prompt.template = """
-Você é um analista de dados experiente e domina a linguagem de programação Python. Sua tarefa é responder à pergunta do usuário sobre um conjunto de dados. Seu pensamento e sua resposta final devem ser sempre em português.
-
-**REGRAS IMPORTANTES:**
-1.  Para perguntas sobre os dados, **SEMPRE** use a ferramenta `python_code_executor` para inspecionar o dataframe `df`. NÃO tente responder com base no seu conhecimento prévio.
-2.  Se a pergunta do usuário não for sobre os dados (ex: uma saudação como "oi"), responda diretamente sem usar ferramentas, usando o formato "Final Answer".
-3.  O DataFrame pandas com os dados já está carregado e disponível na variável `df`.
-4.  O código que você escreve para a ferramenta DEVE usar `print()` para que o resultado seja visível.
-5.  Você tem um limite de 5 passos (Pensamento/Ação). Se você não conseguir a resposta final em 5 passos, resuma suas descobertas na "Final Answer".
-
-6.  **PARA GERAR GRÁFICOS:**
-    - Use a biblioteca `matplotlib.pyplot` (disponível como `plt`) ou `seaborn` (disponível como `sns`).
-    - **SEMPRE** salve o gráfico em um arquivo na pasta `temp_charts/` usando `plt.savefig('temp_charts/nome_do_grafico.png')`. Use um nome de arquivo único e descritivo.
-    - **NUNCA** use `plt.show()`, pois isso causará um erro no ambiente de execução.
-    - Após salvar, inclua a tag especial `[CHART_PATH:caminho/do/arquivo.png]` na sua "Final Answer" para que o gráfico possa ser exibido. Exemplo: `Final Answer: Aqui está o gráfico de barras solicitado. [CHART_PATH:temp_charts/fraudes_por_classe.png]`
-
-Use o seguinte formato. As palavras-chave do formato (Question, Thought, Action, Action Input, Final Answer) DEVEM ser em inglês:
-
-Question: a pergunta de entrada que você deve responder
-Thought: você deve sempre pensar sobre o que fazer. O seu pensamento deve ser em português.
-Action: a ação a ser tomada, deve ser uma das [{tool_names}]
-Action Input: o código Python puro para a ação. **IMPORTANTE**: NÃO inclua formatação de markdown como ```python ou ```.
-Observation: o resultado da ação
-... (este Thought/Action/Action Input/Observation pode se repetir N vezes)
-Thought: Agora eu sei a resposta final.
-Final Answer: a resposta final para a pergunta original, em português.
-
-Comece!
-
-Histórico do Chat:
-{chat_history}
-
-Question: {input}
-Thought:{agent_scratchpad}
-"""
+    # 3. Monta o prompt localmente (sem baixar do LangChain Hub) com o perfil do dataset.
+    # Com o motor SQL disponível, o prompt direciona as agregações para ele.
+    instrucoes_sql = ""
+    if any(ferramenta.name == "consultar_sql" for ferramenta in ferramentas):
+        instrucoes_sql = INSTRUCOES_SQL.format(tabela=NOME_TABELA)
+        if contexto is not None and contexto.total_linhas_fonte and contexto.total_linhas_fonte > len(df):
+            instrucoes_sql += AVISO_AMOSTRA.format(linhas=f"{len(df):,}", total=f"{contexto.total_linhas_fonte:,}")
+    prompt = PROMPT_REACT.partial(perfil_dataset=resumo_para_prompt(perfil), instrucoes_sql=instrucoes_sql)
 
-    # 5. Cria o agente ReAct
-    agente = create_react_agent(llm, ferramentas, prompt)
+    # 4. Cria o agente ReAct, reaproveitando o já montado para o mesmo provedor, modelo e dataset.
+    # O AgentExecutor é sempre novo, pois as ferramentas estão ligadas ao contexto desta sessão.
+    chave_agente = (llm_provider, model_name, _hash_chave(api_key), dataset_hash)
+    agente = _obter_do_cache(_cache_agentes, chave_agente) if dataset_hash is not None else None
+    if agente is None:
+        agente = create_react_agent(llm, ferramentas, prompt)
+        if dataset_hash is not None:
+            _guardar_no_cache(_cache_agentes, chave_agente, agente)
 
-    # 6. Cria o Executor do Agente
+    # 5. Cria o Executor do Agente
     agente_executor = AgentExecutor(
         agent=agente,
         tools=ferramentas,